@@ -1,9 +1,10 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import mongoengine
-from services.logging_service import log_request_performance, logging_service
+from services.logging_service import logging_service, init_app as init_request_logging
+from services import metrics, db_profiler, tracing, stack_sampler
 
 # Load environment variables
 load_dotenv()
@@ -32,6 +33,21 @@ def create_app(config_name=None):
 	# Initialize extensions with app
 	db.connect(host=app.config['MONGODB_SETTINGS']['host'])
 	CORS(app)
+	metrics.init_app(app)
+	db_profiler.init_app(app)
+	tracing.init_app(app)
+	stack_sampler.init_app(app)
+	init_request_logging(app)
+	
+	# Rebuild fraud scoring state from recent transactions
+	if app.config.get('RISK_WARMUP_ENABLED', True):
+		from services.risk_engine import risk_engine
+		risk_engine.warm_up()
+	
+	# Periodically realign credit ledgers with card balances
+	if app.config.get('LEDGER_RECONCILE_ENABLED', True):
+		from services.credit_ledger import credit_ledger
+		credit_ledger.start_reconciler()
 	
 	# Register blueprints
 	from routes.users import users_bp
@@ -44,6 +60,7 @@ def create_app(config_name=None):
 	from routes.emis import emis_bp
 	from routes.cibil_scores import cibil_scores_bp
 	from routes.notifications import notifications_bp
+	from routes.audit import audit_bp
 	
 	app.register_blueprint(users_bp, url_prefix='/api/users')
 	app.register_blueprint(products_bp, url_prefix='/api/products')
@@ -55,21 +72,33 @@ def create_app(config_name=None):
 	app.register_blueprint(emis_bp, url_prefix='/api/emis')
 	app.register_blueprint(cibil_scores_bp, url_prefix='/api/cibil')
 	app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
+	app.register_blueprint(audit_bp, url_prefix='/api/audit')
 	
 	# Health check endpoint
 	@app.route('/health')
-	@log_request_performance
 	def health_check():
 		try:
 			# Test MongoDB connection
 			from mongoengine import get_connection
 			connection = get_connection()
 			connection.admin.command('ping')
-			return {'status': 'healthy', 'message': 'Flask backend with MongoDB is running', 'database': 'connected'}, 200
+			from services.password_hashing import password_hasher
+			return {
+				'status': 'healthy',
+				'message': 'Flask backend with MongoDB is running',
+				'database': 'connected',
+				'password_hashing': password_hasher.get_metrics(),
+				'logging': logging_service.get_stats()
+			}, 200
 		except Exception as e:
 			logging_service.log_error('HealthCheck', str(e))
 			return {'status': 'unhealthy', 'message': 'MongoDB connection failed', 'error': str(e)}, 500
 	
+	# Prometheus metrics endpoint
+	@app.route('/metrics')
+	def metrics_endpoint():
+		return Response(metrics.request_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+	
 	# Error handlers
 	@app.errorhandler(404)
 	def not_found(error):
@@ -10,6 +10,9 @@ from .bill import Bill
 from .emi import EMI
 from .cibil_score import CibilScore
 from .notification import Notification
+from .migration_checkpoint import MigrationCheckpoint
+from .credit_ledger import CreditLedger
+from .card_daily_rollup import CardDailyRollup
 
 # Export all models
-__all__ = ['User', 'Product', 'Order', 'OrderItem', 'Card', 'Transaction', 'Bill', 'EMI', 'CibilScore', 'Notification']
+__all__ = ['User', 'Product', 'Order', 'OrderItem', 'Card', 'Transaction', 'Bill', 'EMI', 'CibilScore', 'Notification', 'MigrationCheckpoint', 'CreditLedger', 'CardDailyRollup']
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
 
 class Bill(Document):
     """Bill model for managing bill payments"""
@@ -134,14 +135,15 @@ class Bill(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('Bill.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert bill to dictionary for JSON serialization"""
         return {
             'id': str(self.id),
             'user_id': str(self.user_id) if self.user_id else None,
-            'card_id': str(self.card_id) if self.card_id else None,
+            'card_id': str(getattr(self.card_id, 'id', self.card_id)) if self.card_id else None,
             'bill_id': self.bill_id,
             'biller_name': self.biller_name,
             'biller_category': self.biller_category,
@@ -2,9 +2,12 @@
 from datetime import datetime
 from mongoengine import (
     Document, StringField, FloatField, BooleanField, DateTimeField,
-    ReferenceField, IntField, ListField
+    ReferenceField, IntField
 )
 from services.encryption import encryption_service
+from services.tracing import span, traced
+from bson import ObjectId
+from pymongo import ReturnDocument
 import uuid
 
 class Card(Document):
@@ -18,11 +21,13 @@ class Card(Document):
     card_name = StringField(required=True, max_length=100)
     card_holder_name = StringField(required=True, max_length=100)
     card_number = StringField(required=True, max_length=256)  # Store encrypted card number
+    card_number_index = StringField(max_length=64)  # Keyed HMAC of card number for lookups
     card_type = StringField(required=True, max_length=50)  # visa, mastercard, amex, rupay
     card_brand = StringField(required=True, max_length=100)  # Visa Platinum, etc.
     expiry_month = IntField(required=True, min_value=1, max_value=12)
     expiry_year = IntField(required=True, min_value=2024)
     cvv = StringField(required=True, max_length=256)  # Store encrypted CVV
+    key_version = IntField(default=1)  # Encryption key version for card_number and cvv
     pin_hash = StringField(max_length=256)  # Store hashed PIN
     secret = StringField(max_length=16)  # Masked or last 4 digits
 
@@ -41,28 +46,46 @@ class Card(Document):
     updated_at = DateTimeField(default=datetime.utcnow)
     last_used = DateTimeField()
 
-    # Relationships
-    transactions = ListField(ReferenceField('Transaction'))
-    emis = ListField(ReferenceField('EMI'))
+    # Transactions and EMIs reference their card through their indexed card_id
 
     meta = {
         'collection': 'cards',
+        # Cards still carrying the dropped transactions/emis arrays load until migrated
+        'strict': False,
         'indexes': [
             'user_id',
             'card_id',
-            'card_number',
+            {'fields': ['card_number_index'], 'unique': True, 'sparse': True},
             'card_brand',
             'is_blocked',
             'is_active'
         ]
     }
 
+    @classmethod
+    def get_summary(cls, **query):
+        """Balance, status and limits of one card, read with a projection
+
+        Raises Card.DoesNotExist when no card matches.
+        """
+        with span('Card.get_summary'):
+            document = cls.objects(**query).only(*CardSummary.FIELDS).as_pymongo().first()
+        if document is None:
+            raise cls.DoesNotExist('Card matching query does not exist.')
+        return CardSummary(document)
+
+    @classmethod
+    def summaries(cls, **query):
+        """Lightweight views of all matching cards"""
+        return [CardSummary(document) for document in cls.objects(**query).only(*CardSummary.FIELDS).as_pymongo()]
+
     @classmethod
     def create_card(cls, user_id, card_number, card_holder_name, expiry_month, 
                    expiry_year, cvv, card_type, card_brand, card_name, 
                    credit_limit, due_date=None):
         """Create a new credit card with encryption"""
         card = cls()
+        card.id = ObjectId()  # Assigned up front so ciphertexts can be bound to it
         card.user_id = user_id
         card.card_id = f"CARD_{uuid.uuid4().hex[:12].upper()}"
         card.card_name = card_name
@@ -80,14 +103,44 @@ class Card(Document):
         card.is_blocked = False
         
         # Encrypt sensitive data
-        card.card_number = encryption_service.encrypt_card_number(card_number)
-        card.cvv = encryption_service.encrypt_cvv(cvv)
+        card.card_number = encryption_service.encrypt_card_number(card_number, associated_data=card.id)
+        card.card_number_index = encryption_service.compute_blind_index(card_number)
+        card.cvv = encryption_service.encrypt_cvv(cvv, associated_data=card.id)
+        card.key_version = encryption_service.active_key_version
         
         # Store last 4 digits for display
         card.secret = card_number[-4:] if len(card_number) >= 4 else "****"
         
         return card
 
+    @classmethod
+    def is_card_number_registered(cls, card_number):
+        """Check if a card number is already registered (single indexed lookup)"""
+        card_number_index = encryption_service.compute_blind_index(card_number)
+        return cls.objects(card_number_index=card_number_index).only('id').first() is not None
+
+    def get_card_number(self):
+        """Decrypt the card number, upgrading legacy ciphertext on read"""
+        card_number = encryption_service.decrypt_card_number(self.card_number, associated_data=self.id)
+        self._upgrade_ciphertext('card_number')
+        return card_number
+
+    def get_cvv(self):
+        """Decrypt the CVV, upgrading legacy ciphertext on read"""
+        cvv = encryption_service.decrypt_cvv(self.cvv, associated_data=self.id)
+        self._upgrade_ciphertext('cvv')
+        return cvv
+
+    def _upgrade_ciphertext(self, field):
+        """Rewrite a legacy ciphertext field in the compact v2 format"""
+        value = getattr(self, field)
+        if self.id is None or not encryption_service.is_legacy_ciphertext(value):
+            return
+        upgraded = encryption_service.upgrade_ciphertext(value)
+        # Conditional update so a concurrent re-key is never overwritten
+        Card.objects(id=self.id, **{field: value}).update_one(**{f'set__{field}': upgraded})
+        setattr(self, field, upgraded)
+
     def mask_number(self):
         """Return masked card number for display (last 4 digits)"""
         if self.secret:
@@ -123,24 +176,77 @@ class Card(Document):
         from werkzeug.security import check_password_hash
         return check_password_hash(self.pin_hash, pin)
 
-    def update_balance(self, amount, transaction_type='debit'):
-        """Update card balance after transaction"""
+    # Fields maintained by the atomic balance updates
+    BALANCE_FIELDS = ('outstanding_balance', 'available_credit', 'minimum_payment', 'updated_at', 'last_used')
+
+    @classmethod
+    def apply_balance_change(cls, card_id, amount, transaction_type='debit', require_credit=False,
+                             require_active=False, touch=False):
+        """Atomically change a card's balance in one round trip
+
+        The new outstanding balance, available credit and minimum payment are
+        computed by the server in a pipeline update, so concurrent payments
+        cannot overwrite each other. With require_credit, a debit only applies
+        while the card still has enough available credit. Returns the updated
+        document, or None if the card was not found or a guard failed.
+        """
+        query = {'_id': ObjectId(card_id) if not isinstance(card_id, ObjectId) else card_id}
+        if require_credit:
+            query['available_credit'] = {'$gte': amount}
+        if require_active:
+            query['is_active'] = True
+            query['is_blocked'] = False
+
         if transaction_type == 'debit':
-            self.outstanding_balance += amount
-        elif transaction_type == 'credit':
-            self.outstanding_balance -= amount
-        
-        # Ensure balance doesn't go negative
-        if self.outstanding_balance < 0:
-            self.outstanding_balance = 0
-        
-        # Update available credit
-        self.available_credit = self.credit_limit - self.outstanding_balance
-        
-        # Update minimum payment (typically 5% of outstanding or minimum amount)
-        self.minimum_payment = max(self.outstanding_balance * 0.05, 100.0)
-        
-        self.save()
+            outstanding = {'$add': ['$outstanding_balance', amount]}
+        else:
+            # Balance doesn't go negative
+            outstanding = {'$max': [{'$subtract': ['$outstanding_balance', amount]}, 0]}
+        now = datetime.utcnow()
+        derived = {
+            'available_credit': {'$subtract': ['$credit_limit', '$outstanding_balance']},
+            # Typically 5% of outstanding or minimum amount
+            'minimum_payment': {'$max': [{'$multiply': ['$outstanding_balance', 0.05]}, 100.0]},
+            'updated_at': now
+        }
+        if touch:
+            derived['last_used'] = now
+
+        with span('Card.apply_balance_change'):
+            return cls._get_collection().find_one_and_update(
+                query,
+                [{'$set': {'outstanding_balance': outstanding}}, {'$set': derived}],
+                return_document=ReturnDocument.AFTER
+            )
+
+    @classmethod
+    def authorize_debit(cls, card_id, amount):
+        """Debit an active card if it has enough available credit, in one atomic write
+
+        Returns the updated document, or None when the card is not found,
+        inactive, blocked or over its limit.
+        """
+        return cls.apply_balance_change(card_id, amount, 'debit', require_credit=True,
+                                        require_active=True, touch=True)
+
+    @traced
+    def update_balance(self, amount, transaction_type='debit'):
+        """Update card balance after transaction
+
+        Applied atomically on the server; only the balance fields of this
+        instance are refreshed, and they are not written again by save().
+        """
+        document = Card.apply_balance_change(self.id, amount, transaction_type)
+        if document is None:
+            raise Card.DoesNotExist(f'Card {self.id} not found')
+        self.refresh_balance(document)
+
+    def refresh_balance(self, document):
+        """Copy the balance fields of an updated document onto this instance"""
+        for field in self.BALANCE_FIELDS:
+            if field in document:
+                # Written straight to _data so the fields aren't marked as changed
+                self._data[field] = document[field]
 
     def is_expired(self):
         """Check if card is expired"""
@@ -152,10 +258,22 @@ class Card(Document):
         """Get formatted expiry string"""
         return f"{self.expiry_month:02d}/{self.expiry_year}"
 
+    # Fields copied onto the card's credit ledger
+    LEDGER_FIELDS = ('credit_limit', 'is_active', 'is_blocked', 'is_international')
+
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        ledger_changed = self.pk is not None and any(
+            field in self.LEDGER_FIELDS for field in self._get_changed_fields()
+        )
+        with span('Card.save'):
+            result = super().save(*args, **kwargs)
+        if ledger_changed:
+            # Keep the credit ledger's limit and status in step with the card
+            from services.credit_ledger import credit_ledger
+            credit_ledger.sync_card(self)
+        return result
 
     def to_dict(self):
         """Convert card to dictionary for JSON serialization"""
@@ -186,4 +304,47 @@ class Card(Document):
         }
 
     def __repr__(self):
-        return f'<Card {self.card_id} - {self.card_name} - {self.get_masked_number()}>'
\ No newline at end of file
+        return f'<Card {self.card_id} - {self.card_name} - {self.get_masked_number()}>'
+
+class CardSummary:
+    """Read-only view of a card's balance, status and limits
+
+    Loaded with a projection, so hot paths never read the encrypted card
+    number, CVV or PIN hash, and the view cannot be saved over the card.
+    """
+
+    FIELDS = ('user_id', 'credit_limit', 'outstanding_balance', 'available_credit', 'minimum_payment',
+              'due_date', 'is_active', 'is_blocked', 'is_international', 'last_used')
+    DEFAULTS = {'outstanding_balance': 0.0, 'available_credit': 0.0, 'minimum_payment': 0.0,
+                'is_active': True, 'is_blocked': False, 'is_international': True}
+
+    __slots__ = ('id',) + FIELDS
+
+    def __init__(self, document):
+        self.id = document['_id']
+        for field in self.FIELDS:
+            setattr(self, field, document.get(field, self.DEFAULTS.get(field)))
+
+    def is_usable(self):
+        """Active and not blocked"""
+        return self.is_active and not self.is_blocked
+
+    def get_credit_utilization(self):
+        """Outstanding balance as a percentage of the credit limit"""
+        return (self.outstanding_balance / self.credit_limit) * 100 if self.credit_limit else 0
+
+    def to_dict(self):
+        """Convert summary to dictionary for JSON serialization"""
+        return {
+            'id': str(self.id),
+            'user_id': str(self.user_id) if self.user_id else None,
+            'credit_limit': float(self.credit_limit or 0),
+            'outstanding_balance': float(self.outstanding_balance),
+            'available_credit': float(self.available_credit),
+            'minimum_payment': float(self.minimum_payment),
+            'due_date': self.due_date,
+            'is_active': self.is_active,
+            'is_blocked': self.is_blocked,
+            'is_international': self.is_international,
+            'last_used': self.last_used.isoformat() if self.last_used else None
+        }
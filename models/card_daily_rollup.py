@@ -0,0 +1,85 @@
+from datetime import datetime
+from mongoengine import Document, FloatField, IntField, DateTimeField, ObjectIdField, DictField
+from services.tracing import span
+
+class CardDailyRollup(Document):
+    """Completed transaction totals of one card for one UTC day
+
+    Kept up to date as transactions complete or are refunded, so card
+    analytics read one small document per day instead of every
+    transaction in the window.
+    """
+
+    # Relationships
+    card_id = ObjectIdField(required=True)
+    user_id = ObjectIdField()
+
+    # Totals
+    day = DateTimeField(required=True)  # Midnight UTC
+    count = IntField(default=0)
+    amount = FloatField(default=0.0)
+    categories = DictField()  # merchant category -> {'count': int, 'amount': float}
+
+    # Timestamps
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'card_daily_rollups',
+        'indexes': [
+            {'fields': ['card_id', 'day'], 'unique': True},
+            'user_id'
+        ]
+    }
+
+    @staticmethod
+    def day_of(moment):
+        """Midnight UTC of the day a timestamp falls on"""
+        return datetime(moment.year, moment.month, moment.day)
+
+    @staticmethod
+    def category_key(category):
+        """Merchant category as a field name ('.' and a leading '$' are not allowed)"""
+        return (category or '').replace('.', '_').lstrip('$') or 'uncategorized'
+
+    @classmethod
+    def record(cls, card_id, user_id, moment, category, amount, sign=1):
+        """Add a completed transaction to its day (sign=-1 takes it back out)
+
+        A single upsert with $inc, so concurrent transactions on the same
+        card and day never overwrite each other.
+        """
+        key = cls.category_key(category)
+        amount = sign * float(amount)
+        with span('CardDailyRollup.record'):
+            cls._get_collection().update_one(
+                {'card_id': card_id, 'day': cls.day_of(moment)},
+                {
+                    '$inc': {
+                        'count': sign,
+                        'amount': amount,
+                        f'categories.{key}.count': sign,
+                        f'categories.{key}.amount': amount
+                    },
+                    '$set': {'user_id': user_id, 'updated_at': datetime.utcnow()}
+                },
+                upsert=True
+            )
+
+    def save(self, *args, **kwargs):
+        """Override save to update updated_at timestamp"""
+        self.updated_at = datetime.utcnow()
+        with span('CardDailyRollup.save'):
+            return super().save(*args, **kwargs)
+
+    def to_dict(self):
+        """Convert rollup to dictionary for JSON serialization"""
+        return {
+            'id': str(self.id),
+            'card_id': str(self.card_id),
+            'user_id': str(self.user_id) if self.user_id else None,
+            'day': self.day.date().isoformat() if self.day else None,
+            'count': self.count,
+            'amount': float(self.amount),
+            'categories': dict(self.categories or {}),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
 
 class CibilScore(Document):
     """CIBIL Score model for tracking credit scores"""
@@ -199,7 +200,8 @@ class CibilScore(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('CibilScore.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert CIBIL score to dictionary for JSON serialization"""
@@ -0,0 +1,71 @@
+from datetime import datetime
+from mongoengine import Document, FloatField, BooleanField, DateTimeField, ObjectIdField, DictField
+from services.tracing import span
+
+class CreditLedger(Document):
+    """Compact per-card credit state used to authorize debits
+
+    Holds only what a credit check needs, so authorizing a payment never
+    reads the card document with its encrypted number and CVV.
+    Card.outstanding_balance stays the source of truth; the ledger is
+    reconciled against it periodically.
+    """
+
+    # Relationships
+    card_id = ObjectIdField(required=True, unique=True)
+    user_id = ObjectIdField(required=True)
+
+    # Credit state
+    credit_limit = FloatField(default=0.0, min_value=0)
+    outstanding_balance = FloatField(default=0.0, min_value=0)
+    held_amount = FloatField(default=0.0, min_value=0)
+    holds = DictField()  # hold_id -> {'amount': float, 'expires_at': datetime}
+    is_usable = BooleanField(default=True)  # Card is active and not blocked
+    is_international = BooleanField(default=True)  # Read by fraud scoring
+
+    # Timestamps
+    reconciled_at = DateTimeField()
+    created_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'credit_ledgers',
+        'indexes': [
+            'card_id',
+            'user_id'
+        ]
+    }
+
+    def get_available_credit(self):
+        """Credit left after the outstanding balance and active holds"""
+        return self.credit_limit - self.outstanding_balance - self.held_amount
+
+    def save(self, *args, **kwargs):
+        """Override save to update updated_at timestamp"""
+        self.updated_at = datetime.utcnow()
+        with span('CreditLedger.save'):
+            return super().save(*args, **kwargs)
+
+    def to_dict(self):
+        """Convert ledger to dictionary for JSON serialization"""
+        return {
+            'id': str(self.id),
+            'card_id': str(self.card_id),
+            'user_id': str(self.user_id),
+            'credit_limit': float(self.credit_limit),
+            'outstanding_balance': float(self.outstanding_balance),
+            'held_amount': float(self.held_amount),
+            'available_credit': float(self.get_available_credit()),
+            'holds': {
+                hold_id: {
+                    'amount': float(hold['amount']),
+                    'expires_at': hold['expires_at'].isoformat() if hold.get('expires_at') else None
+                }
+                for hold_id, hold in (self.holds or {}).items()
+            },
+            'is_usable': self.is_usable,
+            'is_international': self.is_international,
+            'reconciled_at': self.reconciled_at.isoformat() if self.reconciled_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
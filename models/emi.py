@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
 
 class EMI(Document):
     """EMI model for managing Equated Monthly Installments"""
@@ -187,14 +188,15 @@ class EMI(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('EMI.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert EMI to dictionary for JSON serialization"""
         return {
             'id': str(self.id),
             'user_id': str(self.user_id) if self.user_id else None,
-            'card_id': str(self.card_id) if self.card_id else None,
+            'card_id': str(getattr(self.card_id, 'id', self.card_id)) if self.card_id else None,
             'emi_id': self.emi_id,
             'principal_amount': float(self.principal_amount),
             'interest_rate': float(self.interest_rate),
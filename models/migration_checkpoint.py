@@ -0,0 +1,91 @@
+from datetime import datetime
+from mongoengine import Document, StringField, IntField, DateTimeField, ObjectIdField, DictField
+
+class MigrationCheckpoint(Document):
+    """Checkpoint cursor for resumable background data migrations"""
+
+    # Job identity
+    job_id = StringField(required=True, unique=True, max_length=100)
+    job_type = StringField(required=True, max_length=50)
+
+    # Progress
+    status = StringField(default='running', choices=['running', 'paused', 'completed', 'failed'])
+    last_id = ObjectIdField()  # Highest _id fully processed so far
+    processed_count = IntField(default=0)
+    failed_count = IntField(default=0)
+    error_message = StringField(max_length=1000)
+
+    # Job specific counters and parameters
+    details = DictField()
+
+    # Timestamps
+    started_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)
+    completed_at = DateTimeField()
+
+    meta = {
+        'collection': 'migration_checkpoints',
+        'indexes': [
+            'job_id',
+            'job_type',
+            'status'
+        ]
+    }
+
+    @classmethod
+    def get_or_create(cls, job_id, job_type, details=None):
+        """Load the checkpoint for a job, creating it on first run"""
+        checkpoint = cls.objects(job_id=job_id).first()
+        if checkpoint is None:
+            checkpoint = cls(job_id=job_id, job_type=job_type, details=details or {})
+            checkpoint.save()
+        return checkpoint
+
+    def advance(self, last_id, processed=0, failed=0):
+        """Record a completed chunk and move the cursor forward"""
+        self.last_id = last_id
+        self.processed_count += processed
+        self.failed_count += failed
+        self.status = 'running'
+        self.save()
+
+    def complete(self):
+        """Mark the job as completed"""
+        self.status = 'completed'
+        self.completed_at = datetime.utcnow()
+        self.save()
+
+    def fail(self, error_message):
+        """Mark the job as failed so it can be resumed later"""
+        self.status = 'failed'
+        self.error_message = str(error_message)[:1000]
+        self.save()
+
+    def is_completed(self):
+        """Check if the job has finished"""
+        return self.status == 'completed'
+
+    def save(self, *args, **kwargs):
+        """Override save to update updated_at timestamp"""
+        self.updated_at = datetime.utcnow()
+        return super().save(*args, **kwargs)
+
+    def to_dict(self):
+        """Convert checkpoint to dictionary for JSON serialization"""
+        return {
+            'id': str(self.id),
+            'job_id': self.job_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'last_id': str(self.last_id) if self.last_id else None,
+            'processed_count': self.processed_count,
+            'failed_count': self.failed_count,
+            'error_message': self.error_message,
+            'details': dict(self.details) if self.details else {},
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+    def __repr__(self):
+        return f'<MigrationCheckpoint {self.job_id} - {self.status}>'
@@ -1,5 +1,6 @@
 from datetime import datetime
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
 
 class Notification(Document):
     """Notification model for user notifications"""
@@ -174,7 +175,8 @@ class Notification(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('Notification.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert notification to dictionary for JSON serialization"""
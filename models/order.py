@@ -1,5 +1,6 @@
 from datetime import datetime
 from mongoengine import Document, StringField, FloatField, IntField, DateTimeField, ReferenceField, ListField, EmbeddedDocument, EmbeddedDocumentField
+from services.tracing import span
 
 class OrderItem(EmbeddedDocument):
     """Order item model for individual items in an order"""
@@ -87,7 +88,8 @@ class Order(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('Order.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert order to dictionary for JSON serialization"""
@@ -1,5 +1,6 @@
 from datetime import datetime
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
 
 class Product(Document):
     """Product model for e-commerce or inventory management"""
@@ -59,7 +60,8 @@ class Product(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('Product.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert product to dictionary for JSON serialization"""
@@ -1,5 +1,7 @@
 from datetime import datetime
 from mongoengine import Document, StringField, FloatField, IntField, BooleanField, DateTimeField, ReferenceField, ListField
+from services.tracing import span
+from models.card_daily_rollup import CardDailyRollup
 
 class Transaction(Document):
     """Transaction model for credit card transactions"""
@@ -73,27 +75,44 @@ class Transaction(Document):
     
     def process_transaction(self):
         """Process the transaction and update status"""
-        self.status = 'completed'
-        self.processed_at = datetime.utcnow()
-        self.save()
+        self._set_status('completed')
     
     def fail_transaction(self):
         """Mark transaction as failed"""
-        self.status = 'failed'
-        self.processed_at = datetime.utcnow()
-        self.save()
+        self._set_status('failed')
     
     def cancel_transaction(self):
         """Cancel the transaction"""
-        self.status = 'cancelled'
-        self.processed_at = datetime.utcnow()
-        self.save()
+        self._set_status('cancelled')
     
     def refund_transaction(self):
         """Refund the transaction"""
-        self.status = 'refunded'
+        self._set_status('refunded')
+    
+    def _set_status(self, status):
+        """Save a new status and keep the card's daily rollup in step
+        
+        Only completed transactions count towards the rollup, so it changes
+        when a transaction enters or leaves the completed status.
+        """
+        previous = self.status
+        self.status = status
         self.processed_at = datetime.utcnow()
         self.save()
+        if (previous == 'completed') != (status == 'completed'):
+            CardDailyRollup.record(
+                self._reference_id('card_id'),
+                self._reference_id('user_id'),
+                self.transaction_date or self.processed_at,
+                self.merchant_category,
+                self.amount,
+                sign=1 if status == 'completed' else -1
+            )
+    
+    def _reference_id(self, field):
+        """Id held by a reference field, without loading the referenced document"""
+        value = self._data.get(field)
+        return getattr(value, 'id', value)
     
     def is_successful(self):
         """Check if transaction was successful"""
@@ -110,7 +129,8 @@ class Transaction(Document):
     def save(self, *args, **kwargs):
         """Override save to update updated_at timestamp"""
         self.updated_at = datetime.utcnow()
-        return super().save(*args, **kwargs)
+        with span('Transaction.save'):
+            return super().save(*args, **kwargs)
     
     def to_dict(self):
         """Convert transaction to dictionary for JSON serialization"""
@@ -1,6 +1,10 @@
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from pymongo import ReturnDocument
 from mongoengine import Document, StringField, BooleanField, DateTimeField, ReferenceField, ListField, IntField, FloatField
+from services.password_hashing import password_hasher
+from services.permissions import role_mask, PERMISSION_BITS
+from services.tracing import span
 
 class User(Document):
 	"""User model for authentication and user management"""
@@ -82,16 +86,29 @@ class User(Document):
 	
 	def set_password(self, password):
 		"""Hash and set password"""
-		self.password_hash = generate_password_hash(password)
+		self.password_hash = password_hasher.hash_password(password)
 	
 	def check_password(self, password):
-		"""Check if provided password matches hash"""
-		return check_password_hash(self.password_hash, password)
+		"""Check if provided password matches hash, upgrading outdated hashes"""
+		if not password_hasher.check_password(self.password_hash, password):
+			return False
+		if self.id is not None and password_hasher.needs_rehash(self.password_hash):
+			# Rehash in the background so login latency is not doubled
+			password_hasher.submit(self._rehash_password, password, self.password_hash)
+		return True
+	
+	def _rehash_password(self, password, old_hash):
+		"""Store a hash made with the current work factor"""
+		new_hash = generate_password_hash(password, password_hasher.method)
+		# Conditional update so a concurrent password change is never overwritten
+		User.objects(id=self.id, password_hash=old_hash).update_one(set__password_hash=new_hash)
+		self.password_hash = new_hash
 	
 	def save(self, *args, **kwargs):
 		"""Override save to update updated_at timestamp"""
 		self.updated_at = datetime.utcnow()
-		return super().save(*args, **kwargs)
+		with span('User.save'):
+			return super().save(*args, **kwargs)
 	
 	def to_dict(self):
 		"""Convert user to dictionary for JSON serialization"""
@@ -133,7 +150,7 @@ class User(Document):
 	def lock_account(self, minutes=30):
 		"""Lock account for specified minutes"""
 		self.locked_until = datetime.utcnow() + timedelta(minutes=minutes)
-		self.save()
+		User.objects(id=self.id).update_one(set__locked_until=self.locked_until)
 	
 	def unlock_account(self):
 		"""Unlock account"""
@@ -143,16 +160,27 @@ class User(Document):
 	
 	def increment_login_attempts(self):
 		"""Increment failed login attempts"""
-		self.login_attempts += 1
+		# Atomic increment instead of saving the whole document on every failure;
+		# the lockout check uses the stored count, so concurrent failures can't skip it
+		document = User._get_collection().find_one_and_update(
+			{'_id': self.id},
+			{'$inc': {'login_attempts': 1}},
+			projection={'login_attempts': True},
+			return_document=ReturnDocument.AFTER
+		)
+		if document is None:
+			return
+		self.login_attempts = document['login_attempts']
 		if self.login_attempts >= 5:  # Lock after 5 attempts
 			self.lock_account()
-		self.save()
 	
 	def reset_login_attempts(self):
 		"""Reset failed login attempts"""
+		if not self.login_attempts and not self.locked_until:
+			return
 		self.login_attempts = 0
 		self.locked_until = None
-		self.save()
+		User.objects(id=self.id).update_one(set__login_attempts=0, unset__locked_until=True)
 	
 	def update_last_login(self):
 		"""Update last login timestamp"""
@@ -212,10 +240,8 @@ class User(Document):
 		return False
 	
 	def has_permission(self, permission):
-		"""Check if user has specific permission"""
-		from services.auth import get_user_permissions
-		permissions = get_user_permissions(self.role)
-		return permission in permissions
+		"""Check if user has specific permission (False for unknown permission names)"""
+		return bool(role_mask(self.role) & PERMISSION_BITS.get(permission, 0))
 	
 	def is_session_valid(self):
 		"""Check if user session is still valid"""
@@ -0,0 +1,54 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from services.auth import token_required, require_permission
+from services.audit_store import audit_store
+
+audit_bp = Blueprint('audit', __name__)
+
+def _parse_time(name):
+    """Parse an ISO 8601 query parameter (UTC)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+@audit_bp.route('/events', methods=['GET'])
+@token_required
+@require_permission('view_audit_log')
+def get_audit_events():
+    """Query audit events by time range, user, action and category"""
+    try:
+        try:
+            start = _parse_time('start')
+            end = _parse_time('end')
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps'}), 400
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+
+        events = audit_store.query(
+            start=start,
+            end=end,
+            user_id=request.args.get('user_id'),
+            action=request.args.get('action'),
+            category=request.args.get('category'),
+            limit=limit
+        )
+
+        return jsonify({
+            'events': events,
+            'count': len(events),
+            'limit': limit
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@audit_bp.route('/verify', methods=['GET'])
+@token_required
+@require_permission('view_audit_log')
+def verify_audit_log():
+    """Check the audit log's hash chain for tampering"""
+    try:
+        result = audit_store.verify()
+        return jsonify(result), 200 if result['valid'] else 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
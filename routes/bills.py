@@ -3,6 +3,7 @@ from models.bill import Bill
 from models.card import Card
 from models.user import User
 from services.auth import token_required
+from services.credit_ledger import credit_ledger
 from bson import ObjectId
 import uuid
 from datetime import datetime, timedelta
@@ -92,7 +93,7 @@ def create_bill():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Verify card belongs to user
-        card = Card.objects.get(id=ObjectId(data['card_id']), user_id=ObjectId(user_id))
+        Card.get_summary(id=ObjectId(data['card_id']), user_id=ObjectId(user_id))
         
         # Generate bill ID
         bill_id = f"BILL_{uuid.uuid4().hex[:12].upper()}"
@@ -141,7 +142,8 @@ def pay_bill(bill_id):
         data = request.get_json()
         amount = data.get('amount')
         
-        bill = Bill.objects.get(id=ObjectId(bill_id), user_id=ObjectId(user_id))
+        # Card reference stays unresolved; the ledger needs only its id
+        bill = Bill.objects.no_dereference().get(id=ObjectId(bill_id), user_id=ObjectId(user_id))
         
         if bill.payment_status == 'paid':
             return jsonify({'error': 'Bill is already paid'}), 400
@@ -152,17 +154,23 @@ def pay_bill(bill_id):
         elif amount > bill.amount:
             return jsonify({'error': 'Payment amount cannot exceed bill amount'}), 400
         
-        # Check card balance
-        card = Card.objects.get(id=bill.card_id)
-        if amount > card.available_credit:
-            return jsonify({'error': 'Insufficient credit limit'}), 400
-        
-        # Pay the bill
-        bill.pay_bill(amount)
-        
-        # Update card balance
-        card.update_balance(amount, 'debit')
-        card.save()
+        # Reserve the payment on the card's credit ledger instead of loading the card
+        card_id = bill.card_id.id
+        hold = credit_ledger.authorize(card_id, amount)
+        if not hold['success']:
+            return jsonify({'error': hold['error']}), 400
+        
+        # Debit the card before marking the bill paid
+        capture = credit_ledger.capture(card_id, hold['hold_id'])
+        if not capture['success']:
+            return jsonify({'error': capture['error']}), 400
+        
+        # Pay the bill, refunding the card if the payment could not be recorded
+        try:
+            bill.pay_bill(amount)
+        except Exception:
+            credit_ledger.apply_credit(card_id, capture['amount'])
+            raise
         
         return jsonify(bill.to_dict()), 200
     except Bill.DoesNotExist:
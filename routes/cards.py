@@ -1,9 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from models.card import Card
 from models.user import User
 from models.transaction import Transaction
-from services.auth import token_required
+from services.auth import token_required, require_permission
+from services.card_bulk_service import card_bulk_service
 from bson import ObjectId
+import json
 import uuid
 
 cards_bp = Blueprint('cards', __name__)
@@ -78,6 +80,10 @@ def create_card():
         if not cvv.isdigit() or len(cvv) < 3 or len(cvv) > 4:
             return jsonify({'error': 'Invalid CVV format'}), 400
         
+        # Reject cards that are already registered
+        if Card.is_card_number_registered(card_number):
+            return jsonify({'error': 'Card is already registered'}), 400
+        
         # Create the card
         card = Card.create_card(
             user_id=ObjectId(user_id),
@@ -203,7 +209,7 @@ def get_card_transactions(card_id):
             return jsonify({'error': 'Invalid token'}), 401
         
         # Verify card belongs to user
-        card = Card.objects.get(id=ObjectId(card_id), user_id=ObjectId(user_id))
+        Card.get_summary(id=ObjectId(card_id), user_id=ObjectId(user_id))
         
         # Get query parameters
         page = request.args.get('page', 1, type=int)
@@ -256,3 +262,52 @@ def delete_card(card_id):
         return jsonify({'error': 'Card not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@cards_bp.route('/bulk', methods=['POST'])
+@token_required
+@require_permission('block_any_card')
+def bulk_card_operation():
+    """Block, unblock or expire many cards, streaming progress as JSON lines
+    
+    Cards are selected by card_ids or by filter. Sending the job_id of an
+    interrupted job resumes it from its checkpoint.
+    """
+    try:
+        claims = getattr(request, 'user_claims', {})
+        data = request.get_json() or {}
+        
+        result = card_bulk_service.create_job(
+            operation=data.get('operation'),
+            card_ids=data.get('card_ids'),
+            filters=data.get('filter'),
+            reason=data.get('reason'),
+            notify=data.get('notify', True),
+            actor_id=claims.get('user_id'),
+            job_id=data.get('job_id')
+        )
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        
+        job_id = result['job']['job_id']
+        
+        def progress():
+            yield json.dumps(result['job']) + '\n'
+            for update in card_bulk_service.run_job(job_id):
+                yield json.dumps(update) + '\n'
+        
+        return Response(stream_with_context(progress()), mimetype='application/x-ndjson', status=202)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@cards_bp.route('/bulk/<job_id>', methods=['GET'])
+@token_required
+@require_permission('block_any_card')
+def get_bulk_card_operation(job_id):
+    """Get the progress of a bulk card operation"""
+    try:
+        result = card_bulk_service.get_job(job_id)
+        if not result['success']:
+            return jsonify({'error': result['error']}), 404
+        return jsonify(result['job']), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
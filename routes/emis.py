@@ -3,6 +3,7 @@ from models.emi import EMI
 from models.card import Card
 from models.user import User
 from services.auth import token_required
+from services.credit_ledger import credit_ledger
 from bson import ObjectId
 import uuid
 from datetime import datetime, timedelta
@@ -84,10 +85,10 @@ def create_emi():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Verify card belongs to user
-        card = Card.objects.get(id=ObjectId(data['card_id']), user_id=ObjectId(user_id))
+        card = Card.get_summary(id=ObjectId(data['card_id']), user_id=ObjectId(user_id))
         
         # Check if card is active
-        if not card.is_active or card.is_blocked:
+        if not card.is_usable():
             return jsonify({'error': 'Card is not active or is blocked'}), 400
         
         # Generate EMI ID
@@ -131,7 +132,8 @@ def pay_emi(emi_id):
         amount = data.get('amount')
         payment_date = data.get('payment_date')
         
-        emi = EMI.objects.get(id=ObjectId(emi_id), user_id=ObjectId(user_id))
+        # Card reference stays unresolved; the ledger needs only its id
+        emi = EMI.objects.no_dereference().get(id=ObjectId(emi_id), user_id=ObjectId(user_id))
         
         if emi.status != 'active':
             return jsonify({'error': 'EMI is not active'}), 400
@@ -142,23 +144,29 @@ def pay_emi(emi_id):
         elif amount > emi.remaining_amount:
             return jsonify({'error': 'Payment amount cannot exceed remaining amount'}), 400
         
-        # Check card balance
-        card = Card.objects.get(id=emi.card_id)
-        if amount > card.available_credit:
-            return jsonify({'error': 'Insufficient credit limit'}), 400
-        
         # Parse payment date
         if payment_date:
             payment_date = datetime.fromisoformat(payment_date) if isinstance(payment_date, str) else payment_date
         else:
             payment_date = datetime.utcnow()
         
-        # Make payment
-        emi.make_payment(amount, payment_date)
+        # Reserve the payment on the card's credit ledger instead of loading the card
+        card_id = emi.card_id.id
+        hold = credit_ledger.authorize(card_id, amount)
+        if not hold['success']:
+            return jsonify({'error': hold['error']}), 400
+        
+        # Debit the card before recording the payment
+        capture = credit_ledger.capture(card_id, hold['hold_id'])
+        if not capture['success']:
+            return jsonify({'error': capture['error']}), 400
         
-        # Update card balance
-        card.update_balance(amount, 'debit')
-        card.save()
+        # Make payment, refunding the card if it could not be recorded
+        try:
+            emi.make_payment(amount, payment_date)
+        except Exception:
+            credit_ledger.apply_credit(card_id, capture['amount'])
+            raise
         
         return jsonify(emi.to_dict()), 200
     except EMI.DoesNotExist:
@@ -206,7 +214,8 @@ def pre_close_emi(emi_id):
         data = request.get_json()
         amount = data.get('amount')
         
-        emi = EMI.objects.get(id=ObjectId(emi_id), user_id=ObjectId(user_id))
+        # Card reference stays unresolved; the ledger needs only its id
+        emi = EMI.objects.no_dereference().get(id=ObjectId(emi_id), user_id=ObjectId(user_id))
         
         if emi.status != 'active':
             return jsonify({'error': 'EMI is not active'}), 400
@@ -217,17 +226,23 @@ def pre_close_emi(emi_id):
         elif amount > emi.remaining_amount:
             return jsonify({'error': 'Payment amount cannot exceed remaining amount'}), 400
         
-        # Check card balance
-        card = Card.objects.get(id=emi.card_id)
-        if amount > card.available_credit:
-            return jsonify({'error': 'Insufficient credit limit'}), 400
-        
-        # Make payment
-        emi.make_payment(amount)
-        
-        # Update card balance
-        card.update_balance(amount, 'debit')
-        card.save()
+        # Reserve the payment on the card's credit ledger instead of loading the card
+        card_id = emi.card_id.id
+        hold = credit_ledger.authorize(card_id, amount)
+        if not hold['success']:
+            return jsonify({'error': hold['error']}), 400
+        
+        # Debit the card before recording the payment
+        capture = credit_ledger.capture(card_id, hold['hold_id'])
+        if not capture['success']:
+            return jsonify({'error': capture['error']}), 400
+        
+        # Make payment, refunding the card if it could not be recorded
+        try:
+            emi.make_payment(amount)
+        except Exception:
+            credit_ledger.apply_credit(card_id, capture['amount'])
+            raise
         
         return jsonify(emi.to_dict()), 200
     except EMI.DoesNotExist:
@@ -3,6 +3,9 @@ from models.transaction import Transaction
 from models.card import Card
 from models.user import User
 from services.auth import token_required
+from services.rate_limiter import rate_limit, user_key
+from services.risk_engine import risk_engine, TransactionEvent
+from services.credit_ledger import credit_ledger
 from bson import ObjectId
 import uuid
 from datetime import datetime, timedelta
@@ -85,6 +88,7 @@ def get_transaction(transaction_id):
 
 @transactions_bp.route('/', methods=['POST'])
 @token_required
+@rate_limit('transactions', 30, per=60, key_func=user_key)
 def create_transaction():
     """Create a new transaction"""
     try:
@@ -100,16 +104,11 @@ def create_transaction():
             if field not in data or not data[field]:
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Verify card belongs to user
-        card = Card.objects.get(id=ObjectId(data['card_id']), user_id=ObjectId(user_id))
-        
-        # Check if card is active and not blocked
-        if not card.is_active or card.is_blocked:
-            return jsonify({'error': 'Card is not active or is blocked'}), 400
-        
-        # Check available credit
-        if data['amount'] > card.available_credit:
-            return jsonify({'error': 'Insufficient credit limit'}), 400
+        # Reserve the amount on the card's credit ledger; checks ownership,
+        # status and available credit without reading the card document
+        hold = credit_ledger.authorize(data['card_id'], data['amount'], user_id=user_id)
+        if not hold['success']:
+            return jsonify({'error': hold['error']}), 404 if hold['error'] == 'Card not found' else 400
         
         # Generate transaction ID
         transaction_id = f"TXN_{uuid.uuid4().hex[:12].upper()}"
@@ -134,12 +133,27 @@ def create_transaction():
         transaction.is_recurring = data.get('is_recurring', False)
         transaction.is_international = data.get('is_international', False)
         
-        transaction.save()
-        
-        # Update card balance
-        card.update_balance(data['amount'], 'debit')
-        card.last_used = datetime.utcnow()
-        card.save()
+        try:
+            transaction.save()
+        except Exception:
+            # Give the reserved credit back if the transaction could not be recorded
+            credit_ledger.release(data['card_id'], hold['hold_id'])
+            raise
+        
+        # Debit the card with the held amount
+        capture = credit_ledger.capture(data['card_id'], hold['hold_id'])
+        if not capture['success']:
+            transaction.fail_transaction()
+            return jsonify({'error': capture['error']}), 400
+        
+        # Keep the card's risk windows current for transactions created here
+        risk_engine.record(TransactionEvent(
+            data['card_id'],
+            data['amount'],
+            data.get('merchant_category'),
+            data.get('location'),
+            data.get('is_international', False)
+        ))
         
         # Process transaction
         transaction.process_transaction()
@@ -197,9 +211,7 @@ def refund_transaction(transaction_id):
         transaction.refund_transaction()
         
         # Update card balance
-        card = Card.objects.get(id=transaction.card_id.id)
-        card.update_balance(refund_amount, 'credit')
-        card.save()
+        credit_ledger.apply_credit(transaction.card_id.id, refund_amount)
         
         return jsonify(refund_transaction.to_dict()), 201
     except Transaction.DoesNotExist:
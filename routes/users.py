@@ -3,10 +3,19 @@ from models.user import User
 from models.order import Order
 from werkzeug.security import generate_password_hash
 from bson import ObjectId
-from services.auth import generate_token, token_required
+from services.auth import generate_token, get_token_claims, token_required, revoke_token, revoke_user_tokens
+from services.password_hashing import HashingUnavailable, ClientHashingLimitExceeded
+from services.rate_limiter import rate_limit, username_key
 
 users_bp = Blueprint('users', __name__)
 
+def _hashing_unavailable_response(error):
+    """Reject a request the password hashing executor could not admit"""
+    status_code = 429 if isinstance(error, ClientHashingLimitExceeded) else 503
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, status_code
+
 @users_bp.route('/', methods=['GET'])
 def get_users():
     """Get all users with pagination"""
@@ -81,10 +90,13 @@ def create_user():
         
         user.save()
         return jsonify(user.to_dict()), 201
+    except HashingUnavailable as e:
+        return _hashing_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @users_bp.route('/signup', methods=['POST'])
+@rate_limit('signup', 5, per=3600)
 def signup():
     """Signup creating full user profile and returning JWT"""
     data = request.get_json() or {}
@@ -127,12 +139,16 @@ def signup():
         user.estimated_existing_loan_amount = data.get('estimated_existing_loan_amount') or data.get('existing_loan_amount')
         
         user.save()
-        token = generate_token({'user_id': str(user.id), 'username': user.username})
+        token = generate_token(get_token_claims(user))
         return jsonify({'token': token, 'user': user.to_dict()}), 201
+    except HashingUnavailable as e:
+        return _hashing_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @users_bp.route('/login', methods=['POST'])
+@rate_limit('login', 20, per=60)
+@rate_limit('login_username', 10, per=300, key_func=username_key)
 def login():
     """Login with username and password, return JWT and user"""
     data = request.get_json() or {}
@@ -144,8 +160,10 @@ def login():
         user = User.objects(username=username).first()
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid credentials'}), 401
-        token = generate_token({'user_id': str(user.id), 'username': user.username})
+        token = generate_token(get_token_claims(user))
         return jsonify({'token': token, 'user': user.to_dict()}), 200
+    except HashingUnavailable as e:
+        return _hashing_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -165,6 +183,16 @@ def me():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@users_bp.route('/logout', methods=['POST'])
+@token_required
+def logout():
+    """Revoke the JWT used for this request"""
+    try:
+        revoke_token(request.headers['Authorization'].split(' ', 1)[1])
+        return jsonify({'message': 'Logged out successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @users_bp.route('/<user_id>', methods=['PUT'])
 def update_user(user_id):
     """Update a user"""
@@ -218,9 +246,14 @@ def update_user(user_id):
                 setattr(user, key, data[key])
         
         user.save()
+        # Cached sessions must not outlive a password change or deactivation
+        if 'password' in data or data.get('is_active') is False:
+            revoke_user_tokens(user_id)
         return jsonify(user.to_dict()), 200
     except User.DoesNotExist:
         return jsonify({'error': 'User not found'}), 404
+    except HashingUnavailable as e:
+        return _hashing_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
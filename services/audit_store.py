@@ -0,0 +1,458 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+
+# Audit store settings
+AUDIT_LOG_DIR = os.environ.get('AUDIT_LOG_DIR', os.path.join('logs', 'audit'))
+AUDIT_SEGMENT_MAX_BYTES = int(os.environ.get('AUDIT_SEGMENT_MAX_BYTES', str(16 * 1024 * 1024)))
+# Records between two entries of a segment's sparse time index
+AUDIT_INDEX_INTERVAL = int(os.environ.get('AUDIT_INDEX_INTERVAL', '256'))
+# fsync every group commit and make callers wait for it; false leaves flushing to the OS
+AUDIT_SYNC = os.environ.get('AUDIT_SYNC', 'true').lower() == 'true'
+
+GENESIS_HASH = '0' * 64
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+
+def _canonical(record):
+    """Serialize a record deterministically, so its hash can be recomputed"""
+    return json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+
+def chain_hash(prev_hash, record):
+    """Hash of a record chained to the hash of the record before it"""
+    return hashlib.sha256((prev_hash + _canonical(record)).encode()).hexdigest()
+
+def _to_timestamp(value):
+    """Accept epoch seconds or a (naive UTC) datetime"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        return (value - datetime(1970, 1, 1)).total_seconds()
+    return value.timestamp()
+
+class AuditSegment:
+    """One segment file with its sparse time index and summary
+
+    The summary (time range and the users it mentions) lets queries skip
+    whole segments; the index lets them seek close to the start time.
+    """
+
+    __slots__ = ('path', 'first_seq', 'last_seq', 'min_ts', 'max_ts', 'users',
+                 'index_ts', 'index_offsets', 'size', 'records')
+
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = first_seq - 1
+        self.min_ts = None
+        self.max_ts = None
+        self.users = set()
+        self.index_ts = []
+        self.index_offsets = []
+        self.size = 0
+        self.records = 0
+
+    @property
+    def index_path(self):
+        return self.path[:-len(SEGMENT_SUFFIX)] + '.idx'
+
+    @property
+    def meta_path(self):
+        return self.path[:-len(SEGMENT_SUFFIX)] + '.meta'
+
+    def add(self, record, offset, length):
+        """Account for a record written at offset"""
+        timestamp = record['timestamp']
+        indexed = self.records % AUDIT_INDEX_INTERVAL == 0
+        if indexed:
+            self.index_ts.append(timestamp)
+            self.index_offsets.append(offset)
+        if self.min_ts is None:
+            self.min_ts = timestamp
+        self.max_ts = timestamp
+        self.last_seq = record['seq']
+        if record.get('user_id'):
+            self.users.add(record['user_id'])
+        self.size = offset + length
+        self.records += 1
+        return indexed
+
+    def overlaps(self, start, end):
+        if self.min_ts is None:
+            return False
+        return (start is None or self.max_ts >= start) and (end is None or self.min_ts <= end)
+
+    def seek_offset(self, start):
+        """Offset of the last index entry at or before start"""
+        if start is None:
+            return 0
+        position = bisect.bisect_right(self.index_ts, start) - 1
+        return self.index_offsets[position] if position >= 0 else 0
+
+    def to_meta(self):
+        return {
+            'first_seq': self.first_seq,
+            'last_seq': self.last_seq,
+            'min_ts': self.min_ts,
+            'max_ts': self.max_ts,
+            'size': self.size,
+            'records': self.records,
+            'users': sorted(self.users)
+        }
+
+class AuditStore:
+    """Durable append-only store for audit and security events
+
+    Events are appended to segment files as JSON lines. Every record holds
+    the hash of the previous one, so editing or removing a record breaks
+    the chain and is caught by verify(). A single writer thread commits
+    whatever events queued up while the previous fsync ran, so concurrent
+    requests share one fsync instead of paying for their own.
+    """
+
+    def __init__(self, directory=None, segment_max_bytes=None, sync=None):
+        self.directory = directory or AUDIT_LOG_DIR
+        self.segment_max_bytes = segment_max_bytes or AUDIT_SEGMENT_MAX_BYTES
+        self.sync = AUDIT_SYNC if sync is None else sync
+        self.segments = []
+        self._last_hash = GENESIS_HASH
+        self._last_ts = 0.0
+        self._file = None
+        self._index_file = None
+        self._opened = False
+        self._lock = threading.Lock()  # guards segments and the chain state
+        self._cond = threading.Condition()  # guards the pending queue
+        self._pending = []
+        self._last_future = None
+        self._writer = None
+        self._closed = False
+        self.commits = 0
+        self.committed = 0
+
+    # Opening and recovery
+
+    def _open(self):
+        """Load the segments on disk and recover the chain state"""
+        os.makedirs(self.directory, exist_ok=True)
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        for position, name in enumerate(names):
+            path = os.path.join(self.directory, name)
+            first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            active = position == len(names) - 1
+            segment = None if active else self._load_sealed(path, first_seq)
+            if segment is None:
+                segment = self._scan(path, first_seq, truncate_tail=active)
+            self.segments.append(segment)
+
+        for segment in reversed(self.segments):
+            last = self._read_last_record(segment)
+            if last is not None:
+                self._last_hash = last['hash']
+                self._last_ts = last['timestamp']
+                break
+        if not self.segments or self.segments[-1].size >= self.segment_max_bytes:
+            self._start_segment()
+        else:
+            self._open_files(self.segments[-1], rewrite_index=True)
+        self._opened = True
+
+    def _load_sealed(self, path, first_seq):
+        """Load a sealed segment's summary and index, or None to rebuild them"""
+        segment = AuditSegment(path, first_seq)
+        try:
+            with open(segment.meta_path) as meta_file:
+                meta = json.load(meta_file)
+            with open(segment.index_path) as index_file:
+                for line in index_file:
+                    timestamp, offset = line.split()
+                    segment.index_ts.append(float(timestamp))
+                    segment.index_offsets.append(int(offset))
+        except (OSError, ValueError):
+            return None
+        segment.last_seq = meta['last_seq']
+        segment.min_ts = meta['min_ts']
+        segment.max_ts = meta['max_ts']
+        segment.size = meta['size']
+        segment.records = meta['records']
+        segment.users = set(meta['users'])
+        return segment
+
+    def _scan(self, path, first_seq, truncate_tail=False):
+        """Rebuild a segment's summary and index by reading it
+
+        A partially written last line (from a crash mid-commit) is cut off.
+        """
+        segment = AuditSegment(path, first_seq)
+        offset = 0
+        with open(path, 'rb') as segment_file:
+            for line in segment_file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('Incomplete record')
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                segment.add(record, offset, len(line))
+                offset += len(line)
+        if truncate_tail and os.path.getsize(path) > offset:
+            with open(path, 'r+b') as segment_file:
+                segment_file.truncate(offset)
+        return segment
+
+    def _read_last_record(self, segment):
+        """Read the last record of a segment, if it has any"""
+        if not segment.records:
+            return None
+        last = None
+        with open(segment.path, 'rb') as segment_file:
+            segment_file.seek(segment.index_offsets[-1])
+            for line in segment_file:
+                last = line
+        return json.loads(last)
+
+    def _open_files(self, segment, rewrite_index=False):
+        self._file = open(segment.path, 'ab')
+        if rewrite_index:
+            with open(segment.index_path, 'w') as index_file:
+                for timestamp, offset in zip(segment.index_ts, segment.index_offsets):
+                    index_file.write(f'{timestamp!r} {offset}\n')
+        self._index_file = open(segment.index_path, 'a')
+
+    def _start_segment(self):
+        """Seal the active segment and start a new one"""
+        if self.segments:
+            self._seal(self.segments[-1])
+        next_seq = self.segments[-1].last_seq + 1 if self.segments else 1
+        path = os.path.join(self.directory, f'{SEGMENT_PREFIX}{next_seq:012d}{SEGMENT_SUFFIX}')
+        segment = AuditSegment(path, next_seq)
+        self.segments.append(segment)
+        self._open_files(segment, rewrite_index=True)
+
+    def _seal(self, segment):
+        """Close a full segment and persist its summary"""
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._file = self._index_file = None
+        meta_tmp = segment.meta_path + '.tmp'
+        with open(meta_tmp, 'w') as meta_file:
+            json.dump(segment.to_meta(), meta_file)
+        os.replace(meta_tmp, segment.meta_path)
+
+    # Writing
+
+    def append(self, category, action, user_id=None, resource_type=None, resource_id=None,
+               success=True, ip_address=None, details=None):
+        """Queue an event; the returned future resolves to the committed record"""
+        event = {
+            'category': category,
+            'action': action,
+            'user_id': str(user_id) if user_id is not None else None,
+            'resource_type': resource_type,
+            'resource_id': str(resource_id) if resource_id is not None else None,
+            'success': success,
+            'ip_address': ip_address,
+            'details': details or {}
+        }
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Audit store is closed')
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='audit-store-writer', daemon=True)
+                self._writer.start()
+            self._pending.append((event, future))
+            self._last_future = future
+            self._cond.notify()
+        return future
+
+    def record(self, category, action, user_id=None, resource_type=None, resource_id=None,
+               success=True, ip_address=None, details=None, timeout=5):
+        """Append an event, waiting for it to be durable when the store is synchronous"""
+        future = self.append(category, action, user_id, resource_type, resource_id,
+                             success, ip_address, details)
+        if self.sync:
+            return future.result(timeout)
+        return None
+
+    def _run(self):
+        """Writer loop: each pass commits everything queued since the last one"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+            try:
+                with self._lock:
+                    records = self._commit([event for event, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), record in zip(batch, records):
+                future.set_result(record)
+
+    def _commit(self, events):
+        """Sequence, chain and write a group of events with one flush"""
+        if not self._opened:
+            self._open()
+        segment = self.segments[-1]
+        offset = segment.size
+        chunks = []
+        index_lines = []
+        records = []
+        for event in events:
+            record = dict(event)
+            record['seq'] = segment.last_seq + 1
+            # Timestamps never go backwards, so the sparse index stays sorted
+            record['timestamp'] = max(time.time(), self._last_ts)
+            record['prev_hash'] = self._last_hash
+            record['hash'] = chain_hash(self._last_hash, record)
+            line = (_canonical(record) + '\n').encode()
+            if segment.add(record, offset, len(line)):
+                index_lines.append(f"{record['timestamp']!r} {offset}\n")
+            chunks.append(line)
+            records.append(record)
+            offset += len(line)
+            self._last_hash = record['hash']
+            self._last_ts = record['timestamp']
+
+        self._file.write(b''.join(chunks))
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        if index_lines:
+            self._index_file.write(''.join(index_lines))
+            self._index_file.flush()
+        self.commits += 1
+        self.committed += len(records)
+
+        if segment.size >= self.segment_max_bytes:
+            self._start_segment()
+        return records
+
+    def flush(self, timeout=5):
+        """Wait until every queued event is written"""
+        future = self._last_future
+        if future is not None:
+            future.exception(timeout)
+
+    def close(self):
+        """Write the remaining events and stop the writer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._index_file.close()
+                self._file = self._index_file = None
+
+    # Reading
+
+    def _candidates(self, start, end, user_id):
+        """Segments that can hold matching events, with their read ranges"""
+        if not self._opened:
+            self._open()
+        return [
+            (segment.path, segment.seek_offset(start), segment.size)
+            for segment in self.segments
+            if segment.overlaps(start, end) and (user_id is None or user_id in segment.users)
+        ]
+
+    def query(self, start=None, end=None, user_id=None, action=None, category=None, limit=1000):
+        """Find events in a time range, optionally for one user, action or category
+
+        Segments outside the range or without the user are skipped, and the
+        sparse index seeks to the start time within a segment.
+        """
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        user_id = str(user_id) if user_id is not None else None
+        with self._lock:
+            candidates = self._candidates(start, end, user_id)
+
+        results = []
+        for path, offset, size in candidates:
+            with open(path, 'rb') as segment_file:
+                segment_file.seek(offset)
+                while offset < size:
+                    line = segment_file.readline()
+                    offset += len(line)
+                    record = json.loads(line)
+                    if start is not None and record['timestamp'] < start:
+                        continue
+                    if end is not None and record['timestamp'] > end:
+                        break
+                    if user_id is not None and record['user_id'] != user_id:
+                        continue
+                    if action is not None and record['action'] != action:
+                        continue
+                    if category is not None and record['category'] != category:
+                        continue
+                    results.append(record)
+                    if limit and len(results) >= limit:
+                        return results
+        return results
+
+    def verify(self):
+        """Recompute the hash chain over every segment
+
+        Returns whether the chain is intact, and where it breaks if not.
+        """
+        with self._lock:
+            if not self._opened:
+                self._open()
+            segments = [(segment.path, segment.size) for segment in self.segments]
+
+        prev_hash = GENESIS_HASH
+        expected_seq = 1
+        for path, size in segments:
+            offset = 0
+            with open(path, 'rb') as segment_file:
+                while offset < size:
+                    line = segment_file.readline()
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        return {'valid': False, 'records': expected_seq - 1, 'seq': expected_seq,
+                                'error': 'Unreadable record'}
+                    stored_hash = record.pop('hash', None)
+                    if record.get('seq') != expected_seq:
+                        return {'valid': False, 'records': expected_seq - 1, 'seq': expected_seq,
+                                'error': 'Missing or reordered record'}
+                    if record.get('prev_hash') != prev_hash or chain_hash(prev_hash, record) != stored_hash:
+                        return {'valid': False, 'records': expected_seq - 1, 'seq': expected_seq,
+                                'error': 'Hash mismatch'}
+                    prev_hash = stored_hash
+                    expected_seq += 1
+        return {'valid': True, 'records': expected_seq - 1, 'last_hash': prev_hash}
+
+    def get_stats(self):
+        """Segment and group commit counters"""
+        with self._lock:
+            segments = len(self.segments)
+        return {
+            'segments': segments,
+            'commits': self.commits,
+            'records_committed': self.committed,
+            'pending': len(self._pending)
+        }
+
+# Global audit store instance
+audit_store = AuditStore()
+atexit.register(audit_store.close)
@@ -8,6 +8,23 @@ from functools import wraps
 from flask import request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from models.user import User
+from services.token_cache import VerifiedTokenCache, InMemoryRevocationList, token_digest
+from services.permissions import ROLE_PERMISSION_NAMES, permission_bit, role_mask, claims_mask
+from services.logging_service import log_security_event, log_security_events, record_audit_event, record_audit_events
+
+# Claims of tokens that already passed signature verification
+verified_token_cache = VerifiedTokenCache()
+_revocation_list = InMemoryRevocationList()
+
+def set_revocation_list(revocation_list):
+    """Plug in a different token revocation backend"""
+    global _revocation_list
+    _revocation_list = revocation_list
+    verified_token_cache.clear()
+
+def get_revocation_list():
+    """Get the active token revocation backend"""
+    return _revocation_list
 
 def _get_secret() -> str:
     # Try to get from Flask app config first, then environment variables
@@ -25,13 +42,39 @@ def _get_secret() -> str:
     return secret
 
 def generate_token(payload: dict, expires_in_minutes: int = 60) -> str:
-    exp = datetime.now(tz=timezone.utc) + timedelta(minutes=expires_in_minutes)
-    to_encode = {**payload, 'exp': exp}
+    now = datetime.now(tz=timezone.utc)
+    exp = now + timedelta(minutes=expires_in_minutes)
+    to_encode = {**payload, 'iat': now, 'exp': exp}
     return jwt.encode(to_encode, _get_secret(), algorithm='HS256')
 
 def decode_token(token: str) -> dict:
     return jwt.decode(token, _get_secret(), algorithms=['HS256'])
 
+class TokenRevokedError(jwt.InvalidTokenError):
+    """Raised for a correctly signed token that has been revoked"""
+
+def verify_token(token: str) -> dict:
+    """Decode a token, reusing claims cached from an earlier verification"""
+    digest = token_digest(token)
+    claims = verified_token_cache.get(digest)
+    if claims is None:
+        claims = decode_token(token)
+        verified_token_cache.put(digest, claims)
+    if _revocation_list.is_revoked(digest, claims):
+        raise TokenRevokedError('Token has been revoked')
+    return claims
+
+def revoke_token(token: str) -> None:
+    """Revoke a token before its expiry (e.g. on logout)"""
+    digest = token_digest(token)
+    claims = jwt.decode(token, options={'verify_signature': False})
+    _revocation_list.revoke(digest, claims.get('exp'))
+    verified_token_cache.discard(digest)
+
+def revoke_user_tokens(user_id: str) -> None:
+    """Revoke every token issued to a user so far (e.g. after a password change)"""
+    _revocation_list.revoke_user(user_id)
+
 def token_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -40,11 +83,13 @@ def token_required(fn):
             return jsonify({'error': 'Missing or invalid Authorization header'}), 401
         token = auth_header.split(' ', 1)[1]
         try:
-            claims = decode_token(token)
+            claims = verify_token(token)
             request.user_claims = claims
             return fn(*args, **kwargs)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expired'}), 401
+        except TokenRevokedError:
+            return jsonify({'error': 'Token revoked'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
     return wrapper
@@ -222,40 +267,27 @@ def check_permission(user_role: str, required_role: str) -> bool:
     return user_level >= required_level
 
 def get_user_permissions(user_role: str) -> list:
-    """Get list of permissions for a user role"""
-    permissions = {
-        'user': [
-            'view_own_cards', 'create_card', 'update_own_card', 'block_own_card',
-            'view_own_transactions', 'create_transaction', 'refund_transaction',
-            'view_own_bills', 'create_bill', 'pay_bill', 'update_own_bill',
-            'view_own_emis', 'create_emi', 'pay_emi', 'update_own_emi',
-            'view_own_cibil', 'create_cibil', 'update_own_cibil',
-            'view_own_notifications', 'create_notification', 'update_own_notification'
-        ],
-        'manager': [
-            'view_all_cards', 'update_any_card', 'block_any_card',
-            'view_all_transactions', 'view_all_bills', 'view_all_emis',
-            'view_all_cibil', 'view_all_notifications', 'manage_notifications'
-        ],
-        'admin': [
-            'delete_any_card', 'delete_any_transaction', 'delete_any_bill',
-            'delete_any_emi', 'delete_any_cibil', 'delete_any_notification',
-            'manage_users', 'view_analytics', 'system_settings'
-        ]
+    """Get list of permissions for a user role, including inherited ones"""
+    return list(ROLE_PERMISSION_NAMES.get(user_role, ()))
+
+def get_token_claims(user) -> dict:
+    """Build the JWT payload for a user, embedding their permission mask"""
+    return {
+        'user_id': str(user.id),
+        'username': user.username,
+        'role': user.role,
+        'perms': role_mask(user.role)
     }
-    
-    return permissions.get(user_role, [])
 
 def require_permission(permission: str):
     """Decorator to require specific permission"""
+    # Resolved once at decoration time, so a misspelled permission fails at import
+    bit = permission_bit(permission)
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             claims = getattr(request, 'user_claims', {})
-            user_role = claims.get('role', 'user')
-            user_permissions = get_user_permissions(user_role)
-            
-            if permission not in user_permissions:
+            if not claims_mask(claims) & bit:
                 return jsonify({'error': f'Permission {permission} required'}), 403
             
             return fn(*args, **kwargs)
@@ -263,20 +295,21 @@ def require_permission(permission: str):
     return decorator
 
 def log_authentication_event(user_id: str, event_type: str, success: bool, details: dict = None):
-    """Log authentication events for security monitoring"""
-    # This would typically write to a security log
-    event = {
-        'user_id': user_id,
-        'event_type': event_type,
-        'success': success,
-        'timestamp': datetime.utcnow().isoformat(),
-        'ip_address': request.remote_addr if request else None,
-        'user_agent': request.headers.get('User-Agent') if request else None,
-        'details': details or {}
-    }
+    """Log authentication events for security monitoring
     
-    # In production, this would be logged to a secure logging system
-    print(f"SECURITY_EVENT: {event}")
+    Events go to the security log and to the hash-chained audit store.
+    """
+    log_security_event(event_type, user_id, success, details)
+    record_audit_event('security', event_type, user_id, success=success, details=details)
+
+def log_authentication_events(event_type: str, events: list, success: bool = True):
+    """Log one authentication event type for many users
+
+    Writes a single security log record and waits for the audit store once,
+    instead of once per event. events is a list of {'user_id', 'details'}.
+    """
+    log_security_events(event_type, events, success)
+    record_audit_events('security', event_type, events, success=success)
 
 def validate_session_timeout(user_id: str, last_activity: datetime) -> bool:
     """Validate if user session has timed out"""
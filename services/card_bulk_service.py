@@ -0,0 +1,281 @@
+import os
+import time
+import bisect
+import uuid
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+from models.card import Card
+from models.notification import Notification
+from models.migration_checkpoint import MigrationCheckpoint
+from services.auth import log_authentication_events
+from services.credit_ledger import credit_ledger
+from services.logging_service import log_error, log_performance
+
+CARD_BULK_CHUNK_SIZE = int(os.environ.get('CARD_BULK_CHUNK_SIZE', '500'))
+CARD_BULK_MAX_CARD_IDS = int(os.environ.get('CARD_BULK_MAX_CARD_IDS', '100000'))
+
+# State change, notification and security event of each bulk operation.
+# guard selects the cards the operation still has to change.
+BULK_OPERATIONS = {
+    'block': {
+        'guard': {'is_blocked': False},
+        'set': {'is_blocked': True, 'is_active': False},
+        'usable': False,
+        'title': 'Card Blocked',
+        'message': 'Your card ending in {last4} has been blocked. Reason: {reason}',
+        'priority': 'high',
+        'security_event': 'card_blocked'
+    },
+    'unblock': {
+        'guard': {'is_blocked': True},
+        'set': {'is_blocked': False, 'is_active': True},
+        'usable': True,
+        'title': 'Card Unblocked',
+        'message': 'Your card ending in {last4} has been unblocked and is now active.',
+        'priority': 'medium',
+        'security_event': None
+    },
+    'expire': {
+        'guard': {'is_active': True},
+        'set': {'is_active': False},
+        'usable': False,
+        'title': 'Card Expired',
+        'message': 'Your card ending in {last4} has expired and can no longer be used. Reason: {reason}',
+        'priority': 'high',
+        'security_event': 'card_expired'
+    }
+}
+
+# Card fields a bulk operation may select on
+BULK_FILTER_FIELDS = ('user_id', 'card_type', 'card_brand', 'is_active', 'is_blocked', 'is_international',
+                      'expiry_year', 'expiry_month')
+
+class CardBulkService:
+    """Resumable block, unblock and expire over many cards
+
+    A job selects cards by id list or by filter and works through them in
+    _id order, one chunk at a time: one update_many for the state change,
+    one bulk insert for the notifications and one checkpoint write. The
+    chunk being applied is recorded on the checkpoint first, so a job
+    resumed after a crash finishes that chunk without notifying any card
+    twice.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or CARD_BULK_CHUNK_SIZE
+
+    def create_job(self, operation, card_ids=None, filters=None, reason=None, notify=True, actor_id=None, job_id=None):
+        """Validate a bulk operation and record it as a job
+
+        Returns {'success': True, 'job': progress}. An existing job_id is
+        returned unchanged, so a client can resume it.
+        """
+        if job_id:
+            checkpoint = MigrationCheckpoint.objects(job_id=job_id).first()
+            if checkpoint is not None:
+                if not checkpoint.job_type.startswith('card_bulk_'):
+                    return {'success': False, 'error': 'job_id belongs to another job'}
+                return {'success': True, 'job': self._progress(checkpoint)}
+            if len(job_id) > 40:
+                return {'success': False, 'error': 'job_id must be at most 40 characters'}
+
+        if operation not in BULK_OPERATIONS:
+            return {'success': False, 'error': f"operation must be one of {', '.join(BULK_OPERATIONS)}"}
+        if bool(card_ids) == bool(filters):
+            return {'success': False, 'error': 'Provide either card_ids or filter'}
+
+        details = {'operation': operation, 'reason': reason or 'Bulk operation', 'notify': bool(notify),
+                   'actor_id': actor_id, 'notified': 0}
+        try:
+            if card_ids:
+                if len(card_ids) > CARD_BULK_MAX_CARD_IDS:
+                    return {'success': False, 'error': f'At most {CARD_BULK_MAX_CARD_IDS} card_ids per job'}
+                details['card_ids'] = sorted({ObjectId(card_id) for card_id in card_ids})
+            else:
+                details['filter'] = self._build_filter(filters)
+        except (InvalidId, TypeError, ValueError) as e:
+            return {'success': False, 'error': str(e)}
+
+        job_id = job_id or f"card_bulk_{operation}_{uuid.uuid4().hex[:12]}"
+        checkpoint = MigrationCheckpoint.get_or_create(job_id, f'card_bulk_{operation}', details)
+        return {'success': True, 'job': self._progress(checkpoint)}
+
+    @staticmethod
+    def _build_filter(filters):
+        """Turn a client filter into a card query, allowing only BULK_FILTER_FIELDS"""
+        if not isinstance(filters, dict):
+            raise ValueError('filter must be an object')
+        unknown = set(filters) - set(BULK_FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+        query = dict(filters)
+        if 'user_id' in query:
+            query['user_id'] = ObjectId(query['user_id'])
+        return query
+
+    def run_job(self, job_id, max_documents=None):
+        """Apply a job chunk by chunk, yielding a progress dict after each chunk
+
+        The last dict has status 'completed' or 'failed'. A failed or
+        interrupted job continues from its checkpoint when run again.
+        """
+        checkpoint = MigrationCheckpoint.objects(job_id=job_id).first()
+        if checkpoint is None:
+            yield {'job_id': job_id, 'status': 'failed', 'error': 'Job not found'}
+            return
+        if checkpoint.is_completed():
+            yield self._progress(checkpoint)
+            return
+
+        spec = BULK_OPERATIONS[checkpoint.details['operation']]
+        start_time = time.monotonic()
+        processed = 0
+        try:
+            pending = checkpoint.details.get('pending_ids')
+            if pending:
+                # Finish the chunk that was being applied when the job stopped
+                documents = self._find(pending, {})
+                self._apply(checkpoint, spec, documents, pending, resumed=True)
+                yield self._progress(checkpoint)
+
+            while max_documents is None or processed < max_documents:
+                limit = self.chunk_size if max_documents is None else min(self.chunk_size, max_documents - processed)
+                documents = self._next_chunk(checkpoint, spec, limit)
+                if documents is None:
+                    checkpoint.complete()
+                    break
+                self._apply(checkpoint, spec, documents, None)
+                processed += len(documents)
+                yield self._progress(checkpoint)
+
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('card_bulk_operation', duration, {
+                'job_id': job_id, 'operation': checkpoint.details['operation'], 'processed': processed
+            })
+            yield self._progress(checkpoint)
+
+        except Exception as e:
+            checkpoint.fail(e)
+            log_error('CardBulkOperationError', str(e), details={'job_id': job_id})
+            yield dict(self._progress(checkpoint), error=str(e))
+
+    def _find(self, card_ids, guard):
+        """Cards among card_ids that match guard, with the fields notifications need"""
+        return list(Card._get_collection().find(
+            dict(guard, _id={'$in': list(card_ids)}), {'user_id': 1, 'secret': 1}
+        ).sort('_id', ASCENDING))
+
+    def _next_chunk(self, checkpoint, spec, limit):
+        """Next cards after the checkpoint cursor that still need the change
+
+        Returns None once the selection is exhausted. For id lists a chunk
+        may be empty when none of its cards need the change.
+        """
+        last_id = checkpoint.last_id
+        card_ids = checkpoint.details.get('card_ids')
+        if card_ids is not None:
+            start = 0 if last_id is None else bisect.bisect_right(card_ids, last_id)
+            remaining = card_ids[start:start + limit]
+            if not remaining:
+                return None
+            documents = self._find(remaining, spec['guard'])
+            # Move the cursor past the whole slice, even the cards that were skipped
+            checkpoint.last_id = remaining[-1]
+            return documents
+
+        # Both must hold; merging them would let the guard replace a client filter on the same field
+        clauses = [checkpoint.details['filter'], spec['guard']]
+        if last_id:
+            clauses.append({'_id': {'$gt': last_id}})
+        query = {'$and': clauses}
+        documents = list(Card._get_collection().find(query, {'user_id': 1, 'secret': 1})
+                         .sort('_id', ASCENDING).limit(limit))
+        return documents or None
+
+    def _apply(self, checkpoint, spec, documents, pending, resumed=False):
+        """Change the state of one chunk of cards, then notify their owners"""
+        card_ids = [document['_id'] for document in documents]
+        cursor = checkpoint.last_id
+        if pending is None and card_ids:
+            checkpoint.details['pending_ids'] = card_ids
+            checkpoint.save()
+
+        modified = 0
+        if card_ids:
+            result = Card._get_collection().update_many(
+                dict(spec['guard'], _id={'$in': card_ids}),
+                {'$set': dict(spec['set'], updated_at=datetime.utcnow())}
+            )
+            modified = result.modified_count
+            credit_ledger.set_usable(card_ids, spec['usable'])
+            notified = self._notify(checkpoint, spec, documents, resumed)
+            checkpoint.details['notified'] = checkpoint.details.get('notified', 0) + notified
+
+        checkpoint.details.pop('pending_ids', None)
+        last_id = card_ids[-1] if card_ids else cursor
+        if cursor is not None and last_id is not None:
+            last_id = max(last_id, cursor)
+        checkpoint.advance(last_id, processed=modified if not resumed else len(card_ids))
+
+    def _notify(self, checkpoint, spec, documents, resumed):
+        """Bulk insert one notification per card and log the security events"""
+        details = checkpoint.details
+        tag = f'bulk:{checkpoint.job_id}'
+        if resumed:
+            # Skip cards that were already notified before the job stopped
+            done = {notification['related_entity_id'] for notification in Notification._get_collection().find(
+                {'tags': tag, 'related_entity_id': {'$in': [str(document['_id']) for document in documents]}},
+                {'related_entity_id': 1}
+            )}
+            documents = [document for document in documents if str(document['_id']) not in done]
+
+        if details.get('notify', True) and documents:
+            notifications = [
+                Notification.create_notification(
+                    user_id=document['user_id'],
+                    title=spec['title'],
+                    message=spec['message'].format(last4=document.get('secret') or '****', reason=details['reason']),
+                    notification_type='card',
+                    priority=spec['priority'],
+                    related_entity_type='card',
+                    related_entity_id=str(document['_id']),
+                    tags=[tag]
+                )
+                for document in documents
+            ]
+            Notification.objects.insert(notifications, load_bulk=False)
+
+        if spec['security_event']:
+            # One security log record and one audit store wait per chunk
+            log_authentication_events(spec['security_event'], [
+                {
+                    'user_id': str(document['user_id']),
+                    'details': {'reason': details['reason'], 'card_id': str(document['_id']),
+                                'job_id': checkpoint.job_id, 'actor_id': details.get('actor_id')}
+                }
+                for document in documents
+            ])
+        return len(documents) if details.get('notify', True) else 0
+
+    @staticmethod
+    def _progress(checkpoint):
+        return {
+            'job_id': checkpoint.job_id,
+            'operation': checkpoint.details.get('operation'),
+            'status': checkpoint.status,
+            'processed': checkpoint.processed_count,
+            'notified': checkpoint.details.get('notified', 0),
+            'last_id': str(checkpoint.last_id) if checkpoint.last_id else None
+        }
+
+    def get_job(self, job_id):
+        """Progress of a bulk job"""
+        checkpoint = MigrationCheckpoint.objects(job_id=job_id).first()
+        if checkpoint is None or not checkpoint.job_type.startswith('card_bulk_'):
+            return {'success': False, 'error': 'Job not found'}
+        return {'success': True, 'job': self._progress(checkpoint)}
+
+# Global card bulk service instance
+card_bulk_service = CardBulkService()
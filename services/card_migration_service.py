@@ -0,0 +1,311 @@
+import os
+import re
+import time
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from models.card import Card
+from models.transaction import Transaction
+from models.emi import EMI
+from models.card_daily_rollup import CardDailyRollup
+from models.migration_checkpoint import MigrationCheckpoint
+from services.encryption import encryption_service, CIPHERTEXT_V2_PREFIX, CIPHERTEXT_GCM_PREFIX
+from services.logging_service import log_error, log_performance
+
+class CardMigrationService:
+    """Resumable backfills and data migrations over the cards collection"""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or int(os.environ.get('CARD_MIGRATION_CHUNK_SIZE', '500'))
+
+    def backfill_card_number_index(self, job_id='card_number_index_backfill', max_documents=None):
+        """Compute the card number blind index for cards created before it existed
+
+        Duplicate card numbers cannot share the unique index; they are left
+        without an index value and reported as conflicts for manual review.
+        """
+        checkpoint = None
+        try:
+            checkpoint = MigrationCheckpoint.get_or_create(job_id, 'card_number_index_backfill', {'conflicts': 0})
+            if checkpoint.is_completed():
+                return {'success': True, 'processed': 0, 'job': checkpoint.to_dict()}
+
+            collection = Card._get_collection()
+            start_time = time.monotonic()
+            processed = 0
+
+            for documents in self._iter_chunks(collection, checkpoint, {'card_number_index': None}, {'card_number': 1}, max_documents):
+                # Keep the zero padding the index is computed over
+                card_numbers = encryption_service.decrypt_many(
+                    [document['card_number'] for document in documents], field='card_number',
+                    associated_data=[document['_id'] for document in documents], strip_padding=False
+                )
+                operations = [
+                    UpdateOne(
+                        {'_id': document['_id'], 'card_number_index': None},
+                        {'$set': {'card_number_index': encryption_service.compute_blind_index(card_number)}}
+                    )
+                    for document, card_number in zip(documents, card_numbers)
+                ]
+
+                written, conflicts = self._bulk_write(collection, operations)
+                checkpoint.details['conflicts'] = checkpoint.details.get('conflicts', 0) + conflicts
+                checkpoint.advance(documents[-1]['_id'], processed=written, failed=conflicts)
+                processed += len(documents)
+
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('card_number_index_backfill', duration, {'job_id': job_id, 'processed': processed})
+            return {'success': True, 'processed': processed, 'job': checkpoint.to_dict()}
+
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.fail(e)
+            log_error('CardMigrationError', str(e), details={'job_id': job_id})
+            return {'success': False, 'error': str(e)}
+
+    def compact_ciphertexts(self, job_id='card_ciphertext_compaction', dry_run=False, max_documents=None):
+        """Rewrite legacy double base64 card_number and cvv values in the v2 format
+
+        The Fernet token is unchanged, so no decryption is needed. Reports the
+        bytes saved; with dry_run the savings are computed without writing.
+        """
+        checkpoint = None
+        try:
+            if dry_run:
+                job_id = f"{job_id}_dry_run_{int(time.time())}"
+            checkpoint = MigrationCheckpoint.get_or_create(
+                job_id, 'card_ciphertext_compaction', {'bytes_before': 0, 'bytes_after': 0, 'dry_run': dry_run}
+            )
+            if checkpoint.is_completed():
+                return {'success': True, 'processed': 0, 'job': checkpoint.to_dict()}
+
+            current_pattern = re.compile('^(' + re.escape(CIPHERTEXT_V2_PREFIX) + '|' + re.escape(CIPHERTEXT_GCM_PREFIX) + ')')
+            query = {'$or': [{'card_number': {'$not': current_pattern}}, {'cvv': {'$not': current_pattern}}]}
+            collection = Card._get_collection()
+            start_time = time.monotonic()
+            processed = 0
+
+            for documents in self._iter_chunks(collection, checkpoint, query, {'card_number': 1, 'cvv': 1}, max_documents):
+                operations = []
+                bytes_before = 0
+                bytes_after = 0
+                for document in documents:
+                    updates = {}
+                    for field in ('card_number', 'cvv'):
+                        value = document.get(field)
+                        if value and encryption_service.is_legacy_ciphertext(value):
+                            updates[field] = encryption_service.upgrade_ciphertext(value)
+                            bytes_before += len(value)
+                            bytes_after += len(updates[field])
+                    if updates:
+                        # Only overwrite values that have not changed since they were read
+                        condition = {'_id': document['_id']}
+                        condition.update({field: document[field] for field in updates})
+                        operations.append(UpdateOne(condition, {'$set': updates}))
+
+                written, failed = (len(operations), 0) if dry_run else self._bulk_write(collection, operations)
+                checkpoint.details['bytes_before'] = checkpoint.details.get('bytes_before', 0) + bytes_before
+                checkpoint.details['bytes_after'] = checkpoint.details.get('bytes_after', 0) + bytes_after
+                checkpoint.advance(documents[-1]['_id'], processed=written, failed=failed)
+                processed += len(documents)
+
+            bytes_saved = checkpoint.details['bytes_before'] - checkpoint.details['bytes_after']
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('card_ciphertext_compaction', duration, {
+                'job_id': job_id, 'processed': processed, 'bytes_saved': bytes_saved, 'dry_run': dry_run
+            })
+            return {'success': True, 'processed': processed, 'bytes_saved': bytes_saved, 'job': checkpoint.to_dict()}
+
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.fail(e)
+            log_error('CardMigrationError', str(e), details={'job_id': job_id})
+            return {'success': False, 'error': str(e)}
+
+    def drop_reference_arrays(self, job_id='card_reference_array_removal', dry_run=False, max_documents=None):
+        """Remove the legacy transactions and emis reference arrays from cards
+
+        Transactions and EMIs are found through their indexed card_id, so the
+        arrays only made card documents grow. References whose document
+        points at another card (or no longer exists) are counted as orphaned
+        before the arrays are dropped. With dry_run nothing is written.
+        """
+        checkpoint = None
+        try:
+            if dry_run:
+                job_id = f"{job_id}_dry_run_{int(time.time())}"
+            checkpoint = MigrationCheckpoint.get_or_create(
+                job_id, 'card_reference_array_removal', {'references': 0, 'orphaned': 0, 'dry_run': dry_run}
+            )
+            if checkpoint.is_completed():
+                return {'success': True, 'processed': 0, 'job': checkpoint.to_dict()}
+
+            query = {'$or': [{'transactions': {'$exists': True}}, {'emis': {'$exists': True}}]}
+            collection = Card._get_collection()
+            start_time = time.monotonic()
+            processed = 0
+
+            for documents in self._iter_chunks(collection, checkpoint, query, {'transactions': 1, 'emis': 1}, max_documents):
+                references = 0
+                orphaned = 0
+                for field, model in (('transactions', Transaction), ('emis', EMI)):
+                    referenced = {}
+                    for document in documents:
+                        for reference in document.get(field) or []:
+                            # Stored as ObjectIds, or DBRefs by older writers
+                            referenced[getattr(reference, 'id', reference)] = document['_id']
+                    references += len(referenced)
+                    if referenced:
+                        linked = model._get_collection().find(
+                            {'_id': {'$in': list(referenced)}}, {'card_id': 1}
+                        )
+                        matching = sum(1 for linked_document in linked
+                                       if linked_document.get('card_id') == referenced[linked_document['_id']])
+                        orphaned += len(referenced) - matching
+
+                operations = [
+                    UpdateOne({'_id': document['_id']}, {'$unset': {'transactions': '', 'emis': ''}})
+                    for document in documents
+                ]
+                written, failed = (len(operations), 0) if dry_run else self._bulk_write(collection, operations)
+                checkpoint.details['references'] = checkpoint.details.get('references', 0) + references
+                checkpoint.details['orphaned'] = checkpoint.details.get('orphaned', 0) + orphaned
+                checkpoint.advance(documents[-1]['_id'], processed=written, failed=failed)
+                processed += len(documents)
+
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('card_reference_array_removal', duration, {
+                'job_id': job_id, 'processed': processed, 'references': checkpoint.details['references'],
+                'orphaned': checkpoint.details['orphaned'], 'dry_run': dry_run
+            })
+            return {
+                'success': True,
+                'processed': processed,
+                'references': checkpoint.details['references'],
+                'orphaned': checkpoint.details['orphaned'],
+                'job': checkpoint.to_dict()
+            }
+
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.fail(e)
+            log_error('CardMigrationError', str(e), details={'job_id': job_id})
+            return {'success': False, 'error': str(e)}
+
+    def rebuild_card_rollups(self, job_id='card_rollup_rebuild', max_documents=None):
+        """Recompute the daily analytics rollups of every card from its transactions
+
+        Backfills rollups for transactions completed before they were
+        maintained, and repairs drift. Each chunk of cards is aggregated on
+        the server, its rollups are upserted in place and days left without
+        transactions are removed. A transaction completing on one of those
+        cards while its chunk is rebuilt may be missed, so rebuild again if
+        cards were busy. A completed job_id is not run again; pass a new
+        job_id for another rebuild.
+        """
+        checkpoint = None
+        try:
+            checkpoint = MigrationCheckpoint.get_or_create(job_id, 'card_rollup_rebuild', {'rollups': 0})
+            if checkpoint.is_completed():
+                return {'success': True, 'processed': 0, 'job': checkpoint.to_dict()}
+
+            rollup_collection = CardDailyRollup._get_collection()
+            start_time = time.monotonic()
+            processed = 0
+
+            for documents in self._iter_chunks(Card._get_collection(), checkpoint, {}, {'_id': 1}, max_documents):
+                card_ids = [document['_id'] for document in documents]
+                rollups = {}
+                for group in Transaction._get_collection().aggregate([
+                    {'$match': {'card_id': {'$in': card_ids}, 'status': 'completed'}},
+                    {'$group': {
+                        '_id': {
+                            'card_id': '$card_id',
+                            'day': {'$dateFromParts': {
+                                'year': {'$year': '$transaction_date'},
+                                'month': {'$month': '$transaction_date'},
+                                'day': {'$dayOfMonth': '$transaction_date'}
+                            }},
+                            'category': '$merchant_category'
+                        },
+                        'user_id': {'$first': '$user_id'},
+                        'count': {'$sum': 1},
+                        'amount': {'$sum': '$amount'}
+                    }}
+                ]):
+                    key = (group['_id']['card_id'], group['_id']['day'])
+                    rollup = rollups.setdefault(key, {
+                        'card_id': key[0], 'user_id': group['user_id'], 'day': key[1],
+                        'count': 0, 'amount': 0.0, 'categories': {}, 'updated_at': datetime.utcnow()
+                    })
+                    category = rollup['categories'].setdefault(
+                        CardDailyRollup.category_key(group['_id']['category']), {'count': 0, 'amount': 0.0}
+                    )
+                    for totals in (rollup, category):
+                        totals['count'] += group['count']
+                        totals['amount'] += group['amount']
+
+                # Upserts rather than delete and insert, so a rollup re-created by a
+                # live transaction in between can't fail the unique (card_id, day) index
+                if rollups:
+                    rollup_collection.bulk_write([
+                        ReplaceOne({'card_id': card_id, 'day': day}, rollup, upsert=True)
+                        for (card_id, day), rollup in rollups.items()
+                    ], ordered=False)
+                days = {}
+                for card_id, day in rollups:
+                    days.setdefault(card_id, []).append(day)
+                rollup_collection.delete_many({'$or': [
+                    {'card_id': card_id, 'day': {'$nin': days.get(card_id, [])}} for card_id in card_ids
+                ]})
+                checkpoint.details['rollups'] = checkpoint.details.get('rollups', 0) + len(rollups)
+                checkpoint.advance(documents[-1]['_id'], processed=len(documents))
+                processed += len(documents)
+
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('card_rollup_rebuild', duration, {
+                'job_id': job_id, 'processed': processed, 'rollups': checkpoint.details['rollups']
+            })
+            return {'success': True, 'processed': processed, 'rollups': checkpoint.details['rollups'],
+                    'job': checkpoint.to_dict()}
+
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.fail(e)
+            log_error('CardMigrationError', str(e), details={'job_id': job_id})
+            return {'success': False, 'error': str(e)}
+
+    def _iter_chunks(self, collection, checkpoint, query, projection, max_documents=None):
+        """Yield chunks of documents after the checkpoint cursor, in _id order
+
+        Marks the checkpoint completed once the collection is exhausted. The
+        caller advances the cursor after handling each chunk.
+        """
+        processed = 0
+        while max_documents is None or processed < max_documents:
+            limit = self.chunk_size if max_documents is None else min(self.chunk_size, max_documents - processed)
+            chunk_query = dict(query)
+            if checkpoint.last_id:
+                chunk_query['_id'] = {'$gt': checkpoint.last_id}
+
+            documents = list(collection.find(chunk_query, projection).sort('_id', ASCENDING).limit(limit))
+            if not documents:
+                checkpoint.complete()
+                return
+
+            yield documents
+            processed += len(documents)
+
+    @staticmethod
+    def _bulk_write(collection, operations):
+        """Run unordered bulk updates, returning (modified, write errors)"""
+        if not operations:
+            return 0, 0
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            return result.modified_count, 0
+        except BulkWriteError as e:
+            return e.details.get('nModified', 0), len(e.details.get('writeErrors', []))
+
+# Global card migration service instance
+card_migration_service = CardMigrationService()
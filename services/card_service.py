@@ -2,14 +2,19 @@ from datetime import datetime, timedelta
 from models.card import Card
 from models.transaction import Transaction
 from models.notification import Notification
+from models.card_daily_rollup import CardDailyRollup
 from services.encryption import encryption_service
 from services.auth import log_authentication_event
+from services.risk_engine import risk_engine, TransactionEvent
+from services.credit_ledger import credit_ledger
+from services.tracing import traced
 import uuid
 
 class CardService:
     """Business logic service for credit card operations"""
     
     @staticmethod
+    @traced
     def create_card(user_id, card_data):
         """Create a new credit card with business logic validation"""
         try:
@@ -21,6 +26,10 @@ class CardService:
             if not CardService._validate_expiry_date(card_data['expiry_month'], card_data['expiry_year']):
                 return {'success': False, 'error': 'Card has expired or invalid expiry date'}
             
+            # Reject cards that are already registered
+            if Card.is_card_number_registered(card_data['card_number']):
+                return {'success': False, 'error': 'Card is already registered'}
+            
             # Check if user already has too many cards
             existing_cards = Card.objects(user_id=user_id, is_active=True).count()
             max_cards = 5  # Business rule: max 5 cards per user
@@ -71,25 +80,29 @@ class CardService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def process_transaction(card_id, transaction_data):
         """Process a credit card transaction with business logic"""
         try:
-            card = Card.objects.get(id=card_id)
+            # Credit state comes from the ledger cache instead of the card document
+            ledger = credit_ledger.entry(card_id)
+            if ledger is None:
+                return {'success': False, 'error': 'Card not found'}
             
             # Check if card is active and not blocked
-            if not card.is_active or card.is_blocked:
+            if not ledger.usable:
                 return {'success': False, 'error': 'Card is not active or is blocked'}
             
             # Check available credit
-            if transaction_data['amount'] > card.available_credit:
+            if transaction_data['amount'] > ledger.available:
                 return {'success': False, 'error': 'Insufficient credit limit'}
             
             # Check for suspicious activity
-            if CardService._is_suspicious_transaction(card, transaction_data):
+            if CardService._is_suspicious_transaction(ledger, transaction_data):
                 # Block card and notify user
-                card.block_card()
+                Card.objects.get(id=card_id).block_card()
                 Notification.create_notification(
-                    user_id=card.user_id,
+                    user_id=ledger.user_id,
                     title="Suspicious Activity Detected",
                     message="Your card has been temporarily blocked due to suspicious activity. Please contact support.",
                     notification_type="security",
@@ -99,7 +112,7 @@ class CardService:
             
             # Create transaction
             transaction = Transaction.create_transaction(
-                user_id=card.user_id,
+                user_id=ledger.user_id,
                 card_id=card_id,
                 transaction_id=f"TXN_{uuid.uuid4().hex[:12].upper()}",
                 merchant_name=transaction_data['merchant_name'],
@@ -117,17 +130,29 @@ class CardService:
             transaction.is_recurring = transaction_data.get('is_recurring', False)
             transaction.is_international = transaction_data.get('is_international', False)
             
-            # Process transaction
-            transaction.process_transaction()
+            # Reserve the amount on the credit ledger
+            hold = credit_ledger.authorize(card_id, transaction_data['amount'])
+            if not hold['success']:
+                return {'success': False, 'error': hold['error']}
             
-            # Update card balance
-            card.update_balance(transaction_data['amount'], 'debit')
-            card.last_used = datetime.utcnow()
-            card.save()
+            # Debit the card before completing the transaction
+            capture = credit_ledger.capture(card_id, hold['hold_id'])
+            if not capture['success']:
+                return {'success': False, 'error': capture['error']}
+            
+            # Process transaction, refunding the card if it could not be completed
+            try:
+                transaction.process_transaction()
+            except Exception:
+                credit_ledger.apply_credit(card_id, capture['amount'])
+                raise
+            
+            # Only completed debits count towards the card's risk windows
+            risk_engine.record(TransactionEvent.from_transaction_data(ledger, transaction_data))
             
             # Create notification
             Notification.create_notification(
-                user_id=card.user_id,
+                user_id=ledger.user_id,
                 title="Transaction Alert",
                 message=f"Transaction of {transaction.get_formatted_amount()} at {transaction.merchant_name}",
                 notification_type="transaction",
@@ -144,6 +169,7 @@ class CardService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def block_card(card_id, reason="User requested"):
         """Block a credit card with business logic"""
         try:
@@ -175,6 +201,7 @@ class CardService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def unblock_card(card_id):
         """Unblock a credit card with business logic"""
         try:
@@ -198,6 +225,7 @@ class CardService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def update_pin(card_id, old_pin, new_pin):
         """Update card PIN with security validation"""
         try:
@@ -240,42 +268,45 @@ class CardService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def get_card_analytics(card_id, days=30):
         """Get analytics for a specific card"""
         try:
-            card = Card.objects.get(id=card_id)
+            card = Card.get_summary(id=card_id)
             end_date = datetime.utcnow()
             start_date = end_date - timedelta(days=days)
             
-            # Get transactions
-            transactions = Transaction.objects(
-                card_id=card_id,
-                transaction_date__gte=start_date,
-                transaction_date__lte=end_date,
-                status='completed'
-            )
+            # Read the card's daily rollups instead of every transaction in the window
+            rollups = CardDailyRollup.objects(
+                card_id=card.id,
+                day__gte=CardDailyRollup.day_of(start_date),
+                day__lte=end_date
+            ).only('day', 'count', 'amount', 'categories').as_pymongo()
             
             # Calculate analytics
-            total_spent = sum(t.amount for t in transactions)
-            transaction_count = len(transactions)
-            avg_transaction = total_spent / transaction_count if transaction_count > 0 else 0
-            
-            # Category breakdown
+            total_spent = 0.0
+            transaction_count = 0
             category_breakdown = {}
-            for transaction in transactions:
-                category = transaction.merchant_category
-                if category not in category_breakdown:
-                    category_breakdown[category] = {'count': 0, 'amount': 0}
-                category_breakdown[category]['count'] += 1
-                category_breakdown[category]['amount'] += transaction.amount
-            
-            # Monthly spending trend
             monthly_spending = {}
-            for transaction in transactions:
-                month_key = transaction.transaction_date.strftime('%Y-%m')
-                if month_key not in monthly_spending:
-                    monthly_spending[month_key] = 0
-                monthly_spending[month_key] += transaction.amount
+            for rollup in rollups:
+                total_spent += rollup.get('amount', 0.0)
+                transaction_count += rollup.get('count', 0)
+                
+                # Category breakdown
+                for category, totals in (rollup.get('categories') or {}).items():
+                    if not totals.get('count'):
+                        continue
+                    if category not in category_breakdown:
+                        category_breakdown[category] = {'count': 0, 'amount': 0}
+                    category_breakdown[category]['count'] += totals['count']
+                    category_breakdown[category]['amount'] += totals.get('amount', 0.0)
+                
+                # Monthly spending trend
+                month_key = rollup['day'].strftime('%Y-%m')
+                if rollup.get('count'):
+                    monthly_spending[month_key] = monthly_spending.get(month_key, 0) + rollup.get('amount', 0.0)
+            
+            avg_transaction = total_spent / transaction_count if transaction_count > 0 else 0
             
             return {
                 'success': True,
@@ -286,7 +317,7 @@ class CardService:
                     'average_transaction': float(avg_transaction),
                     'category_breakdown': category_breakdown,
                     'monthly_spending': monthly_spending,
-                    'credit_utilization': (card.outstanding_balance / card.credit_limit) * 100 if card.credit_limit > 0 else 0
+                    'credit_utilization': card.get_credit_utilization()
                 }
             }
             
@@ -341,23 +372,19 @@ class CardService:
     
     @staticmethod
     def _is_suspicious_transaction(card, transaction_data):
-        """Check for suspicious transaction patterns"""
-        # Check for high-value transactions
-        if transaction_data['amount'] > card.credit_limit * 0.8:  # 80% of credit limit
-            return True
-        
-        # Check for multiple transactions in short time
-        recent_transactions = Transaction.objects(
-            card_id=card.id,
-            transaction_date__gte=datetime.utcnow() - timedelta(minutes=10),
-            status='completed'
-        ).count()
+        """Check for suspicious transaction patterns
         
-        if recent_transactions > 5:  # More than 5 transactions in 10 minutes
-            return True
-        
-        # Check for international transactions if not expected
-        if transaction_data.get('is_international') and not card.is_international:
-            return True
-        
-        return False
+        Scored by the in-memory risk engine (high value, velocity, spend,
+        international use and novelty rules) instead of database queries.
+        card may be a Card or its credit ledger entry. The event is not
+        recorded here; callers record it once the debit has gone through.
+        """
+        assessment = risk_engine.assess(TransactionEvent.from_transaction_data(card, transaction_data), record=False)
+        if assessment.suspicious:
+            log_authentication_event(
+                user_id=str(card.user_id),
+                event_type="suspicious_transaction",
+                success=False,
+                details={'card_id': str(card.id), **assessment.to_dict()}
+            )
+        return assessment.suspicious
@@ -0,0 +1,107 @@
+import os
+import base64
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Stored ciphertext formats: v1 is base64 of the Fernet token (legacy),
+# v2 is the Fernet token itself, which is already urlsafe base64,
+# g1 is AES-GCM as "g1:<key version>:<base64 nonce + ciphertext + tag>"
+CIPHERTEXT_V2_PREFIX = 'v2:'
+CIPHERTEXT_GCM_PREFIX = 'g1:'
+GCM_NONCE_SIZE = 12
+
+class CipherBackend:
+    """Base class for pluggable ciphertext formats
+
+    Backends get key material from the owning EncryptionService, so the key
+    ring, caching and rotation work the same for every format.
+    """
+
+    name = None
+    prefix = None
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def handles(self, encrypted_data: str) -> bool:
+        """Check if a stored value was produced by this backend"""
+        return encrypted_data.startswith(self.prefix)
+
+    def encrypt(self, plaintext: bytes, field: str, associated_data: bytes = None) -> str:
+        """Encrypt plaintext for a field kind, returning the stored string"""
+        raise NotImplementedError
+
+    def decrypt(self, encrypted_data: str, field: str, associated_data: bytes = None) -> bytes:
+        """Decrypt a stored string produced by this backend"""
+        raise NotImplementedError
+
+class FernetCipher(CipherBackend):
+    """Fernet (AES-128-CBC + HMAC-SHA256) backend
+
+    Fernet has no associated data, so ``field`` and ``associated_data`` are
+    ignored. Also reads the legacy double base64 v1 format.
+    """
+
+    name = 'fernet'
+    prefix = CIPHERTEXT_V2_PREFIX
+
+    def handles(self, encrypted_data: str) -> bool:
+        """Fernet owns v2 values and unprefixed legacy v1 values"""
+        return not encrypted_data.startswith(CIPHERTEXT_GCM_PREFIX)
+
+    @staticmethod
+    def wrap_token(token: bytes) -> str:
+        """Serialize a Fernet token in the compact v2 format"""
+        return CIPHERTEXT_V2_PREFIX + token.decode()
+
+    @staticmethod
+    def unwrap_token(encrypted_data: str) -> bytes:
+        """Extract the Fernet token from a v2 or legacy v1 ciphertext"""
+        if encrypted_data.startswith(CIPHERTEXT_V2_PREFIX):
+            return encrypted_data[len(CIPHERTEXT_V2_PREFIX):].encode()
+        return base64.urlsafe_b64decode(encrypted_data.encode())
+
+    def encrypt(self, plaintext: bytes, field: str, associated_data: bytes = None) -> str:
+        return self.wrap_token(self.keys._get_fernet_key().encrypt(plaintext))
+
+    def decrypt(self, encrypted_data: str, field: str, associated_data: bytes = None) -> bytes:
+        return self.keys._get_decryptor().decrypt(self.unwrap_token(encrypted_data))
+
+    def rotate(self, encrypted_data: str) -> str:
+        """Re-encrypt under the active key without exposing plaintext"""
+        # MultiFernet.rotate encrypts under its first key, which is the active one
+        return self.wrap_token(self.keys._get_decryptor().rotate(self.unwrap_token(encrypted_data)))
+
+class AESGCMCipher(CipherBackend):
+    """AES-256-GCM backend with per-field data keys
+
+    Each field kind (card number, CVV, PIN, ...) is encrypted under its own
+    data key derived from the versioned master key, and the key version is
+    recorded in the ciphertext. Callers bind a value to its document by
+    passing the document id as associated data.
+    """
+
+    name = 'aes-gcm'
+    prefix = CIPHERTEXT_GCM_PREFIX
+
+    def encrypt(self, plaintext: bytes, field: str, associated_data: bytes = None) -> str:
+        version = self.keys.active_key_version
+        nonce = os.urandom(GCM_NONCE_SIZE)
+        ciphertext = self.keys._get_data_key(field, version).encrypt(nonce, plaintext, associated_data)
+        return f"{self.prefix}{version}:{base64.urlsafe_b64encode(nonce + ciphertext).decode()}"
+
+    def decrypt(self, encrypted_data: str, field: str, associated_data: bytes = None) -> bytes:
+        version, _, payload = encrypted_data[len(self.prefix):].partition(':')
+        data = base64.urlsafe_b64decode(payload.encode())
+        nonce, ciphertext = data[:GCM_NONCE_SIZE], data[GCM_NONCE_SIZE:]
+        return self.keys._get_data_key(field, int(version)).decrypt(nonce, ciphertext, associated_data)
+
+    @staticmethod
+    def key_version(encrypted_data: str) -> int:
+        """Read the key version recorded in a GCM ciphertext"""
+        return int(encrypted_data[len(CIPHERTEXT_GCM_PREFIX):].partition(':')[0])
+
+# Backends selectable through ENCRYPTION_CIPHER
+CIPHER_BACKENDS = {
+    FernetCipher.name: FernetCipher,
+    AESGCMCipher.name: AESGCMCipher
+}
@@ -0,0 +1,431 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from models.card import Card
+from models.credit_ledger import CreditLedger
+from services.tracing import span
+
+# How long an authorization hold reserves credit before it lapses
+LEDGER_HOLD_TTL_SECONDS = int(os.environ.get('LEDGER_HOLD_TTL_SECONDS', '900'))
+LEDGER_CACHE_SIZE = int(os.environ.get('LEDGER_CACHE_SIZE', '100000'))
+# Cached entries older than this are re-read, so changes made by other workers show up
+LEDGER_CACHE_TTL_SECONDS = float(os.environ.get('LEDGER_CACHE_TTL_SECONDS', '30'))
+LEDGER_RECONCILE_INTERVAL = int(os.environ.get('LEDGER_RECONCILE_INTERVAL', '300'))
+LEDGER_RECONCILE_BATCH = int(os.environ.get('LEDGER_RECONCILE_BATCH', '500'))
+# Ledgers written more recently than this may have a capture still updating the card
+LEDGER_RECONCILE_GRACE_SECONDS = 5
+
+# Card fields a ledger is built from
+CARD_LEDGER_FIELDS = ('user_id', 'credit_limit', 'outstanding_balance', 'is_active', 'is_blocked', 'is_international')
+
+def _card_state(card):
+    """Ledger fields derived from a card document"""
+    return {
+        'user_id': card['user_id'],
+        'credit_limit': float(card.get('credit_limit', 0.0)),
+        'outstanding_balance': float(card.get('outstanding_balance', 0.0)),
+        'is_usable': bool(card.get('is_active', True)) and not card.get('is_blocked', False),
+        'is_international': bool(card.get('is_international', True))
+    }
+
+class LedgerEntry:
+    """Cached credit state of one card
+
+    Exposes id, user_id, credit_limit and is_international like a Card, so
+    an entry can stand in for the card in fraud scoring.
+    """
+
+    __slots__ = ('id', 'user_id', 'credit_limit', 'outstanding', 'held', 'holds', 'usable',
+                 'is_international', 'loaded_at')
+
+    def __init__(self, document):
+        self.update(document)
+
+    def update(self, document):
+        self.id = document['card_id']
+        self.user_id = document['user_id']
+        self.credit_limit = document.get('credit_limit', 0.0)
+        self.outstanding = document.get('outstanding_balance', 0.0)
+        self.held = document.get('held_amount', 0.0)
+        # hold_id -> (amount, expires_at)
+        self.holds = {hold_id: (hold['amount'], hold['expires_at'])
+                      for hold_id, hold in (document.get('holds') or {}).items()}
+        self.usable = document.get('is_usable', True)
+        self.is_international = document.get('is_international', True)
+        self.loaded_at = time.monotonic()
+
+    @property
+    def available(self):
+        return self.credit_limit - self.outstanding - self.held
+
+    def expired_holds(self, now):
+        """Holds that have lapsed, as hold_id -> amount"""
+        return {hold_id: amount for hold_id, (amount, expires_at) in self.holds.items() if expires_at <= now}
+
+class CreditLedgerService:
+    """Per-card credit ledger with authorization holds
+
+    A debit first places a hold on the card's ledger, then either captures
+    it (the amount is added to the outstanding balance of the ledger and
+    the card) or releases it. Ledgers are small documents guarded by
+    find_one_and_update, and a write-through LRU cache of them answers
+    credit checks in memory without reading the card. Card stays the
+    source of truth: reconcile() realigns every ledger with its card and
+    drops holds that expired without being captured or released.
+    """
+
+    def __init__(self, hold_ttl=None, cache_size=None, cache_ttl=None):
+        self.hold_ttl = LEDGER_HOLD_TTL_SECONDS if hold_ttl is None else hold_ttl
+        self.cache_size = LEDGER_CACHE_SIZE if cache_size is None else cache_size
+        self.cache_ttl = LEDGER_CACHE_TTL_SECONDS if cache_ttl is None else cache_ttl
+        self._entries = OrderedDict()  # card id string -> LedgerEntry, least recently used first
+        self._lock = threading.Lock()
+        self._reconciler = None
+        self._stopped = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    # Cache
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.loaded_at > self.cache_ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _cache(self, document):
+        key = str(document['card_id'])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = LedgerEntry(document)
+            else:
+                entry.update(document)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, card_id=None):
+        """Drop one card's cached entry, or every entry"""
+        with self._lock:
+            if card_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(card_id), None)
+
+    def _collection(self):
+        return CreditLedger._get_collection()
+
+    def _load(self, card_id):
+        """Read a card's ledger, creating it from the card on first use"""
+        card_id = ObjectId(card_id) if not isinstance(card_id, ObjectId) else card_id
+        with span('CreditLedger.load'):
+            document = self._collection().find_one({'card_id': card_id})
+            if document is None:
+                card = Card.objects(id=card_id).only(*CARD_LEDGER_FIELDS).as_pymongo().first()
+                if card is None:
+                    return None
+                now = datetime.utcnow()
+                ledger = dict(_card_state(card), card_id=card_id, held_amount=0.0, holds={},
+                              reconciled_at=now, created_at=now, updated_at=now)
+                document = self._collection().find_one_and_update(
+                    {'card_id': card_id},
+                    {'$setOnInsert': ledger},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+        return self._cache(document)
+
+    def entry(self, card_id):
+        """Cached ledger entry of a card, or None if the card doesn't exist"""
+        return self._cached(str(card_id)) or self._load(card_id)
+
+    # Credit checks
+
+    def check(self, card_id, amount, user_id=None):
+        """Whether a hold of amount would currently be accepted, answered from memory"""
+        entry = self.entry(card_id)
+        return (entry is not None and entry.usable and entry.available >= amount
+                and (user_id is None or str(entry.user_id) == str(user_id)))
+
+    def authorize(self, card_id, amount, user_id=None, ttl=None):
+        """Place a hold of amount on a card if it has enough available credit
+
+        With user_id, cards owned by someone else are reported as not found.
+        Returns {'success': True, 'hold_id': ...} or an error.
+        """
+        amount = float(amount)
+        now = datetime.utcnow()
+        entry = self._cached(str(card_id))
+        if entry is not None and (not entry.usable or entry.available < amount) and not entry.expired_holds(now):
+            # The cached entry can be up to cache_ttl behind writes made by
+            # other workers (payments, released holds); decline only on a fresh read
+            entry = None
+        if entry is None:
+            entry = self._load(card_id)
+        if entry is None or (user_id is not None and str(entry.user_id) != str(user_id)):
+            return {'success': False, 'error': 'Card not found'}
+        if not entry.usable:
+            return {'success': False, 'error': 'Card is not active or is blocked'}
+
+        if entry.expired_holds(now):
+            entry = self._expire(entry, now)
+        # Over-limit requests are declined after at most one read, without a write
+        if entry.available < amount:
+            return {'success': False, 'error': 'Insufficient credit limit'}
+
+        hold_id = uuid.uuid4().hex
+        expires_at = now + timedelta(seconds=self.hold_ttl if ttl is None else ttl)
+        with span('CreditLedger.authorize'):
+            document = self._collection().find_one_and_update(
+                {
+                    'card_id': entry.id,
+                    'is_usable': True,
+                    '$expr': {'$gte': [
+                        {'$subtract': ['$credit_limit', {'$add': ['$outstanding_balance', '$held_amount']}]},
+                        amount
+                    ]}
+                },
+                {
+                    '$set': {f'holds.{hold_id}': {'amount': amount, 'expires_at': expires_at}, 'updated_at': now},
+                    '$inc': {'held_amount': amount}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+        if document is None:
+            # Another worker changed the ledger since it was cached
+            entry = self._load(entry.id)
+            if entry is None:
+                return {'success': False, 'error': 'Card not found'}
+            if not entry.usable:
+                return {'success': False, 'error': 'Card is not active or is blocked'}
+            return {'success': False, 'error': 'Insufficient credit limit'}
+
+        entry = self._cache(document)
+        return {
+            'success': True,
+            'hold_id': hold_id,
+            'amount': amount,
+            'expires_at': expires_at.isoformat(),
+            'available_credit': entry.available
+        }
+
+    def _remove_holds(self, entry, holds, outstanding=0.0):
+        """Atomically drop holds (hold_id -> amount) and add to the outstanding balance
+
+        Returns the updated document, or None if any of the holds is gone.
+        """
+        query = {'card_id': entry.id}
+        unset = {}
+        for hold_id in holds:
+            query[f'holds.{hold_id}'] = {'$exists': True}
+            unset[f'holds.{hold_id}'] = ''
+        increments = {'held_amount': -sum(holds.values())}
+        if outstanding:
+            increments['outstanding_balance'] = outstanding
+        return self._collection().find_one_and_update(
+            query,
+            {'$unset': unset, '$inc': increments, '$set': {'updated_at': datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _expire(self, entry, now):
+        """Drop an entry's lapsed holds and return the fresh entry"""
+        document = self._remove_holds(entry, entry.expired_holds(now))
+        if document is None:
+            return self._load(entry.id) or entry
+        return self._cache(document)
+
+    def _hold(self, card_id, hold_id):
+        """Entry and held amount of a hold, re-reading the ledger if it isn't cached"""
+        entry = self.entry(card_id)
+        if entry is not None and hold_id not in entry.holds:
+            entry = self._load(card_id)
+        if entry is None:
+            return None, None
+        hold = entry.holds.get(hold_id)
+        return entry, hold[0] if hold is not None else None
+
+    def capture(self, card_id, hold_id, amount=None):
+        """Turn a hold into a debit of the card
+
+        Captures the full held amount unless a smaller amount is given;
+        the rest of the hold is released. Fails if the hold is gone or the
+        card could not be debited, in which case nothing was charged.
+        """
+        entry, held = self._hold(card_id, hold_id)
+        if held is None:
+            return {'success': False, 'error': 'Hold not found or expired'}
+        amount = held if amount is None else float(amount)
+        if amount > held:
+            return {'success': False, 'error': 'Capture amount cannot exceed the held amount'}
+
+        with span('CreditLedger.capture'):
+            document = self._remove_holds(entry, {hold_id: held}, outstanding=amount)
+            if document is None:
+                self.invalidate(card_id)
+                return {'success': False, 'error': 'Hold not found or expired'}
+            entry = self._cache(document)
+            if Card.apply_balance_change(entry.id, amount, 'debit', touch=True) is None:
+                # Card is gone; take the debit back off the ledger
+                self._collection().update_one(
+                    {'card_id': entry.id},
+                    {'$inc': {'outstanding_balance': -amount}, '$set': {'updated_at': datetime.utcnow()}}
+                )
+                self.invalidate(card_id)
+                return {'success': False, 'error': 'Card not found'}
+        return {'success': True, 'amount': amount, 'available_credit': entry.available}
+
+    def release(self, card_id, hold_id):
+        """Give the credit reserved by a hold back without debiting the card"""
+        entry, held = self._hold(card_id, hold_id)
+        if held is None:
+            return {'success': False, 'error': 'Hold not found or expired'}
+        with span('CreditLedger.release'):
+            document = self._remove_holds(entry, {hold_id: held})
+        if document is None:
+            self.invalidate(card_id)
+            return {'success': False, 'error': 'Hold not found or expired'}
+        entry = self._cache(document)
+        return {'success': True, 'amount': held, 'available_credit': entry.available}
+
+    def apply_credit(self, card_id, amount):
+        """Credit a card (refunds, payments) on the card and its ledger"""
+        card_id = ObjectId(card_id) if not isinstance(card_id, ObjectId) else card_id
+        card = Card.apply_balance_change(card_id, amount, 'credit')
+        if card is None:
+            return {'success': False, 'error': 'Card not found'}
+        document = self._collection().find_one_and_update(
+            {'card_id': card_id},
+            [{'$set': {
+                'outstanding_balance': {'$max': [{'$subtract': ['$outstanding_balance', float(amount)]}, 0]},
+                'updated_at': datetime.utcnow()
+            }}],
+            return_document=ReturnDocument.AFTER
+        )
+        if document is not None:
+            self._cache(document)
+        return {'success': True, 'available_credit': card['available_credit']}
+
+    def sync_card(self, card):
+        """Copy a saved card's limit and status onto its ledger, if it has one"""
+        state = {
+            'credit_limit': float(card.credit_limit),
+            'is_usable': bool(card.is_active) and not card.is_blocked,
+            'is_international': bool(card.is_international)
+        }
+        state['updated_at'] = datetime.utcnow()
+        document = self._collection().find_one_and_update(
+            {'card_id': card.id},
+            {'$set': state},
+            return_document=ReturnDocument.AFTER
+        )
+        if document is not None:
+            self._cache(document)
+
+    def set_usable(self, card_ids, usable):
+        """Mark the ledgers of many cards usable or not after a bulk status change"""
+        card_ids = [ObjectId(card_id) if not isinstance(card_id, ObjectId) else card_id for card_id in card_ids]
+        self._collection().update_many(
+            {'card_id': {'$in': card_ids}},
+            {'$set': {'is_usable': usable, 'updated_at': datetime.utcnow()}}
+        )
+        for card_id in card_ids:
+            self.invalidate(card_id)
+
+    # Reconciliation
+
+    def reconcile(self, batch_size=None, grace=None):
+        """Realign every ledger with its card and drop expired holds
+
+        Ledgers written in the last grace seconds, or changed while being
+        checked, are left for the next run. Returns counts of checked and
+        corrected ledgers.
+        """
+        batch_size = batch_size or LEDGER_RECONCILE_BATCH
+        grace = timedelta(seconds=LEDGER_RECONCILE_GRACE_SECONDS if grace is None else grace)
+        collection = self._collection()
+        checked = corrected = expired = 0
+        last_id = None
+        while True:
+            query = {} if last_id is None else {'_id': {'$gt': last_id}}
+            ledgers = list(collection.find(query).sort('_id', 1).limit(batch_size))
+            if not ledgers:
+                break
+            last_id = ledgers[-1]['_id']
+            cards = {card['_id']: card for card in Card.objects(
+                id__in=[ledger['card_id'] for ledger in ledgers]
+            ).only(*CARD_LEDGER_FIELDS).as_pymongo()}
+
+            now = datetime.utcnow()
+            for ledger in ledgers:
+                checked += 1
+                if ledger.get('updated_at') and ledger['updated_at'] > now - grace:
+                    continue
+                card = cards.get(ledger['card_id'])
+                holds = ledger.get('holds') or {}
+                live = {hold_id: hold for hold_id, hold in holds.items() if hold['expires_at'] > now}
+                if card is not None:
+                    expected = _card_state(card)
+                else:
+                    # Card was removed; nothing may be authorized against it
+                    expected = dict(_card_state({'user_id': ledger['user_id']}), is_usable=False)
+                expected['holds'] = live
+                expected['held_amount'] = float(sum(hold['amount'] for hold in live.values()))
+                if all(ledger.get(field) == value for field, value in expected.items()):
+                    continue
+
+                result = collection.update_one(
+                    {'_id': ledger['_id'], 'updated_at': ledger.get('updated_at')},
+                    {'$set': dict(expected, reconciled_at=now, updated_at=now)}
+                )
+                if result.modified_count:
+                    corrected += 1
+                    expired += len(holds) - len(live)
+                    self.invalidate(ledger['card_id'])
+
+        return {'success': True, 'checked': checked, 'corrected': corrected, 'expired_holds': expired}
+
+    def start_reconciler(self, interval=None):
+        """Reconcile in a background thread every interval seconds"""
+        from services.logging_service import log_error
+
+        interval = LEDGER_RECONCILE_INTERVAL if interval is None else interval
+        if self._reconciler is not None:
+            return self._reconciler
+
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    log_error('credit_ledger_reconcile', str(e))
+
+        self._stopped.clear()
+        self._reconciler = threading.Thread(target=run, name='credit-ledger-reconciler', daemon=True)
+        self._reconciler.start()
+        return self._reconciler
+
+    def stop_reconciler(self):
+        """Stop the background reconciler"""
+        self._stopped.set()
+        if self._reconciler is not None:
+            self._reconciler.join()
+            self._reconciler = None
+
+    def get_stats(self):
+        """Cache size and hit counters"""
+        return {'cached_cards': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+# Global credit ledger instance
+credit_ledger = CreditLedgerService()
@@ -0,0 +1,250 @@
+import os
+import threading
+from bson import encode as bson_encode
+from flask import request, g
+from pymongo import monitoring
+
+# Commands that read documents and can be checked for collection scans
+READ_COMMANDS = ('find', 'count', 'distinct', 'aggregate')
+# Repeats of the same query shape in one request that count as an N+1 pattern
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_PROFILER_N_PLUS_ONE', '5'))
+
+def query_shape(value):
+    """Reduce a filter to its field structure, so queries differing only in values match"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, query_shape(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(query_shape(item) for item in value[:1])
+    return None
+
+def _filter_fields(query):
+    """Top-level field names a filter restricts on, including inside $and/$or"""
+    fields = set()
+    for key, value in (query or {}).items():
+        if key in ('$and', '$or') and isinstance(value, list):
+            for clause in value:
+                fields |= _filter_fields(clause)
+        elif not key.startswith('$'):
+            fields.add(key)
+    return fields
+
+class RequestDBProfile:
+    """Database commands issued while serving one request"""
+
+    __slots__ = ('endpoint', 'pending', 'commands', 'total_us', 'documents', 'bytes',
+                 'breakdown', 'shapes', 'collection_scans')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.pending = {}  # request_id -> (command name, collection, shape, scan)
+        self.commands = 0
+        self.total_us = 0
+        self.documents = 0
+        self.bytes = 0
+        self.breakdown = {}  # "collection.command" -> [count, duration_us]
+        self.shapes = {}  # (command, collection, shape) -> count
+        self.collection_scans = []
+
+    @property
+    def total_ms(self):
+        return self.total_us / 1000
+
+    def n_plus_one(self, threshold=None):
+        """Query shapes repeated at least threshold times in this request"""
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return [
+            {'command': command, 'collection': collection, 'count': count}
+            for (command, collection, _), count in self.shapes.items()
+            if count >= threshold
+        ]
+
+    def header_value(self):
+        """Compact per-collection breakdown for the X-DB-Profile header"""
+        parts = [f'total={self.total_ms:.2f}ms', f'commands={self.commands}']
+        for key, (count, duration_us) in sorted(self.breakdown.items(), key=lambda item: -item[1][1]):
+            parts.append(f'{key}={duration_us / 1000:.2f}ms/{count}')
+        return ';'.join(parts)
+
+    def to_dict(self):
+        """Convert the profile to a dictionary for the performance log"""
+        return {
+            'endpoint': self.endpoint,
+            'commands': self.commands,
+            'db_time_ms': self.total_ms,
+            'documents_returned': self.documents,
+            'reply_bytes': self.bytes,
+            'breakdown': {
+                key: {'count': count, 'duration_ms': duration_us / 1000}
+                for key, (count, duration_us) in self.breakdown.items()
+            },
+            'collection_scans': self.collection_scans,
+            'n_plus_one': self.n_plus_one()
+        }
+
+class CommandProfiler(monitoring.CommandListener):
+    """pymongo command listener attributing database time to the current request
+
+    pymongo publishes command events on the thread that runs the command,
+    which for this app is the request thread, so the active profile lives
+    in a thread local set by the request hooks.
+    """
+
+    def __init__(self, measure_bytes=None):
+        self.measure_bytes = measure_bytes if measure_bytes is not None else \
+            os.environ.get('DB_PROFILER_MEASURE_BYTES', 'true').lower() == 'true'
+        self._local = threading.local()
+        self._indexed_fields = None
+
+    # Request scope
+
+    def begin(self, endpoint):
+        """Start profiling commands issued by the current thread"""
+        profile = RequestDBProfile(endpoint)
+        self._local.profile = profile
+        return profile
+
+    def end(self):
+        """Stop profiling the current thread and return its profile"""
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        return profile
+
+    def current(self):
+        """Profile of the request being served by this thread, if any"""
+        return getattr(self._local, 'profile', None)
+
+    # CommandListener interface
+
+    def started(self, event):
+        profile = self.current()
+        if profile is None:
+            return
+        command_name = event.command_name
+        collection = event.command.get(command_name)
+        if not isinstance(collection, str):
+            collection = event.database_name
+        query = self._command_filter(command_name, event.command)
+        scan = command_name in READ_COMMANDS and self._is_collection_scan(collection, query)
+        profile.pending[event.request_id] = (command_name, collection, query_shape(query), scan)
+
+    def succeeded(self, event):
+        self._finish(event, getattr(event, 'reply', None))
+
+    def failed(self, event):
+        self._finish(event, None)
+
+    def _finish(self, event, reply):
+        profile = self.current()
+        if profile is None:
+            return
+        command_name, collection, shape, scan = profile.pending.pop(
+            event.request_id, (event.command_name, event.database_name, None, False)
+        )
+        duration_us = event.duration_micros
+        profile.commands += 1
+        profile.total_us += duration_us
+
+        key = f'{collection}.{command_name}'
+        entry = profile.breakdown.setdefault(key, [0, 0])
+        entry[0] += 1
+        entry[1] += duration_us
+
+        if command_name in READ_COMMANDS:
+            shape_key = (command_name, collection, shape)
+            profile.shapes[shape_key] = profile.shapes.get(shape_key, 0) + 1
+        if scan and collection not in profile.collection_scans:
+            profile.collection_scans.append(collection)
+
+        if reply:
+            cursor = reply.get('cursor')
+            if isinstance(cursor, dict):
+                profile.documents += len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+            if self.measure_bytes:
+                profile.bytes += len(bson_encode(reply))
+
+    # Collection scan detection
+
+    @staticmethod
+    def _command_filter(command_name, command):
+        """Extract the filter of a read command"""
+        if command_name == 'find':
+            return command.get('filter') or {}
+        if command_name in ('count', 'distinct'):
+            return command.get('query') or {}
+        if command_name == 'aggregate':
+            pipeline = command.get('pipeline') or []
+            if pipeline and '$match' in pipeline[0]:
+                return pipeline[0]['$match']
+            return {}
+        return None
+
+    def _is_collection_scan(self, collection, query):
+        """Check if no index can serve the filter
+
+        Uses the index definitions declared on the mongoengine documents, so
+        no extra database round trip is needed.
+        """
+        if query is None:
+            return False
+        fields = _filter_fields(query)
+        if not fields:
+            return True
+        indexed = self._get_indexed_fields().get(collection)
+        if indexed is None:
+            return False  # Collection not declared by a document; cannot tell
+        return not (fields & indexed)
+
+    def _get_indexed_fields(self):
+        """Leading field of every declared index, per collection"""
+        if self._indexed_fields is None:
+            from mongoengine.base import _document_registry
+            indexed_fields = {}
+            for document in list(_document_registry.values()):
+                if document._meta.get('abstract') or not hasattr(document, '_get_collection_name'):
+                    continue
+                collection = document._get_collection_name()
+                if not collection:
+                    continue
+                fields = indexed_fields.setdefault(collection, {'_id'})
+                for spec in document._meta.get('index_specs') or []:
+                    fields.add(spec['fields'][0][0])
+            self._indexed_fields = indexed_fields
+        return self._indexed_fields
+
+def init_app(app, profiler=None):
+    """Profile the database commands of every request
+
+    Adds an X-DB-Profile response header when the app runs in debug mode or
+    DB_PROFILER_HEADER is set, and logs the breakdown to the performance log.
+    """
+    from services.logging_service import log_performance
+
+    profiler = profiler or command_profiler
+    if not app.config.get('DB_PROFILER_ENABLED', True):
+        return profiler
+    send_header = app.debug or app.config.get('DB_PROFILER_HEADER', False)
+
+    @app.before_request
+    def _begin_db_profile():
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g._db_profile = profiler.begin(endpoint)
+
+    @app.after_request
+    def _add_db_profile_header(response):
+        profile = g.get('_db_profile')
+        if profile is not None and send_header:
+            response.headers['X-DB-Profile'] = profile.header_value()
+        return response
+
+    @app.teardown_request
+    def _end_db_profile(error=None):
+        profile = profiler.end()
+        g.pop('_db_profile', None)
+        if profile is not None and profile.commands:
+            log_performance('db_request', profile.total_ms, profile.to_dict())
+
+    return profiler
+
+# Global command profiler; registered before any MongoClient is created
+command_profiler = CommandProfiler()
+monitoring.register(command_profiler)
@@ -1,10 +1,35 @@
 import os
 import base64
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
+import hmac
+import hashlib
 import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from services.cipher_backends import (
+    CIPHER_BACKENDS, CIPHERTEXT_V2_PREFIX, CIPHERTEXT_GCM_PREFIX, FernetCipher
+)
+
+DEFAULT_SALT = b'credit_card_salt'  # Use a fixed salt for consistency
+BLIND_INDEX_SALT = b'card_blind_index_salt'
+DATA_KEY_SALT = b'credit_card_data_key_salt'
+
+# Batch encryption settings
+BATCH_CHUNK_SIZE = 500  # Values handled per worker task
+BATCH_MAX_WORKERS = min(8, os.cpu_count() or 1)
+BATCH_FIELDS = {
+    'card_number': 'card number',
+    'cvv': 'CVV',
+    'pin': 'PIN',
+    'sensitive': 'sensitive data'
+}
 
 class EncryptionService:
     """Service for encrypting and decrypting sensitive data"""
@@ -17,12 +42,54 @@ class EncryptionService:
             print("WARNING: Using generated encryption key. Set ENCRYPTION_MASTER_KEY in production!")
         else:
             self.master_key = self.master_key.encode()
-    
-    def _get_fernet_key(self, salt: bytes = None) -> Fernet:
-        """Get Fernet encryption key from master key"""
-        if salt is None:
-            salt = b'credit_card_salt'  # Use a fixed salt for consistency
         
+        # Versioned key ring: new data is encrypted under the active version,
+        # while retired versions stay available for decryption until re-keyed
+        self.active_key_version = int(os.environ.get('ENCRYPTION_KEY_VERSION', '1'))
+        self._key_ring = {self.active_key_version: self.master_key}
+        for entry in filter(None, os.environ.get('ENCRYPTION_RETIRED_KEYS', '').split(',')):
+            # Format: "<version>:<master key>,<version>:<master key>"
+            version, _, key = entry.strip().partition(':')
+            if int(version) != self.active_key_version and key:
+                self._key_ring[int(version)] = key.encode()
+        
+        # Derived keys are cached; PBKDF2 runs once per (version, salt)
+        self._key_cache = {}  # (version, salt) -> Fernet
+        self._decryptor_cache = {}  # salt -> MultiFernet over the ring
+        self._ring_generation = 0  # bumped whenever the ring or the active version changes
+        self._data_key_cache = {}  # (version, field) -> AESGCM
+        self._key_cache_lock = threading.Lock()
+        
+        # Blind index key must outlive master key rotations, so set it explicitly in production.
+        # Without it the key is derived from a pinned key version, never the active one
+        blind_index_key = os.environ.get('BLIND_INDEX_KEY')
+        self._blind_index_key = blind_index_key.encode() if blind_index_key else None
+        self.blind_index_key_version = int(os.environ.get('BLIND_INDEX_KEY_VERSION', '1'))
+        
+        # Cipher for new ciphertexts; every backend stays available for reads
+        self._backends = {name: backend(self) for name, backend in CIPHER_BACKENDS.items()}
+        self.use_cipher(os.environ.get('ENCRYPTION_CIPHER', 'fernet'))
+    
+    @property
+    def key_versions(self) -> list:
+        """Key versions in the ring, newest first"""
+        return sorted(self._key_ring, reverse=True)
+    
+    def use_cipher(self, name: str):
+        """Select the cipher backend used for new ciphertexts"""
+        if name not in self._backends:
+            raise ValueError(f"Unsupported encryption cipher: {name}")
+        self.cipher = self._backends[name]
+    
+    def _backend_for(self, encrypted_data: str):
+        """Find the backend that produced a stored value"""
+        for backend in self._backends.values():
+            if backend.handles(encrypted_data):
+                return backend
+        raise ValueError("Unrecognized ciphertext format")
+    
+    def _derive_key(self, salt: bytes, master_key: bytes = None) -> bytes:
+        """Derive a urlsafe base64 Fernet key from a master key"""
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
@@ -30,10 +97,218 @@ class EncryptionService:
             iterations=100000,
             backend=default_backend()
         )
-        key = base64.urlsafe_b64encode(kdf.derive(self.master_key))
-        return Fernet(key)
+        return base64.urlsafe_b64encode(kdf.derive(master_key or self.master_key))
+    
+    def _get_fernet_key(self, salt: bytes = None, version: int = None) -> Fernet:
+        """Get Fernet encryption key for a key version (cached per version and salt)"""
+        if salt is None:
+            salt = DEFAULT_SALT
+        if version is None:
+            version = self.active_key_version
+        
+        fernet = self._key_cache.get((version, salt))
+        if fernet is not None:
+            return fernet
+        
+        with self._key_cache_lock:
+            # Another thread may have derived the key while we waited
+            fernet = self._key_cache.get((version, salt))
+            if fernet is None:
+                if version not in self._key_ring:
+                    raise ValueError(f"Unknown encryption key version: {version}")
+                fernet = Fernet(self._derive_key(salt, self._key_ring[version]))
+                self._key_cache[(version, salt)] = fernet
+            return fernet
+    
+    def _get_decryptor(self, salt: bytes = None) -> MultiFernet:
+        """Get a decryptor that accepts ciphertexts from any key in the ring"""
+        if salt is None:
+            salt = DEFAULT_SALT
+        
+        decryptor = self._decryptor_cache.get(salt)
+        if decryptor is not None:
+            return decryptor
+        
+        # Active key first so current ciphertexts decrypt on the first attempt
+        with self._key_cache_lock:
+            generation = self._ring_generation
+            versions = [self.active_key_version] + sorted(
+                (v for v in self._key_ring if v != self.active_key_version), reverse=True
+            )
+        decryptor = MultiFernet([self._get_fernet_key(salt, version) for version in versions])
+        with self._key_cache_lock:
+            # Don't cache a decryptor built from a ring that changed meanwhile
+            if generation == self._ring_generation:
+                self._decryptor_cache[salt] = decryptor
+        return decryptor
+    
+    def _get_data_key(self, field: str, version: int = None) -> AESGCM:
+        """Get the AES-GCM data key for a field kind and key version
+        
+        Data keys are expanded with HKDF from a per-version root key, so the
+        master key never encrypts data directly and each field kind has its
+        own key.
+        """
+        if version is None:
+            version = self.active_key_version
+        
+        data_key = self._data_key_cache.get((version, field))
+        if data_key is not None:
+            return data_key
+        
+        with self._key_cache_lock:
+            data_key = self._data_key_cache.get((version, field))
+            if data_key is None:
+                if version not in self._key_ring:
+                    raise ValueError(f"Unknown encryption key version: {version}")
+                root_key = base64.urlsafe_b64decode(self._derive_key(DATA_KEY_SALT, self._key_ring[version]))
+                hkdf = HKDF(
+                    algorithm=hashes.SHA256(),
+                    length=32,
+                    salt=DATA_KEY_SALT,
+                    info=f"ccms-data-key:{field}".encode(),
+                    backend=default_backend()
+                )
+                data_key = AESGCM(hkdf.derive(root_key))
+                self._data_key_cache[(version, field)] = data_key
+            return data_key
+    
+    def invalidate_key_cache(self, salt: bytes = None):
+        """Drop cached key material for one salt, or for all salts"""
+        with self._key_cache_lock:
+            if salt is None:
+                self._key_cache.clear()
+                self._decryptor_cache.clear()
+                self._data_key_cache.clear()
+                self._ring_generation += 1
+            else:
+                for cache_key in [k for k in self._key_cache if k[1] == salt]:
+                    del self._key_cache[cache_key]
+                self._decryptor_cache.pop(salt, None)
+                self._ring_generation += 1
+    
+    def add_key(self, version: int, master_key):
+        """Add a master key to the ring without activating it"""
+        if isinstance(master_key, str):
+            master_key = master_key.encode()
+        if not master_key:
+            raise ValueError("Master key must not be empty")
+        if version in self._key_ring:
+            raise ValueError(f"Encryption key version {version} already exists")
+        
+        with self._key_cache_lock:
+            self._key_ring[version] = master_key
+            self._decryptor_cache.clear()
+            self._ring_generation += 1
+    
+    def activate_key(self, version: int):
+        """Encrypt new data under an existing key version"""
+        if version not in self._key_ring:
+            raise ValueError(f"Unknown encryption key version: {version}")
+        
+        with self._key_cache_lock:
+            self.active_key_version = version
+            self.master_key = self._key_ring[version]
+            self._decryptor_cache.clear()
+            self._ring_generation += 1
+    
+    def retire_key(self, version: int):
+        """Remove a key version once no stored data depends on it"""
+        if version == self.active_key_version:
+            raise ValueError("Cannot retire the active encryption key")
+        
+        with self._key_cache_lock:
+            self._key_ring.pop(version, None)
+            for cache_key in [k for k in self._key_cache if k[0] == version]:
+                del self._key_cache[cache_key]
+            for cache_key in [k for k in self._data_key_cache if k[0] == version]:
+                del self._data_key_cache[cache_key]
+            self._decryptor_cache.clear()
+            self._ring_generation += 1
     
-    def encrypt_card_number(self, card_number: str) -> str:
+    def rotate(self, master_key) -> int:
+        """Add a new master key as the next version and make it active
+        
+        Keys from earlier versions stay in the ring so existing ciphertexts
+        keep decrypting until they are re-encrypted and the old version is
+        retired. Returns the new key version.
+        """
+        version = max(self._key_ring) + 1
+        self.add_key(version, master_key)
+        self.activate_key(version)
+        return version
+    
+    @staticmethod
+    def is_legacy_ciphertext(encrypted_data: str) -> bool:
+        """Check if a stored value still uses the double base64 v1 format"""
+        return not encrypted_data.startswith((CIPHERTEXT_V2_PREFIX, CIPHERTEXT_GCM_PREFIX))
+    
+    def upgrade_ciphertext(self, encrypted_data: str) -> str:
+        """Convert a legacy ciphertext to the v2 format without decrypting it"""
+        if not self.is_legacy_ciphertext(encrypted_data):
+            return encrypted_data
+        try:
+            return FernetCipher.wrap_token(FernetCipher.unwrap_token(encrypted_data))
+        except Exception as e:
+            raise ValueError(f"Failed to upgrade ciphertext: {str(e)}")
+    
+    def reencrypt(self, encrypted_data: str, field: str = 'sensitive', associated_data=None) -> str:
+        """Re-encrypt a stored value under the active key and cipher
+        
+        Fernet to Fernet rotation happens without exposing plaintext; any
+        other combination decrypts and encrypts again, binding the value to
+        ``associated_data`` when the active cipher supports it.
+        """
+        try:
+            backend = self._backend_for(encrypted_data)
+            if backend is self.cipher and backend.name == 'fernet':
+                return backend.rotate(encrypted_data)
+            plaintext = backend.decrypt(encrypted_data, field, self._associated_data(associated_data))
+            return self.cipher.encrypt(plaintext, field, self._associated_data(associated_data))
+        except Exception as e:
+            raise ValueError(f"Failed to re-encrypt data: {str(e)}")
+    
+    def compute_blind_index(self, card_number: str) -> str:
+        """Compute a keyed HMAC of a card number for equality lookups
+        
+        Uses the same digits-only, zero-padded form that encrypt_card_number
+        stores, so the index can be rebuilt from existing ciphertexts. The
+        HMAC key is BLIND_INDEX_KEY, or else derived from the master key of
+        BLIND_INDEX_KEY_VERSION, which must then stay in the key ring.
+        """
+        if self._blind_index_key is None:
+            with self._key_cache_lock:
+                if self._blind_index_key is None:
+                    master_key = self._key_ring.get(self.blind_index_key_version)
+                    if master_key is None:
+                        raise ValueError(
+                            f"Blind index key version {self.blind_index_key_version} is not in the key ring; "
+                            "set BLIND_INDEX_KEY or keep that version in ENCRYPTION_RETIRED_KEYS"
+                        )
+                    self._blind_index_key = base64.urlsafe_b64decode(self._derive_key(BLIND_INDEX_SALT, master_key))
+        
+        clean_number = ''.join(filter(str.isdigit, card_number)).ljust(16, '0')
+        return hmac.new(self._blind_index_key, clean_number.encode(), hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def _associated_data(associated_data):
+        """Normalize associated data (e.g. a document id) to bytes"""
+        if associated_data is None:
+            return None
+        if isinstance(associated_data, bytes):
+            return associated_data
+        return str(associated_data).encode()
+    
+    def _encrypt(self, plaintext: str, field: str, associated_data=None) -> str:
+        """Encrypt a string with the active cipher backend"""
+        return self.cipher.encrypt(plaintext.encode(), field, self._associated_data(associated_data))
+    
+    def _decrypt(self, encrypted_data: str, field: str, associated_data=None) -> str:
+        """Decrypt a string with whichever backend produced it"""
+        backend = self._backend_for(encrypted_data)
+        return backend.decrypt(encrypted_data, field, self._associated_data(associated_data)).decode()
+    
+    def encrypt_card_number(self, card_number: str, associated_data=None) -> str:
         """Encrypt credit card number"""
         try:
             # Remove any non-digit characters
@@ -42,78 +317,147 @@ class EncryptionService:
             # Add padding to make it less obvious
             padded_number = clean_number.ljust(16, '0')
             
-            fernet = self._get_fernet_key()
-            encrypted = fernet.encrypt(padded_number.encode())
-            return base64.urlsafe_b64encode(encrypted).decode()
+            return self._encrypt(padded_number, 'card_number', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to encrypt card number: {str(e)}")
     
-    def decrypt_card_number(self, encrypted_card: str) -> str:
+    def decrypt_card_number(self, encrypted_card: str, associated_data=None) -> str:
         """Decrypt credit card number"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted_data = base64.urlsafe_b64decode(encrypted_card.encode())
-            decrypted = fernet.decrypt(encrypted_data).decode()
+            decrypted = self._decrypt(encrypted_card, 'card_number', associated_data)
             
             # Remove padding
             return decrypted.rstrip('0')
         except Exception as e:
             raise ValueError(f"Failed to decrypt card number: {str(e)}")
     
-    def encrypt_cvv(self, cvv: str) -> str:
+    def encrypt_cvv(self, cvv: str, associated_data=None) -> str:
         """Encrypt CVV"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted = fernet.encrypt(cvv.encode())
-            return base64.urlsafe_b64encode(encrypted).decode()
+            return self._encrypt(cvv, 'cvv', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to encrypt CVV: {str(e)}")
     
-    def decrypt_cvv(self, encrypted_cvv: str) -> str:
+    def decrypt_cvv(self, encrypted_cvv: str, associated_data=None) -> str:
         """Decrypt CVV"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted_data = base64.urlsafe_b64decode(encrypted_cvv.encode())
-            return fernet.decrypt(encrypted_data).decode()
+            return self._decrypt(encrypted_cvv, 'cvv', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to decrypt CVV: {str(e)}")
     
-    def encrypt_pin(self, pin: str) -> str:
+    def encrypt_pin(self, pin: str, associated_data=None) -> str:
         """Encrypt PIN"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted = fernet.encrypt(pin.encode())
-            return base64.urlsafe_b64encode(encrypted).decode()
+            return self._encrypt(pin, 'pin', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to encrypt PIN: {str(e)}")
     
-    def decrypt_pin(self, encrypted_pin: str) -> str:
+    def decrypt_pin(self, encrypted_pin: str, associated_data=None) -> str:
         """Decrypt PIN"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted_data = base64.urlsafe_b64decode(encrypted_pin.encode())
-            return fernet.decrypt(encrypted_data).decode()
+            return self._decrypt(encrypted_pin, 'pin', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to decrypt PIN: {str(e)}")
     
-    def encrypt_sensitive_field(self, data: str) -> str:
+    def encrypt_sensitive_field(self, data: str, associated_data=None) -> str:
         """Encrypt any sensitive field"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted = fernet.encrypt(data.encode())
-            return base64.urlsafe_b64encode(encrypted).decode()
+            return self._encrypt(data, 'sensitive', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to encrypt sensitive data: {str(e)}")
     
-    def decrypt_sensitive_field(self, encrypted_data: str) -> str:
+    def decrypt_sensitive_field(self, encrypted_data: str, associated_data=None) -> str:
         """Decrypt any sensitive field"""
         try:
-            fernet = self._get_fernet_key()
-            encrypted_bytes = base64.urlsafe_b64decode(encrypted_data.encode())
-            return fernet.decrypt(encrypted_bytes).decode()
+            return self._decrypt(encrypted_data, 'sensitive', associated_data)
         except Exception as e:
             raise ValueError(f"Failed to decrypt sensitive data: {str(e)}")
     
+    def encrypt_many(self, values, field: str = 'sensitive', associated_data=None,
+                     chunk_size: int = BATCH_CHUNK_SIZE, max_workers: int = BATCH_MAX_WORKERS):
+        """Encrypt an iterable of values, yielding ciphertexts in input order
+        
+        Produces the same format as the single-value methods for ``field``.
+        ``associated_data``, if given, is an iterable aligned with ``values``.
+        Batches larger than one chunk are spread across a thread pool, and
+        only a bounded number of chunks is held in memory at a time.
+        """
+        cipher = self.cipher
+        label = self._batch_label(field)
+        
+        def encrypt_chunk(chunk):
+            try:
+                results = []
+                for value, aad in chunk:
+                    if field == 'card_number':
+                        value = ''.join(filter(str.isdigit, value)).ljust(16, '0')
+                    results.append(cipher.encrypt(value.encode(), field, self._associated_data(aad)))
+                return results
+            except Exception as e:
+                raise ValueError(f"Failed to encrypt {label}: {str(e)}")
+        
+        return self._map_chunks(encrypt_chunk, self._pair(values, associated_data), chunk_size, max_workers)
+    
+    def decrypt_many(self, values, field: str = 'sensitive', associated_data=None, strip_padding: bool = True,
+                     chunk_size: int = BATCH_CHUNK_SIZE, max_workers: int = BATCH_MAX_WORKERS):
+        """Decrypt an iterable of ciphertexts, yielding plaintexts in input order
+        
+        Card numbers have their zero padding removed unless ``strip_padding``
+        is False.
+        """
+        label = self._batch_label(field)
+        
+        def decrypt_chunk(chunk):
+            try:
+                decrypted = [self._decrypt(value, field, aad) for value, aad in chunk]
+                if field == 'card_number' and strip_padding:
+                    decrypted = [value.rstrip('0') for value in decrypted]
+                return decrypted
+            except Exception as e:
+                raise ValueError(f"Failed to decrypt {label}: {str(e)}")
+        
+        return self._map_chunks(decrypt_chunk, self._pair(values, associated_data), chunk_size, max_workers)
+    
+    @staticmethod
+    def _pair(values, associated_data):
+        """Pair each value with its associated data (or None)"""
+        if associated_data is None:
+            return ((value, None) for value in values)
+        return zip(values, associated_data)
+    
+    @staticmethod
+    def _batch_label(field: str) -> str:
+        """Validate a batch field name and return its label for error messages"""
+        if field not in BATCH_FIELDS:
+            raise ValueError(f"Unsupported field for batch encryption: {field}")
+        return BATCH_FIELDS[field]
+    
+    @staticmethod
+    def _map_chunks(func, values, chunk_size, max_workers):
+        """Apply func to fixed-size chunks of values and stream the results"""
+        iterator = iter(values)
+        chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+        
+        first = next(chunks, None)
+        if first is None:
+            return
+        if len(first) < chunk_size or max_workers <= 1:
+            # Small batch or single worker: no point paying for a pool
+            yield from func(first)
+            for chunk in chunks:
+                yield from func(chunk)
+            return
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Keep at most two chunks per worker in flight to bound memory
+            pending = deque([executor.submit(func, first)])
+            for chunk in chunks:
+                pending.append(executor.submit(func, chunk))
+                if len(pending) >= max_workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+    
     def mask_card_number(self, card_number: str) -> str:
         """Mask card number for display (e.g., 1234-****-****-5678)"""
         if len(card_number) < 4:
@@ -202,6 +546,14 @@ def decrypt_pin(encrypted_pin: str) -> str:
     """Decrypt PIN"""
     return encryption_service.decrypt_pin(encrypted_pin)
 
+def encrypt_many(values, field: str = 'sensitive'):
+    """Encrypt many values, yielding ciphertexts in input order"""
+    return encryption_service.encrypt_many(values, field)
+
+def decrypt_many(values, field: str = 'sensitive'):
+    """Decrypt many values, yielding plaintexts in input order"""
+    return encryption_service.decrypt_many(values, field)
+
 def mask_card_number(card_number: str) -> str:
     """Mask card number for display"""
     return encryption_service.mask_card_number(card_number)
@@ -0,0 +1,125 @@
+import os
+import re
+import time
+from pymongo import ASCENDING, UpdateOne
+from models.card import Card
+from models.migration_checkpoint import MigrationCheckpoint
+from services.encryption import encryption_service
+from services.logging_service import log_error, log_performance
+
+class KeyRotationService:
+    """Resumable, throttled re-encryption of stored card numbers and CVVs
+
+    Also moves cards onto the configured cipher, e.g. from Fernet to AES-GCM:
+    cards whose card number is not in the active cipher's format are
+    selected even when they are already on the target key version.
+    """
+
+    JOB_TYPE = 'card_key_rotation'
+
+    def __init__(self, documents_per_second=None, chunk_size=None):
+        self.documents_per_second = documents_per_second or float(os.environ.get('KEY_ROTATION_DOCS_PER_SECOND', '200'))
+        self.chunk_size = chunk_size or int(os.environ.get('KEY_ROTATION_CHUNK_SIZE', '100'))
+
+    def rotate_cards(self, target_version=None, job_id=None, max_documents=None):
+        """Re-encrypt every card not yet on the target key version and cipher
+
+        Cards are walked in _id order from the job's checkpoint cursor, so an
+        interrupted run picks up where it stopped. Writes are conditional on
+        the ciphertext being unchanged, which keeps the migration safe to run
+        while the application is serving traffic.
+        """
+        checkpoint = None
+        try:
+            target_version = target_version or encryption_service.active_key_version
+            if target_version != encryption_service.active_key_version:
+                return {'success': False, 'error': 'Target key version must be the active encryption key'}
+
+            cipher = encryption_service.cipher
+            job_id = job_id or f"{self.JOB_TYPE}_v{target_version}_{cipher.name}"
+            checkpoint = MigrationCheckpoint.get_or_create(
+                job_id, self.JOB_TYPE, {'target_version': target_version, 'cipher': cipher.name, 'conflicts': 0}
+            )
+            if checkpoint.is_completed():
+                return {'success': True, 'processed': 0, 'job': checkpoint.to_dict()}
+
+            collection = Card._get_collection()
+            start_time = time.monotonic()
+            processed = 0
+
+            while max_documents is None or processed < max_documents:
+                limit = self.chunk_size if max_documents is None else min(self.chunk_size, max_documents - processed)
+                query = {'$or': [
+                    {'key_version': {'$ne': target_version}},
+                    {'card_number': {'$not': re.compile('^' + re.escape(cipher.prefix))}}
+                ]}
+                if checkpoint.last_id:
+                    query['_id'] = {'$gt': checkpoint.last_id}
+
+                documents = list(
+                    collection.find(query, {'card_number': 1, 'cvv': 1})
+                    .sort('_id', ASCENDING)
+                    .limit(limit)
+                )
+                if not documents:
+                    checkpoint.complete()
+                    break
+
+                operations, failed = self._build_updates(documents, target_version)
+                written = 0
+                if operations:
+                    result = collection.bulk_write(operations, ordered=False)
+                    written = result.modified_count
+                    checkpoint.details['conflicts'] = checkpoint.details.get('conflicts', 0) + len(operations) - written
+
+                checkpoint.advance(documents[-1]['_id'], processed=written, failed=failed)
+                processed += len(documents)
+                self._throttle(processed, start_time)
+
+            duration = (time.monotonic() - start_time) * 1000
+            log_performance('key_rotation_cards', duration, {'job_id': job_id, 'processed': processed})
+            return {'success': True, 'processed': processed, 'job': checkpoint.to_dict()}
+
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.fail(e)
+            log_error('KeyRotationError', str(e), details={'target_version': target_version})
+            return {'success': False, 'error': str(e)}
+
+    @staticmethod
+    def _build_updates(documents, target_version):
+        """Re-encrypt a chunk of cards into bulk update operations"""
+        operations = []
+        failed = 0
+        for document in documents:
+            try:
+                updates = {
+                    'card_number': encryption_service.reencrypt(
+                        document['card_number'], field='card_number', associated_data=document['_id']
+                    ),
+                    'cvv': encryption_service.reencrypt(document['cvv'], field='cvv', associated_data=document['_id']),
+                    'key_version': target_version
+                }
+            except (KeyError, ValueError) as e:
+                failed += 1
+                log_error('KeyRotationError', str(e), details={'card_id': str(document['_id'])})
+                continue
+
+            # Only overwrite if the ciphertext has not changed since it was read
+            operations.append(UpdateOne(
+                {'_id': document['_id'], 'card_number': document['card_number'], 'cvv': document['cvv']},
+                {'$set': updates}
+            ))
+        return operations, failed
+
+    def _throttle(self, processed, start_time):
+        """Sleep long enough to stay under the configured documents-per-second rate"""
+        if self.documents_per_second <= 0:
+            return
+        expected_elapsed = processed / self.documents_per_second
+        actual_elapsed = time.monotonic() - start_time
+        if expected_elapsed > actual_elapsed:
+            time.sleep(expected_elapsed - actual_elapsed)
+
+# Global key rotation service instance
+key_rotation_service = KeyRotationService()
@@ -1,32 +1,398 @@
 import os
+import glob
+import gzip
 import json
 import time
+import queue
+import random
+import shutil
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from functools import wraps
 from flask import request, g, current_app
+from services.db_profiler import command_profiler
+from services.metrics import request_metrics
+from services.audit_store import audit_store
+from services.stack_sampler import stack_sampler
+from services.risk_engine import risk_engine, TransactionEvent
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 # from models.user import User  # Removed to avoid circular import
 
+# Async logging settings
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '256'))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '1.0'))
+LOG_FILE_BUFFER_SIZE = 64 * 1024
+# Rotation: a log rolls over when it reaches LOG_MAX_BYTES or at each LOG_ROTATE_INTERVAL_HOURS boundary (UTC)
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL_HOURS = float(os.environ.get('LOG_ROTATE_INTERVAL_HOURS', '24'))
+# Loggers echoed to the console: "*" for all, "none" for none, or a comma separated list
+LOG_CONSOLE_LOGGERS = os.environ.get('LOG_CONSOLE_LOGGERS', '*')
+# Request log sampling: default head sampling rate, per blueprint or endpoint
+# overrides ("cards=0.05,users.login=1"), and the always-log slow threshold
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.1'))
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+LOG_SLOW_REQUEST_MS = float(os.environ.get('LOG_SLOW_REQUEST_MS', '1000'))
+# When the queue is full, records at or above this level wait briefly; the rest are dropped
+LOG_QUEUE_BLOCK_LEVEL = logging.WARNING
+LOG_QUEUE_BLOCK_TIMEOUT = 0.05
+
+# Reused encoder; json.dumps builds a new one per call when options are passed
+_json_encoder = json.JSONEncoder(separators=(',', ':'), default=str)
+
+def dumps_json(data):
+    """Serialize a log payload to compact JSON, using orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return _json_encoder.encode(data)
+
+class StructuredMessage:
+    """Log message carrying a structured payload
+
+    The payload is serialized only when a handler formats the record, on
+    the listener thread, and at most once per record.
+    """
+
+    __slots__ = ('event', 'label', 'data', '_json')
+
+    def __init__(self, event, label, data):
+        self.event = event
+        self.label = label
+        self.data = data
+        self._json = None
+
+    def to_json(self):
+        """Serialize the payload, caching the result"""
+        if self._json is None:
+            self._json = dumps_json(self.data)
+        return self._json
+
+    def __str__(self):
+        return f"{self.label}: {self.to_json()}"
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line
+
+    Every line has timestamp, level, category (logger name) and event,
+    followed by the payload fields, so the category logs can be parsed
+    without regular expressions.
+    """
+
+    def format(self, record):
+        message = record.msg
+        envelope = {
+            'timestamp': datetime.utcfromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'category': record.name
+        }
+        if not isinstance(message, StructuredMessage):
+            envelope['event'] = None
+            envelope['message'] = record.getMessage()
+            if record.exc_info:
+                envelope['exception'] = self.formatException(record.exc_info)
+            return dumps_json(envelope)
+
+        envelope['event'] = message.event
+        # Splice the cached payload into the envelope instead of serializing it again
+        payload = message.to_json()
+        if payload == '{}':
+            return dumps_json(envelope)
+        return dumps_json(envelope)[:-1] + ',' + payload[1:]
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks a request on a full queue for long
+
+    Low severity records are dropped when the queue is full; warnings and
+    errors wait up to LOG_QUEUE_BLOCK_TIMEOUT before being dropped too.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # The listener runs in this process, so formatting is left to its thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= LOG_QUEUE_BLOCK_LEVEL:
+                self.queue.put(record, timeout=LOG_QUEUE_BLOCK_TIMEOUT)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+class BufferedFileHandler(logging.FileHandler):
+    """FileHandler that leaves flushing to the caller
+
+    The queue listener flushes once per batch, instead of once per record.
+    """
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=LOG_FILE_BUFFER_SIZE, encoding=self.encoding, errors=self.errors)
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+class LogArchiver:
+    """Background gzip compression and retention of rolled log segments"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, base_filename, retention):
+        """Compress a rolled segment, then prune archives beyond the retention count"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-archiver', daemon=True)
+                self._thread.start()
+        self._queue.put((path, base_filename, retention))
+
+    def join(self):
+        """Wait for every submitted segment to be compressed"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            path, base_filename, retention = self._queue.get()
+            try:
+                self.compress(path)
+                self.prune(base_filename, retention)
+            except OSError:
+                pass  # Keep the segment uncompressed rather than lose it
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def compress(path):
+        """Gzip a file next to itself and remove the original"""
+        with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+
+    @staticmethod
+    def prune(base_filename, retention):
+        """Delete the oldest compressed archives beyond the retention count"""
+        archives = sorted(glob.glob(glob.escape(base_filename) + '.*.gz'))
+        for path in archives[:max(len(archives) - retention, 0)]:
+            os.remove(path)
+
+# Shared archiver for every rotating handler
+log_archiver = LogArchiver()
+
+class RotatingBufferedFileHandler(BufferedFileHandler):
+    """BufferedFileHandler that rolls over by size and time
+
+    Rolled segments are renamed with their rollover time and handed to the
+    archiver, which gzips them and keeps the newest ``retention`` archives.
+    Only the queue listener thread writes, so rollover needs no extra lock.
+    """
+
+    def __init__(self, filename, retention, max_bytes=None, interval_hours=None, archiver=None):
+        super().__init__(filename)
+        self.retention = retention
+        self.max_bytes = max_bytes if max_bytes is not None else LOG_MAX_BYTES
+        interval_hours = interval_hours if interval_hours is not None else LOG_ROTATE_INTERVAL_HOURS
+        self.interval = interval_hours * 3600
+        self.archiver = archiver or log_archiver
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        self._rollover_at = self._next_rollover(time.time())
+
+    def _next_rollover(self, now):
+        """Next interval boundary, aligned to the epoch so daily logs roll at midnight UTC"""
+        if self.interval <= 0:
+            return float('inf')
+        return (now // self.interval + 1) * self.interval
+
+    def emit(self, record):
+        try:
+            message = self.format(record) + self.terminator
+            now = time.time()
+            if now >= self._rollover_at or (self.max_bytes > 0 and self._size + len(message) > self.max_bytes and self._size):
+                self.do_rollover(now)
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(message)
+            self._size += len(message)
+        except Exception:
+            self.handleError(record)
+
+    def do_rollover(self, now=None):
+        """Close the current file, rename it and queue it for compression"""
+        now = time.time() if now is None else now
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self._rollover_at = self._next_rollover(now)
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            self._size = 0
+            return
+
+        # Microsecond timestamps keep archive names unique and in chronological order
+        stamp_us = int(now * 1_000_000)
+        while True:
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(stamp_us // 1_000_000)) + f'{stamp_us % 1_000_000:06d}'
+            rolled = f"{self.baseFilename}.{stamp}"
+            if not os.path.exists(rolled) and not os.path.exists(rolled + '.gz'):
+                break
+            stamp_us += 1
+        os.rename(self.baseFilename, rolled)
+        self._size = 0
+        self.archiver.submit(rolled, self.baseFilename, self.retention)
+
+class ConsoleFilter(logging.Filter):
+    """Let only the configured loggers echo to the console"""
+
+    def __init__(self, loggers=None):
+        super().__init__()
+        loggers = LOG_CONSOLE_LOGGERS if loggers is None else loggers
+        self.allow_all = loggers.strip() == '*'
+        self.loggers = {name.strip() for name in loggers.split(',') if name.strip() and name.strip() != 'none'}
+
+    def filter(self, record):
+        return self.allow_all or record.name.split('.', 1)[0] in self.loggers
+
+class BatchingQueueListener(QueueListener):
+    """QueueListener that routes records by logger and flushes in batches
+
+    Records from the category loggers (security, performance, ...) go to
+    their own file as well as the application handlers, except for the
+    exclusive categories, which only go to their own file. Handlers are
+    flushed after each batch, and at least every LOG_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, log_queue, handlers, routes, queue_handler, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, exclusive=frozenset()):
+        super().__init__(log_queue, *handlers)
+        self.routes = routes
+        self.exclusive = exclusive
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._all_handlers = list(handlers) + [h for route in routes.values() for h in route]
+        self._reported_dropped = 0
+
+    def handle(self, record):
+        """Dispatch a record to the application handlers and its category handlers"""
+        record = self.prepare(record)
+        category = record.name.split('.', 1)[0]
+        handlers = self.routes.get(category, ())
+        if category not in self.exclusive:
+            handlers = self.handlers + handlers
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def enqueue_sentinel(self):
+        # Block rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+    def flush(self):
+        """Flush every handler and report records dropped since the last flush"""
+        dropped = self.queue_handler.dropped
+        if dropped > self._reported_dropped:
+            record = logging.LogRecord(
+                'logging', logging.WARNING, __file__, 0,
+                'Dropped %d log records because the log queue was full', (dropped - self._reported_dropped,), None
+            )
+            self._reported_dropped = dropped
+            for handler in self.handlers:
+                handler.handle(record)
+        for handler in self._all_handlers:
+            try:
+                handler.flush()
+            except (OSError, ValueError):
+                # Stream already closed (e.g. stderr during interpreter shutdown)
+                pass
+
+    def _monitor(self):
+        log_queue = self.queue
+        while True:
+            try:
+                record = log_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.flush()
+                continue
+
+            stop = False
+            handled = 0
+            try:
+                while True:
+                    handled += 1
+                    if record is self._sentinel:
+                        stop = True
+                        break
+                    self.handle(record)
+                    if handled >= self.batch_size:
+                        break
+                    try:
+                        record = log_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self.flush()
+            finally:
+                for _ in range(handled):
+                    log_queue.task_done()
+            if stop:
+                return
+
 class LoggingService:
-    """Comprehensive logging and monitoring service"""
+    """Comprehensive logging and monitoring service
     
-    def __init__(self):
+    Loggers only enqueue records; a background listener thread formats them
+    and writes them to the log files in batches.
+    """
+    
+    # Category loggers, the JSON lines file each one also writes to, and the
+    # default number of compressed archives kept (LOG_RETENTION_<NAME> overrides)
+    LOG_FILES = {
+        'security': ('security.log', 30),
+        'performance': ('performance.log', 7),
+        'error': ('error.log', 30),
+        'audit': ('audit.log', 90),
+        'traces': ('traces.log', 3)
+    }
+    # Categories written only to their own file, not the application log or console
+    EXCLUSIVE_LOGS = frozenset({'traces'})
+    APPLICATION_LOG = ('application.log', 7)
+    
+    def __init__(self, log_dir='logs'):
+        self.log_dir = log_dir
+        self.listener = None
         self.setup_logging()
     
     def setup_logging(self):
         """Setup logging configuration"""
         # Create logs directory if it doesn't exist
-        os.makedirs('logs', exist_ok=True)
+        os.makedirs(self.log_dir, exist_ok=True)
         
-        # Configure logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('logs/application.log'),
-                logging.StreamHandler()
-            ]
-        )
+        # Application handlers receive every record
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        app_handlers = [self._rotating_handler('application', *self.APPLICATION_LOG)]
+        console_filter = ConsoleFilter()
+        if console_filter.allow_all or console_filter.loggers:
+            console_handler = logging.StreamHandler()
+            console_handler.addFilter(console_filter)
+            app_handlers.append(console_handler)
+        for handler in app_handlers:
+            handler.setFormatter(formatter)
         
         # Create specific loggers
         self.app_logger = logging.getLogger('app')
@@ -36,184 +402,367 @@ class LoggingService:
         self.audit_logger = logging.getLogger('audit')
         
         # Setup file handlers for different log types
-        self._setup_file_handlers()
-    
-    def _setup_file_handlers(self):
-        """Setup file handlers for different log types"""
-        # Security log handler
-        security_handler = logging.FileHandler('logs/security.log')
-        security_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
-        ))
-        self.security_logger.addHandler(security_handler)
+        routes = self._setup_file_handlers()
         
-        # Performance log handler
-        performance_handler = logging.FileHandler('logs/performance.log')
-        performance_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(message)s'
-        ))
-        self.performance_logger.addHandler(performance_handler)
+        # Loggers propagate to the root logger, whose only handler is the bounded queue
+        self.log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.queue_handler = DroppingQueueHandler(self.log_queue)
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.INFO)
+        root_logger.addHandler(self.queue_handler)
         
-        # Error log handler
-        error_handler = logging.FileHandler('logs/error.log')
-        error_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
-        ))
-        self.error_logger.addHandler(error_handler)
-        
-        # Audit log handler
-        audit_handler = logging.FileHandler('logs/audit.log')
-        audit_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(message)s'
-        ))
-        self.audit_logger.addHandler(audit_handler)
-    
-    def log_request(self, endpoint, method, user_id=None, status_code=None, duration=None):
+        self.listener = BatchingQueueListener(self.log_queue, app_handlers, routes, self.queue_handler,
+                                              exclusive=self.EXCLUSIVE_LOGS)
+        self.listener.start()
+        atexit.register(self.shutdown)
+    
+    def _setup_file_handlers(self):
+        """Setup file handlers for different log types, keyed by logger name"""
+        routes = {}
+        formatter = JsonLinesFormatter()
+        for logger_name, (filename, retention) in self.LOG_FILES.items():
+            handler = self._rotating_handler(logger_name, filename, retention)
+            handler.setFormatter(formatter)
+            routes[logger_name] = (handler,)
+        return routes
+    
+    def _rotating_handler(self, name, filename, retention):
+        """Rotating file handler with the retention configured for a log type"""
+        retention = int(os.environ.get(f'LOG_RETENTION_{name.upper()}', str(retention)))
+        return RotatingBufferedFileHandler(os.path.join(self.log_dir, filename), retention)
+    
+    def flush(self):
+        """Wait until every queued record has been written to disk"""
+        if self.listener is not None:
+            self.log_queue.join()
+            self.listener.flush()
+    
+    def shutdown(self):
+        """Drain the queue, flush and close the log files"""
+        if self.listener is None:
+            return
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.listener._all_handlers:
+            handler.close()
+        self.listener = None
+        log_archiver.join()
+    
+    def get_stats(self):
+        """Get log queue depth and dropped record count"""
+        return {
+            'queue_depth': self.log_queue.qsize(),
+            'queue_capacity': LOG_QUEUE_SIZE,
+            'dropped': self.queue_handler.dropped
+        }
+    
+    @staticmethod
+    def _client_details():
+        """Client address and user agent, captured on the request thread"""
+        if not request:
+            return None, None
+        return request.remote_addr, request.headers.get('User-Agent')
+    
+    def log_request(self, endpoint, method, user_id=None, status_code=None, duration=None, details=None):
         """Log API request"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        if not self.app_logger.isEnabledFor(logging.INFO):
+            return
+        ip_address, user_agent = self._client_details()
+        self.app_logger.info(StructuredMessage('api_request', 'API Request', {
             'endpoint': endpoint,
             'method': method,
             'user_id': user_id,
             'status_code': status_code,
             'duration_ms': duration,
-            'ip_address': request.remote_addr if request else None,
-            'user_agent': request.headers.get('User-Agent') if request else None
-        }
-        
-        self.app_logger.info(f"API Request: {json.dumps(log_data)}")
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'details': details or {}
+        }))
     
     def log_security_event(self, event_type, user_id, success, details=None):
         """Log security events"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        level = logging.INFO if success else logging.WARNING
+        if not self.security_logger.isEnabledFor(level):
+            return
+        ip_address, user_agent = self._client_details()
+        self.security_logger.log(level, StructuredMessage('security_event', 'Security Event', {
             'event_type': event_type,
             'user_id': user_id,
             'success': success,
-            'ip_address': request.remote_addr if request else None,
-            'user_agent': request.headers.get('User-Agent') if request else None,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
             'details': details or {}
-        }
-        
+        }))
+    
+    def log_security_events(self, event_type, events, success=True):
+        """Log one security event type for many users as a single record
+
+        events is a list of {'user_id': ..., 'details': ...} dicts.
+        """
         level = logging.INFO if success else logging.WARNING
-        self.security_logger.log(level, f"Security Event: {json.dumps(log_data)}")
+        if not events or not self.security_logger.isEnabledFor(level):
+            return
+        ip_address, user_agent = self._client_details()
+        self.security_logger.log(level, StructuredMessage('security_events', 'Security Events', {
+            'event_type': event_type,
+            'success': success,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'events': events
+        }))
     
     def log_performance(self, operation, duration, details=None):
         """Log performance metrics"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        if not self.performance_logger.isEnabledFor(logging.INFO):
+            return
+        self.performance_logger.info(StructuredMessage('performance', 'Performance', {
             'operation': operation,
             'duration_ms': duration,
             'details': details or {}
-        }
-        
-        self.performance_logger.info(f"Performance: {json.dumps(log_data)}")
+        }))
     
     def log_error(self, error_type, error_message, user_id=None, details=None):
         """Log errors"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        if not self.error_logger.isEnabledFor(logging.ERROR):
+            return
+        ip_address, _ = self._client_details()
+        self.error_logger.error(StructuredMessage('error', 'Error', {
             'error_type': error_type,
             'error_message': error_message,
             'user_id': user_id,
-            'ip_address': request.remote_addr if request else None,
+            'ip_address': ip_address,
             'details': details or {}
-        }
-        
-        self.error_logger.error(f"Error: {json.dumps(log_data)}")
+        }))
     
     def log_audit(self, action, user_id, resource_type, resource_id, details=None):
         """Log audit trail"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        if not self.audit_logger.isEnabledFor(logging.INFO):
+            return
+        ip_address, _ = self._client_details()
+        self.audit_logger.info(StructuredMessage('audit', 'Audit', {
             'action': action,
             'user_id': user_id,
             'resource_type': resource_type,
             'resource_id': resource_id,
-            'ip_address': request.remote_addr if request else None,
+            'ip_address': ip_address,
             'details': details or {}
-        }
-        
-        self.audit_logger.info(f"Audit: {json.dumps(log_data)}")
+        }))
     
     def log_business_event(self, event_type, user_id, amount=None, details=None):
         """Log business events (transactions, payments, etc.)"""
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+        if not self.app_logger.isEnabledFor(logging.INFO):
+            return
+        self.app_logger.info(StructuredMessage('business_event', 'Business Event', {
             'event_type': event_type,
             'user_id': user_id,
             'amount': amount,
             'details': details or {}
-        }
-        
-        self.app_logger.info(f"Business Event: {json.dumps(log_data)}")
+        }))
 
 # Global logging service instance
 logging_service = LoggingService()
 
-def log_request_performance(f):
-    """Decorator to log request performance"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        start_time = time.time()
-        
-        # Get user info if available
-        user_id = None
-        if hasattr(request, 'user_claims'):
-            user_id = request.user_claims.get('user_id')
-        
-        try:
-            result = f(*args, **kwargs)
-            duration = (time.time() - start_time) * 1000  # Convert to milliseconds
-            
-            # Log successful request
-            logging_service.log_request(
-                endpoint=request.endpoint,
-                method=request.method,
-                user_id=user_id,
-                status_code=200,
-                duration=duration
-            )
-            
-            # Log performance
-            logging_service.log_performance(
-                operation=f"{request.method} {request.endpoint}",
-                duration=duration
-            )
-            
-            return result
-            
-        except Exception as e:
-            duration = (time.time() - start_time) * 1000
-            
-            # Log error
-            logging_service.log_error(
-                error_type=type(e).__name__,
-                error_message=str(e),
-                user_id=user_id,
-                details={'endpoint': request.endpoint, 'method': request.method}
-            )
-            
-            # Log failed request
-            logging_service.log_request(
-                endpoint=request.endpoint,
-                method=request.method,
-                user_id=user_id,
-                status_code=500,
-                duration=duration
-            )
-            
-            raise
+class RequestLogSampler:
+    """Decides which requests get a full-fidelity log record
+
+    Requests are sampled at the head with a per blueprint (or endpoint)
+    rate. Errors, requests slower than the slow threshold, and requests
+    above their route's recent p99 latency are always logged.
+    """
+
+    TAIL_QUANTILE = 0.99
+    TAIL_MIN_REQUESTS = 100
+    TAIL_REFRESH_SECONDS = 30
+
+    def __init__(self, default_rate=None, rates=None, slow_ms=None, metrics=None):
+        self.default_rate = LOG_SAMPLE_RATE if default_rate is None else default_rate
+        self.rates = self._parse_rates(LOG_SAMPLE_RATES) if rates is None else rates
+        self.slow_ms = LOG_SLOW_REQUEST_MS if slow_ms is None else slow_ms
+        self.metrics = metrics or request_metrics
+        self._tail_thresholds = {}
+        self._tail_refreshed_at = 0.0
+        self._tail_lock = threading.Lock()
+
+    @staticmethod
+    def _parse_rates(value):
+        """Parse "name=rate,name=rate" into a dict"""
+        rates = {}
+        for item in value.split(','):
+            name, _, rate = item.partition('=')
+            if name.strip() and rate.strip():
+                rates[name.strip()] = float(rate)
+        return rates
+
+    def rate_for(self, endpoint):
+        """Sampling rate for an endpoint, falling back to its blueprint, then the default"""
+        endpoint = endpoint or ''
+        if endpoint in self.rates:
+            return self.rates[endpoint]
+        return self.rates.get(endpoint.split('.', 1)[0], self.default_rate)
+
+    def head_sample(self, rate):
+        """Decide at the start of a request whether it is sampled"""
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def reason(self, sampled, status_code, duration_ms, route=None):
+        """Why a finished request should be logged, or None to skip it"""
+        if status_code >= 500:
+            return 'error'
+        if duration_ms >= self.slow_ms:
+            return 'slow'
+        if route is not None:
+            threshold = self._tail_threshold(route)
+            if threshold is not None and duration_ms > threshold:
+                return 'tail'
+        if sampled:
+            return 'sampled'
+        return None
+
+    def _tail_threshold(self, route):
+        """Recent p99 latency (ms) of a route, refreshed from the request metrics"""
+        now = time.monotonic()
+        if now - self._tail_refreshed_at >= self.TAIL_REFRESH_SECONDS and self._tail_lock.acquire(blocking=False):
+            try:
+                self._tail_thresholds = {
+                    endpoint: stats.quantile(self.TAIL_QUANTILE) * 1000
+                    for endpoint, stats in self.metrics.snapshot().items()
+                    if stats.count >= self.TAIL_MIN_REQUESTS
+                }
+                self._tail_refreshed_at = now
+            finally:
+                self._tail_lock.release()
+        return self._tail_thresholds.get(route)
+
+# Global request log sampler instance
+request_log_sampler = RequestLogSampler()
+
+def _log_finished_request(state, status_code, error=None):
+    """Write the record of a finished request if the sampler keeps it"""
+    duration = (time.time() - state['start']) * 1000  # Convert to milliseconds
+    rate = state['rate']
+    
+    if error is not None:
+        user_id = getattr(request, 'user_claims', {}).get('user_id')
+        logging_service.log_error(
+            error_type=type(error).__name__,
+            error_message=str(error),
+            user_id=user_id,
+            details={'endpoint': request.endpoint, 'method': request.method}
+        )
+        logging_service.log_request(
+            endpoint=request.endpoint,
+            method=request.method,
+            user_id=user_id,
+            status_code=500,
+            duration=duration,
+            details={'sample_reason': 'error', 'sample_rate': rate}
+        )
+        return
     
-    return decorated_function
+    route = request.url_rule.rule if request.url_rule is not None else None
+    reason = request_log_sampler.reason(state['sampled'], status_code, duration, route)
+    if reason is None:
+        return
+    
+    # Request headers and client details are only read for logged requests
+    user_id = getattr(request, 'user_claims', {}).get('user_id')
+    details = {'sample_reason': reason, 'sample_rate': rate}
+    if reason in ('slow', 'tail'):
+        # Save the stack samples of an outlier next to its request record
+        details['profile'] = stack_sampler.save_current({
+            'endpoint': request.endpoint,
+            'status_code': status_code,
+            'duration_ms': duration,
+            'user_id': user_id,
+            'sample_reason': reason
+        })
+    logging_service.log_request(
+        endpoint=request.endpoint,
+        method=request.method,
+        user_id=user_id,
+        status_code=status_code,
+        duration=duration,
+        details=details
+    )
+    if reason in ('slow', 'tail'):
+        logging_service.log_performance(
+            operation=f"{request.method} {request.endpoint}",
+            duration=duration,
+            details={'reason': reason, 'status_code': status_code, 'profile': details['profile']}
+        )
+
+def init_app(app):
+    """Log sampled, failed, slow and tail latency requests handled by the app
+    
+    The sampling decision is made before the view runs, using the rate of
+    the request's endpoint or blueprint. Register after stack_sampler so a
+    slow request's stack samples are still available when it is logged.
+    """
+    if not app.config.get('REQUEST_LOGGING_ENABLED', True):
+        return request_log_sampler
+    
+    @app.before_request
+    def _begin_request_log():
+        rate = request_log_sampler.rate_for(request.endpoint)
+        g._request_log = {'rate': rate, 'sampled': request_log_sampler.head_sample(rate), 'start': time.time()}
+    
+    @app.after_request
+    def _capture_request_log_status(response):
+        g._request_log_status = response.status_code
+        return response
+    
+    @app.teardown_request
+    def _end_request_log(error=None):
+        state = g.pop('_request_log', None)
+        status_code = g.pop('_request_log_status', 500)
+        if state is not None:
+            _log_finished_request(state, status_code, error)
+    
+    return request_log_sampler
 
 def log_security_event(event_type, user_id, success, details=None):
     """Log security events"""
     logging_service.log_security_event(event_type, user_id, success, details)
 
+def log_security_events(event_type, events, success=True):
+    """Log one security event type for many users as a single record"""
+    logging_service.log_security_events(event_type, events, success)
+
 def log_audit_trail(action, user_id, resource_type, resource_id, details=None):
-    """Log audit trail"""
+    """Log audit trail, and record it in the queryable audit store"""
     logging_service.log_audit(action, user_id, resource_type, resource_id, details)
+    record_audit_event('audit', action, user_id, resource_type=resource_type,
+                       resource_id=resource_id, details=details)
+
+def record_audit_event(category, action, user_id, resource_type=None, resource_id=None,
+                       success=True, details=None):
+    """Append an event to the audit store; a failing store is logged, not raised"""
+    ip_address, _ = logging_service._client_details()
+    try:
+        audit_store.record(category, action, user_id, resource_type, resource_id,
+                           success, ip_address, details)
+    except Exception as e:
+        logging_service.log_error('AuditStoreError', str(e), user_id, {'action': action})
+
+def record_audit_events(category, action, events, success=True):
+    """Queue many events in the audit store and wait once for the last of them
+
+    events is a list of {'user_id': ..., 'details': ...} dicts. A failing
+    store is logged, not raised.
+    """
+    if not events:
+        return
+    ip_address, _ = logging_service._client_details()
+    try:
+        future = None
+        for event in events:
+            future = audit_store.append(category, action, event['user_id'], success=success,
+                                        ip_address=ip_address, details=event.get('details'))
+        if audit_store.sync:
+            # The writer commits in order, so the last event being durable covers the rest
+            future.result(5)
+    except Exception as e:
+        logging_service.log_error('AuditStoreError', str(e), details={'action': action, 'events': len(events)})
 
 def log_business_event(event_type, user_id, amount=None, details=None):
     """Log business events"""
@@ -232,15 +781,28 @@ class PerformanceMonitor:
     
     @staticmethod
     def measure_database_operation(operation_name):
-        """Decorator to measure database operation performance"""
+        """Decorator to measure database operation performance
+        
+        Inside a request, the log also records the MongoDB commands and
+        server time the operation accounted for.
+        """
         def decorator(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
                 start_time = time.time()
+                profile = command_profiler.current()
+                commands_before = profile.commands if profile else 0
+                db_us_before = profile.total_us if profile else 0
                 try:
                     result = func(*args, **kwargs)
                     duration = (time.time() - start_time) * 1000
-                    log_performance(f"DB_{operation_name}", duration)
+                    details = None
+                    if profile is not None:
+                        details = {
+                            'commands': profile.commands - commands_before,
+                            'db_time_ms': (profile.total_us - db_us_before) / 1000
+                        }
+                    log_performance(f"DB_{operation_name}", duration, details)
                     return result
                 except Exception as e:
                     duration = (time.time() - start_time) * 1000
@@ -249,6 +811,12 @@ class PerformanceMonitor:
             return wrapper
         return decorator
     
+    @staticmethod
+    def get_request_db_profile():
+        """Database commands issued so far by the current request, or None"""
+        profile = command_profiler.current()
+        return profile.to_dict() if profile is not None else None
+    
     @staticmethod
     def measure_api_call(api_name):
         """Decorator to measure API call performance"""
@@ -273,14 +841,25 @@ class SecurityMonitor:
     
     @staticmethod
     def detect_suspicious_activity(user_id, activity_type, details):
-        """Detect suspicious activity patterns"""
-        # This is a simplified version - in production, you'd use ML models
-        suspicious_patterns = {
-            'multiple_failed_logins': {'threshold': 5, 'time_window': 300},  # 5 minutes
-            'high_value_transactions': {'threshold': 10000, 'time_window': 3600},  # 1 hour
-            'unusual_location': {'check': True},
-            'rapid_transactions': {'threshold': 10, 'time_window': 600}  # 10 minutes
-        }
+        """Detect suspicious activity patterns
+        
+        Transactions (details holding card_id and amount) are scored by the
+        streaming risk engine and only logged when suspicious; other
+        activity types are logged as reported.
+        """
+        if activity_type == 'transaction':
+            assessment = risk_engine.assess(TransactionEvent(
+                details['card_id'],
+                details['amount'],
+                details.get('merchant_category'),
+                details.get('location'),
+                details.get('is_international', False),
+                credit_limit=details.get('credit_limit'),
+                card_international=details.get('card_international', True)
+            ))
+            if not assessment.suspicious:
+                return False
+            details = dict(details, **assessment.to_dict())
         
         # Log security event
         log_security_event(
@@ -0,0 +1,230 @@
+import time
+import threading
+from flask import request, g
+
+# Log-linear buckets as in HDR histograms: 2^7 sub-buckets per power of two
+# keep every recorded latency within 1% of its true value
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_MASK = (1 << SUB_BUCKET_BITS) - 1
+
+# Bucket bounds (seconds) exported as Prometheus histogram "le" labels
+EXPORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPORT_QUANTILES = (0.5, 0.9, 0.99)
+
+def bucket_index(value_us):
+    """Map a latency in microseconds to its log-linear bucket"""
+    shift = max(value_us.bit_length() - SUB_BUCKET_BITS, 0)
+    return (shift << SUB_BUCKET_BITS) | (value_us >> shift)
+
+def bucket_value(index):
+    """Midpoint latency in microseconds of a bucket"""
+    shift = index >> SUB_BUCKET_BITS
+    return ((index & SUB_BUCKET_MASK) << shift) + ((1 << shift) - 1) / 2
+
+class EndpointStats:
+    """Latency buckets and counters for one endpoint
+
+    Only ever written by the thread that owns it, so no locking is needed.
+    """
+
+    __slots__ = ('buckets', 'count', 'total_us', 'errors', 'statuses', 'in_flight')
+
+    def __init__(self):
+        self.buckets = {}  # bucket index -> count, sparse
+        self.count = 0
+        self.total_us = 0
+        self.errors = 0
+        self.statuses = {}  # (method, status) -> count
+        self.in_flight = 0
+
+    def merge(self, other):
+        """Add a snapshot of another EndpointStats into this one"""
+        for index, count in other.buckets.copy().items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        for key, count in other.statuses.copy().items():
+            self.statuses[key] = self.statuses.get(key, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        self.errors += other.errors
+        self.in_flight += other.in_flight
+
+    def quantile(self, q):
+        """Latency in seconds at quantile q, within bucket precision"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return bucket_value(index) / 1_000_000
+        return bucket_value(max(self.buckets)) / 1_000_000
+
+    def cumulative_counts(self, bounds):
+        """Counts of observations at or below each bound (seconds)"""
+        counts = [0] * len(bounds)
+        for index, count in self.buckets.items():
+            value = bucket_value(index) / 1_000_000
+            for position, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[position] += count
+        return counts
+
+class RequestMetrics:
+    """Per-endpoint request latency, status and in-flight metrics
+
+    Each thread records into its own buffer; buffers are only merged when
+    /metrics is scraped, so the request path takes no locks. Buffers of
+    threads that have exited are folded into a retired total.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._buffers = []  # (thread, {endpoint: EndpointStats})
+        self._retired = {}
+        self._registry_lock = threading.Lock()
+
+    def _buffer(self):
+        """Get the calling thread's buffer, registering it on first use"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = {}
+            with self._registry_lock:
+                self._buffers.append((threading.current_thread(), buffer))
+        return buffer
+
+    def _stats(self, endpoint):
+        buffer = self._buffer()
+        stats = buffer.get(endpoint)
+        if stats is None:
+            stats = buffer[endpoint] = EndpointStats()
+        return stats
+
+    def start(self, endpoint):
+        """Mark a request as in flight"""
+        self._stats(endpoint).in_flight += 1
+
+    def finish(self, endpoint, method, status_code, duration, error=False):
+        """Record a finished request; duration is in seconds"""
+        stats = self._stats(endpoint)
+        duration_us = max(int(duration * 1_000_000), 0)
+        index = bucket_index(duration_us)
+        stats.buckets[index] = stats.buckets.get(index, 0) + 1
+        stats.count += 1
+        stats.total_us += duration_us
+        stats.in_flight -= 1
+        key = (method, status_code)
+        stats.statuses[key] = stats.statuses.get(key, 0) + 1
+        if error or status_code >= 500:
+            stats.errors += 1
+
+    def snapshot(self):
+        """Merge every thread's buffer into one {endpoint: EndpointStats}"""
+        with self._registry_lock:
+            live = []
+            for thread, buffer in self._buffers:
+                if thread.is_alive():
+                    live.append((thread, buffer))
+                else:
+                    self._merge_into(self._retired, buffer)
+            self._buffers = live
+            merged = {}
+            self._merge_into(merged, self._retired)
+            for _, buffer in live:
+                self._merge_into(merged, buffer)
+        return merged
+
+    @staticmethod
+    def _merge_into(target, buffer):
+        for endpoint, stats in buffer.copy().items():
+            if endpoint not in target:
+                target[endpoint] = EndpointStats()
+            target[endpoint].merge(stats)
+
+    def reset(self):
+        """Drop every recorded metric"""
+        with self._registry_lock:
+            for _, buffer in self._buffers:
+                buffer.clear()
+            self._retired = {}
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for endpoint, stats in sorted(snapshot.items()):
+            label = _escape(endpoint)
+            for bound, count in zip(EXPORT_BUCKETS, stats.cumulative_counts(EXPORT_BUCKETS)):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {stats.count}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{label}"}} {stats.total_us / 1_000_000}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{label}"}} {stats.count}')
+
+        lines += [
+            '# HELP http_request_duration_quantile_seconds Request latency quantiles by endpoint (1% precision).',
+            '# TYPE http_request_duration_quantile_seconds gauge'
+        ]
+        for endpoint, stats in sorted(snapshot.items()):
+            for q in EXPORT_QUANTILES:
+                lines.append(
+                    f'http_request_duration_quantile_seconds{{endpoint="{_escape(endpoint)}",quantile="{q}"}} {stats.quantile(q)}'
+                )
+
+        lines += ['# HELP http_requests_total Requests by endpoint, method and status.', '# TYPE http_requests_total counter']
+        for endpoint, stats in sorted(snapshot.items()):
+            for (method, status_code), count in sorted(stats.statuses.items()):
+                lines.append(
+                    f'http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status_code}"}} {count}'
+                )
+
+        lines += ['# HELP http_request_errors_total Requests that raised or returned 5xx.', '# TYPE http_request_errors_total counter']
+        for endpoint, stats in sorted(snapshot.items()):
+            lines.append(f'http_request_errors_total{{endpoint="{_escape(endpoint)}"}} {stats.errors}')
+
+        lines += ['# HELP http_requests_in_flight Requests currently being served.', '# TYPE http_requests_in_flight gauge']
+        for endpoint, stats in sorted(snapshot.items()):
+            lines.append(f'http_requests_in_flight{{endpoint="{_escape(endpoint)}"}} {stats.in_flight}')
+
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _endpoint_label():
+    """Route template of the current request, bounded in cardinality"""
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+def init_app(app, metrics=None):
+    """Record metrics for every request handled by the app"""
+    metrics = metrics or request_metrics
+
+    @app.before_request
+    def _start_request_metrics():
+        g._metrics_endpoint = _endpoint_label()
+        g._metrics_start = time.perf_counter()
+        metrics.start(g._metrics_endpoint)
+
+    @app.after_request
+    def _capture_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(error=None):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        status_code = g.pop('_metrics_status', 500)
+        metrics.finish(g.pop('_metrics_endpoint'), request.method, status_code,
+                       time.perf_counter() - start, error=error is not None)
+
+    return metrics
+
+# Global request metrics instance
+request_metrics = RequestMetrics()
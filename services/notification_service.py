@@ -6,11 +6,13 @@ from models.transaction import Transaction
 from models.bill import Bill
 from models.emi import EMI
 from services.auth import log_authentication_event
+from services.tracing import traced
 
 class NotificationService:
     """Business logic service for notification operations"""
     
     @staticmethod
+    @traced
     def send_transaction_notification(user_id, transaction):
         """Send notification for a transaction"""
         try:
@@ -31,6 +33,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def send_bill_reminder(user_id, bill):
         """Send bill payment reminder"""
         try:
@@ -62,6 +65,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def send_emi_reminder(user_id, emi):
         """Send EMI payment reminder"""
         try:
@@ -93,6 +97,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def send_security_alert(user_id, alert_type, details):
         """Send security alert notification"""
         try:
@@ -121,6 +126,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def send_credit_limit_alert(user_id, card, usage_percentage):
         """Send credit limit usage alert"""
         try:
@@ -150,6 +156,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def send_promotional_notification(user_id, title, message, action_url=None):
         """Send promotional notification"""
         try:
@@ -168,6 +175,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def process_auto_notifications():
         """Process automatic notifications (bills, EMIs, etc.)"""
         try:
@@ -198,9 +206,9 @@ class NotificationService:
                     processed_count += 1
             
             # Process credit limit alerts
-            cards = Card.objects(is_active=True, is_blocked=False)
+            cards = Card.summaries(is_active=True, is_blocked=False)
             for card in cards:
-                usage_percentage = (card.outstanding_balance / card.credit_limit) * 100
+                usage_percentage = card.get_credit_utilization()
                 if usage_percentage >= 80:
                     result = NotificationService.send_credit_limit_alert(card.user_id, card, usage_percentage)
                     if result['success']:
@@ -212,6 +220,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def get_notification_summary(user_id):
         """Get notification summary for user"""
         try:
@@ -247,6 +256,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def mark_all_as_read(user_id):
         """Mark all notifications as read for user"""
         try:
@@ -263,6 +273,7 @@ class NotificationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
+    @traced
     def cleanup_old_notifications(days=30):
         """Clean up old notifications"""
         try:
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import request, has_request_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingUnavailable(Exception):
+    """Raised when the hashing executor cannot accept more work"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class HashingQueueFull(HashingUnavailable):
+    """Raised when the global hashing queue is at capacity"""
+
+class ClientHashingLimitExceeded(HashingUnavailable):
+    """Raised when one client already has too many hashes pending"""
+
+class PasswordHasher:
+    """Bounded executor for CPU-heavy password hashing
+
+    Request threads hand hashing work to a small worker pool sized to the
+    CPU, so a login burst queues behind a fixed number of hashes instead of
+    pinning every web worker. Admission is checked before anything is
+    queued: the total backlog is capped, and so is the number of pending
+    hashes per client.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, per_client_limit=None, method=None, timeout=None):
+        self.max_workers = max_workers or int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '64'))
+        self.per_client_limit = per_client_limit or int(os.environ.get('PASSWORD_HASH_PER_CLIENT', '4'))
+        self.method = method or os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+        self.timeout = timeout or float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self._client_pending = {}
+        # werkzeug expands short names (e.g. "pbkdf2"), so read the full prefix from a real hash
+        self._method_prefix = self._executor.submit(lambda: generate_password_hash('', self.method).split('$', 1)[0])
+
+        # Metrics
+        self._pending = 0  # Admitted but not yet finished
+        self._running = 0
+        self._completed = 0
+        self._rejected_queue_full = 0
+        self._rejected_client_limit = 0
+        self._total_wait_ms = 0.0
+        self._total_hash_ms = 0.0
+
+    def hash_password(self, password, client_id=None):
+        """Hash a password with the configured work factor"""
+        return self.run(generate_password_hash, password, self.method, client_id=client_id)
+
+    def check_password(self, password_hash, password, client_id=None):
+        """Check a password against a stored hash"""
+        return self.run(check_password_hash, password_hash, password, client_id=client_id)
+
+    def needs_rehash(self, password_hash):
+        """Check if a stored hash was made with a different method or work factor"""
+        return password_hash.split('$', 1)[0] != self._method_prefix.result()
+
+    def run(self, func, *args, client_id=None):
+        """Run a hashing function on the executor and wait for its result
+
+        Raises HashingUnavailable subclasses instead of queueing when the
+        executor or the client is over its limit.
+        """
+        client_id = client_id or self._current_client_id()
+        self._admit(client_id)
+        try:
+            return self._submit(client_id, func, args).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingUnavailable('Password hashing timed out')
+
+    def submit(self, func, *args, client_id=None):
+        """Queue hashing work without waiting for it (e.g. a rehash after login)
+
+        Returns the future, or None if the executor is over its limits.
+        """
+        client_id = client_id or self._current_client_id()
+        try:
+            self._admit(client_id)
+        except HashingUnavailable:
+            return None
+        return self._submit(client_id, func, args)
+
+    def _submit(self, client_id, func, args):
+        """Queue admitted work, releasing its slot once it has run"""
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._total_wait_ms += (started_at - submitted_at) * 1000
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_hash_ms += (time.perf_counter() - started_at) * 1000
+                # Released before the result is visible so callers see settled metrics
+                self._release(client_id)
+
+        try:
+            return self._executor.submit(task)
+        except Exception:
+            self._release(client_id)
+            raise
+
+    def get_metrics(self):
+        """Get queue depth and throughput metrics"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queue_capacity': self.max_queue,
+                'queue_depth': max(self._pending - self._running, 0),
+                'running': self._running,
+                'completed': self._completed,
+                'rejected_queue_full': self._rejected_queue_full,
+                'rejected_client_limit': self._rejected_client_limit,
+                'clients_pending': len(self._client_pending),
+                'avg_wait_ms': self._total_wait_ms / self._completed if self._completed else 0.0,
+                'avg_hash_ms': self._total_hash_ms / self._completed if self._completed else 0.0
+            }
+
+    def _admit(self, client_id):
+        """Reserve a slot for one hash or raise HashingUnavailable"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected_queue_full += 1
+                raise HashingQueueFull('Password hashing queue is full')
+            if self._client_pending.get(client_id, 0) >= self.per_client_limit:
+                self._rejected_client_limit += 1
+                raise ClientHashingLimitExceeded('Too many concurrent authentication requests')
+            self._pending += 1
+            self._client_pending[client_id] = self._client_pending.get(client_id, 0) + 1
+
+    def _release(self, client_id):
+        """Free the slot reserved by _admit"""
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            remaining = self._client_pending.get(client_id, 1) - 1
+            if remaining > 0:
+                self._client_pending[client_id] = remaining
+            else:
+                self._client_pending.pop(client_id, None)
+
+    @staticmethod
+    def _current_client_id():
+        """Identify the calling client from the current request, if any"""
+        if has_request_context():
+            return request.remote_addr or 'unknown'
+        return 'internal'
+
+# Global password hasher instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,91 @@
+# Permission registry compiled into integer bitmasks at import time.
+# Bit positions are embedded in issued JWTs, so only ever append to PERMISSIONS.
+PERMISSIONS = (
+    'view_own_cards', 'create_card', 'update_own_card', 'block_own_card',
+    'view_own_transactions', 'create_transaction', 'refund_transaction',
+    'view_own_bills', 'create_bill', 'pay_bill', 'update_own_bill',
+    'view_own_emis', 'create_emi', 'pay_emi', 'update_own_emi',
+    'view_own_cibil', 'create_cibil', 'update_own_cibil',
+    'view_own_notifications', 'create_notification', 'update_own_notification',
+    'view_all_cards', 'update_any_card', 'block_any_card',
+    'view_all_transactions', 'view_all_bills', 'view_all_emis',
+    'view_all_cibil', 'view_all_notifications', 'manage_notifications',
+    'delete_any_card', 'delete_any_transaction', 'delete_any_bill',
+    'delete_any_emi', 'delete_any_cibil', 'delete_any_notification',
+    'manage_users', 'view_analytics', 'system_settings',
+    'view_audit_log'
+)
+
+# Permissions granted directly to each role
+ROLE_PERMISSIONS = {
+    'user': (
+        'view_own_cards', 'create_card', 'update_own_card', 'block_own_card',
+        'view_own_transactions', 'create_transaction', 'refund_transaction',
+        'view_own_bills', 'create_bill', 'pay_bill', 'update_own_bill',
+        'view_own_emis', 'create_emi', 'pay_emi', 'update_own_emi',
+        'view_own_cibil', 'create_cibil', 'update_own_cibil',
+        'view_own_notifications', 'create_notification', 'update_own_notification'
+    ),
+    'manager': (
+        'view_all_cards', 'update_any_card', 'block_any_card',
+        'view_all_transactions', 'view_all_bills', 'view_all_emis',
+        'view_all_cibil', 'view_all_notifications', 'manage_notifications'
+    ),
+    'admin': (
+        'delete_any_card', 'delete_any_transaction', 'delete_any_bill',
+        'delete_any_emi', 'delete_any_cibil', 'delete_any_notification',
+        'manage_users', 'view_analytics', 'system_settings',
+        'view_audit_log'
+    )
+}
+
+# Each role also holds every permission of the role it inherits from
+ROLE_INHERITS = {
+    'manager': 'user',
+    'admin': 'manager'
+}
+
+PERMISSION_BITS = {name: 1 << position for position, name in enumerate(PERMISSIONS)}
+
+def _compile_role_mask(role, seen=()):
+    """Resolve a role's own and inherited permissions into one bitmask"""
+    if role in seen:
+        raise ValueError(f'Circular role inheritance at {role}')
+    mask = 0
+    for name in ROLE_PERMISSIONS.get(role, ()):
+        mask |= PERMISSION_BITS[name]
+    parent = ROLE_INHERITS.get(role)
+    if parent:
+        mask |= _compile_role_mask(parent, seen + (role,))
+    return mask
+
+ROLE_MASKS = {role: _compile_role_mask(role) for role in ROLE_PERMISSIONS}
+ROLE_PERMISSION_NAMES = {
+    role: tuple(name for name in PERMISSIONS if mask & PERMISSION_BITS[name])
+    for role, mask in ROLE_MASKS.items()
+}
+
+def permission_bit(permission: str) -> int:
+    """Get the bit for a permission name, failing fast on unknown names"""
+    try:
+        return PERMISSION_BITS[permission]
+    except KeyError:
+        raise ValueError(f'Unknown permission: {permission}') from None
+
+def role_mask(role: str) -> int:
+    """Get the compiled permission mask for a role (0 for unknown roles)"""
+    return ROLE_MASKS.get(role, 0)
+
+def claims_mask(claims: dict) -> int:
+    """Get the permission mask from JWT claims
+
+    Tokens issued before masks were embedded fall back to their role.
+    """
+    mask = claims.get('perms')
+    if isinstance(mask, int):
+        return mask
+    return role_mask(claims.get('role', 'user'))
+
+def permissions_from_mask(mask: int) -> list:
+    """Expand a permission mask back into permission names"""
+    return [name for name in PERMISSIONS if mask & PERMISSION_BITS[name]]
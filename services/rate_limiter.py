@@ -0,0 +1,167 @@
+import os
+import math
+import time
+import heapq
+import threading
+from functools import wraps
+from flask import request, jsonify, current_app
+
+class RateLimitResult:
+    """Outcome of one rate limit check"""
+
+    __slots__ = ('allowed', 'limit', 'remaining', 'retry_after')
+
+    def __init__(self, allowed, limit, remaining, retry_after=0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+class RateLimitBackend:
+    """Interface for rate limit counter storage
+
+    Multi-worker deployments should plug in a shared store (e.g. Redis) so
+    every worker sees the same counters.
+    """
+
+    def hit(self, key, limit, window, now=None):
+        """Record one request for key and return a RateLimitResult"""
+        raise NotImplementedError
+
+    def reset(self, key=None):
+        """Forget the counters for one key, or for every key"""
+        raise NotImplementedError
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Process-local sliding window counters
+
+    Each key keeps the count for the current and previous fixed window; the
+    previous count is weighted by how much of it still overlaps the sliding
+    window. That is O(1) memory per key, unlike a log of timestamps.
+    """
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+        self._windows = {}  # key -> [window index, current count, previous count, window]
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        window_index = int(now // window)
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None:
+                if len(self._windows) >= self.max_keys:
+                    self._purge_idle(now)
+                state = self._windows[key] = [window_index, 0, 0, window]
+            elif state[0] != window_index:
+                # Roll forward; the previous window only counts if it is the adjacent one
+                state[2] = state[1] if window_index - state[0] == 1 else 0
+                state[0] = window_index
+                state[1] = 0
+
+            overlap = 1 - (now - window_index * window) / window
+            estimated = state[2] * overlap + state[1]
+            if estimated >= limit:
+                retry_after = self._retry_after(state, limit, window, now)
+                return RateLimitResult(False, limit, 0, retry_after)
+
+            state[1] += 1
+            return RateLimitResult(True, limit, max(int(limit - estimated - 1), 0))
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(key, None)
+
+    @staticmethod
+    def _retry_after(state, limit, window, now):
+        """Seconds until the sliding estimate drops below the limit"""
+        window_index, current, previous, _ = state
+        window_start = window_index * window
+        if current >= limit or previous == 0:
+            return max(math.ceil(window_start + window - now), 1)
+        # Solve previous * (1 - elapsed / window) + current < limit for elapsed
+        elapsed_needed = window * (1 - (limit - current) / previous)
+        return max(math.ceil(window_start + elapsed_needed - now), 1)
+
+    def _purge_idle(self, now):
+        """Make room for a new key, keeping at most max_keys counters
+
+        Keys whose counters no longer affect the sliding window go first.
+        If that frees nothing, the least recently active keys are evicted,
+        a tenth of max_keys at a time so the scan is not repeated per key.
+        """
+        for key in [key for key, state in self._windows.items() if (state[0] + 2) * state[3] <= now]:
+            del self._windows[key]
+        if len(self._windows) >= self.max_keys:
+            count = len(self._windows) - self.max_keys + max(self.max_keys // 10, 1)
+            oldest = heapq.nsmallest(count, self._windows.items(), key=lambda item: (item[1][0] + 1) * item[1][3])
+            for key, _ in oldest:
+                del self._windows[key]
+
+class RateLimiter:
+    """Sliding window rate limiter with a pluggable counter backend"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or InMemoryRateLimitBackend()
+
+    def set_backend(self, backend):
+        """Plug in a different counter backend"""
+        self.backend = backend
+
+    def hit(self, scope, key, limit, window):
+        """Count one request for a key within a scope"""
+        return self.backend.hit(f'{scope}:{key}', limit, window)
+
+    def limit(self, scope, limit, per, key_func=None):
+        """Decorator that rejects requests over ``limit`` per ``per`` seconds with 429
+
+        Limits can be overridden with RATE_LIMIT_<SCOPE>="<limit>/<seconds>",
+        and the app config flag RATE_LIMIT_ENABLED turns every limit off.
+        Apply it below ``token_required`` to key on the authenticated user.
+        """
+        override = os.environ.get(f'RATE_LIMIT_{scope.upper()}')
+        if override:
+            limit, per = (int(part) for part in override.split('/', 1))
+        key_func = key_func or client_ip_key
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                    return fn(*args, **kwargs)
+                key = key_func()
+                if key is None:
+                    return fn(*args, **kwargs)
+                result = self.hit(scope, key, limit, per)
+                if not result.allowed:
+                    response = jsonify({'error': 'Too many requests, please try again later'})
+                    response.headers['Retry-After'] = str(result.retry_after)
+                    response.headers['X-RateLimit-Limit'] = str(limit)
+                    response.headers['X-RateLimit-Remaining'] = '0'
+                    return response, 429
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+def client_ip_key():
+    """Key requests by client address"""
+    return request.remote_addr or 'unknown'
+
+def user_key():
+    """Key requests by the authenticated user, falling back to client address"""
+    claims = getattr(request, 'user_claims', {})
+    return claims.get('user_id') or client_ip_key()
+
+def username_key():
+    """Key login attempts by the submitted username, to slow down credential guessing"""
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    return str(username).lower() if username else None
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
+rate_limit = rate_limiter.limit
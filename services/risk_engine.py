@@ -0,0 +1,360 @@
+import os
+import time
+import heapq
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+# Transactions per card within RISK_VELOCITY_WINDOW seconds before the velocity rule fires
+RISK_VELOCITY_LIMIT = int(os.environ.get('RISK_VELOCITY_LIMIT', '6'))
+RISK_VELOCITY_WINDOW = int(os.environ.get('RISK_VELOCITY_WINDOW', '600'))
+# Amount spent per card within RISK_SPEND_WINDOW seconds before the spend rule fires
+RISK_SPEND_LIMIT = float(os.environ.get('RISK_SPEND_LIMIT', '10000'))
+RISK_SPEND_WINDOW = int(os.environ.get('RISK_SPEND_WINDOW', '3600'))
+# Single transactions above this share of the credit limit are high value
+RISK_HIGH_VALUE_RATIO = float(os.environ.get('RISK_HIGH_VALUE_RATIO', '0.8'))
+# Transactions a card needs before new categories or locations count as unusual
+RISK_NOVELTY_MIN_HISTORY = int(os.environ.get('RISK_NOVELTY_MIN_HISTORY', '5'))
+RISK_NOVELTY_MAX_ITEMS = 64
+# Total rule score at which a transaction is treated as suspicious
+RISK_BLOCK_SCORE = float(os.environ.get('RISK_BLOCK_SCORE', '1.0'))
+RISK_WARMUP_DAYS = int(os.environ.get('RISK_WARMUP_DAYS', '30'))
+RISK_WARMUP_LIMIT = int(os.environ.get('RISK_WARMUP_LIMIT', '200000'))
+# Cards unseen for this many seconds are forgotten; past RISK_MAX_CARDS the least recently seen go first
+RISK_STATE_TTL = int(os.environ.get('RISK_STATE_TTL', str(RISK_WARMUP_DAYS * 86400)))
+RISK_MAX_CARDS = int(os.environ.get('RISK_MAX_CARDS', '500000'))
+# Events between sweeps for idle cards
+RISK_SWEEP_INTERVAL = 10000
+LOCK_STRIPES = 64
+
+class TransactionEvent:
+    """A card transaction as seen by the risk engine"""
+
+    __slots__ = ('card_id', 'amount', 'merchant_category', 'location', 'is_international',
+                 'timestamp', 'credit_limit', 'card_international')
+
+    def __init__(self, card_id, amount, merchant_category=None, location=None, is_international=False,
+                 timestamp=None, credit_limit=None, card_international=True):
+        self.card_id = str(card_id)
+        self.amount = float(amount)
+        self.merchant_category = merchant_category
+        self.location = location
+        self.is_international = bool(is_international)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.credit_limit = credit_limit
+        self.card_international = card_international
+
+    @classmethod
+    def from_transaction_data(cls, card, transaction_data):
+        """Build an event from a card and incoming transaction data"""
+        return cls(
+            card.id,
+            transaction_data['amount'],
+            transaction_data.get('merchant_category'),
+            transaction_data.get('location'),
+            transaction_data.get('is_international', False),
+            credit_limit=card.credit_limit,
+            card_international=card.is_international
+        )
+
+class SlidingWindow:
+    """Count and sum of the values seen in the last `seconds` seconds
+
+    Each value is appended once and evicted once, so updates are O(1)
+    amortized and the totals are kept running instead of recomputed.
+    """
+
+    __slots__ = ('seconds', 'entries', 'total')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.entries = deque()
+        self.total = 0.0
+
+    def evict(self, now):
+        cutoff = now - self.seconds
+        entries = self.entries
+        while entries and entries[0][0] <= cutoff:
+            self.total -= entries.popleft()[1]
+
+    def add(self, timestamp, value=1.0):
+        self.entries.append((timestamp, value))
+        self.total += value
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+class NoveltySet:
+    """Most recently seen distinct values, bounded in size"""
+
+    __slots__ = ('items', 'max_items')
+
+    def __init__(self, max_items=RISK_NOVELTY_MAX_ITEMS):
+        self.items = {}  # insertion ordered; oldest first
+        self.max_items = max_items
+
+    def __contains__(self, value):
+        return value in self.items
+
+    def add(self, value):
+        if value is None:
+            return
+        self.items.pop(value, None)
+        self.items[value] = True
+        if len(self.items) > self.max_items:
+            del self.items[next(iter(self.items))]
+
+class CardRiskState:
+    """Streaming state kept per card"""
+
+    __slots__ = ('velocity', 'spend', 'categories', 'locations', 'history', 'last_seen')
+
+    def __init__(self):
+        self.velocity = SlidingWindow(RISK_VELOCITY_WINDOW)
+        self.spend = SlidingWindow(RISK_SPEND_WINDOW)
+        self.categories = NoveltySet()
+        self.locations = NoveltySet()
+        self.history = 0
+        self.last_seen = 0.0
+
+    def advance(self, now):
+        """Drop window entries that fell out of their window"""
+        self.velocity.evict(now)
+        self.spend.evict(now)
+
+    def record(self, event):
+        self.velocity.add(event.timestamp)
+        self.spend.add(event.timestamp, event.amount)
+        self.categories.add(event.merchant_category)
+        self.locations.add(event.location)
+        self.history += 1
+        self.last_seen = max(self.last_seen, event.timestamp)
+
+class RiskRule:
+    """A check evaluated against a card's state before the event is recorded
+
+    Rules must only read the state, so they run in O(1) per event.
+    """
+
+    name = 'rule'
+    score = 1.0
+
+    def evaluate(self, state, event):
+        """Return True when the event matches the rule"""
+        raise NotImplementedError
+
+class HighValueRule(RiskRule):
+    name = 'high_value'
+
+    def __init__(self, ratio=None):
+        self.ratio = RISK_HIGH_VALUE_RATIO if ratio is None else ratio
+
+    def evaluate(self, state, event):
+        return event.credit_limit is not None and event.amount > event.credit_limit * self.ratio
+
+class VelocityRule(RiskRule):
+    name = 'rapid_transactions'
+
+    def __init__(self, limit=None):
+        self.limit = RISK_VELOCITY_LIMIT if limit is None else limit
+
+    def evaluate(self, state, event):
+        return state.velocity.count >= self.limit
+
+class SpendRule(RiskRule):
+    name = 'high_value_transactions'
+    score = 0.6
+
+    def __init__(self, limit=None):
+        self.limit = RISK_SPEND_LIMIT if limit is None else limit
+
+    def evaluate(self, state, event):
+        return state.spend.total + event.amount > self.limit
+
+class UnexpectedInternationalRule(RiskRule):
+    name = 'unexpected_international'
+
+    def evaluate(self, state, event):
+        return event.is_international and not event.card_international
+
+class CategoryNoveltyRule(RiskRule):
+    name = 'new_merchant_category'
+    score = 0.3
+
+    def evaluate(self, state, event):
+        return (state.history >= RISK_NOVELTY_MIN_HISTORY and event.merchant_category is not None
+                and event.merchant_category not in state.categories)
+
+class LocationNoveltyRule(RiskRule):
+    name = 'unusual_location'
+    score = 0.5
+
+    def evaluate(self, state, event):
+        return (state.history >= RISK_NOVELTY_MIN_HISTORY and event.location is not None
+                and event.location not in state.locations)
+
+DEFAULT_RULES = (
+    HighValueRule, VelocityRule, SpendRule, UnexpectedInternationalRule, CategoryNoveltyRule, LocationNoveltyRule
+)
+
+class RiskAssessment:
+    """Score of one event and the rules that contributed to it"""
+
+    __slots__ = ('score', 'reasons', 'suspicious')
+
+    def __init__(self, score, reasons, suspicious):
+        self.score = score
+        self.reasons = reasons
+        self.suspicious = suspicious
+
+    def to_dict(self):
+        return {'score': self.score, 'reasons': self.reasons, 'suspicious': self.suspicious}
+
+class RiskEngine:
+    """In-memory streaming fraud scoring
+
+    Keeps sliding windows and novelty sets per card, so scoring a
+    transaction needs no database query. Cards are spread over striped
+    locks, so concurrent requests for different cards rarely contend.
+    Every RISK_SWEEP_INTERVAL events, cards idle for longer than the
+    state TTL are dropped, as are the least recently seen cards beyond
+    max_cards.
+    """
+
+    def __init__(self, rules=None, block_score=None, state_ttl=None, max_cards=None):
+        self.rules = [rule() for rule in DEFAULT_RULES] if rules is None else list(rules)
+        self.block_score = RISK_BLOCK_SCORE if block_score is None else block_score
+        self.state_ttl = RISK_STATE_TTL if state_ttl is None else state_ttl
+        self.max_cards = RISK_MAX_CARDS if max_cards is None else max_cards
+        self._states = {}
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._until_sweep = RISK_SWEEP_INTERVAL
+        self.events = 0
+        self.flagged = 0
+        self.evicted = 0
+
+    def add_rule(self, rule):
+        """Plug in an additional rule"""
+        self.rules.append(rule)
+
+    def _state(self, card_id):
+        state = self._states.get(card_id)
+        if state is None:
+            state = self._states.setdefault(card_id, CardRiskState())
+        return state
+
+    def _lock(self, card_id):
+        return self._locks[hash(card_id) % LOCK_STRIPES]
+
+    def assess(self, event, record=True):
+        """Score an event against its card's history, then add it to that history
+
+        With record=False the history is left unchanged, and a card seen for
+        the first time is scored against an empty state without tracking it.
+        """
+        with self._lock(event.card_id):
+            state = self._state(event.card_id) if record else self._states.get(event.card_id) or CardRiskState()
+            state.advance(event.timestamp)
+            score = 0.0
+            reasons = []
+            for rule in self.rules:
+                if rule.evaluate(state, event):
+                    score += rule.score
+                    reasons.append(rule.name)
+            if record:
+                state.record(event)
+        self._maybe_sweep(event.timestamp)
+        suspicious = score >= self.block_score
+        self.events += 1
+        if suspicious:
+            self.flagged += 1
+        return RiskAssessment(score, reasons, suspicious)
+
+    def record(self, event):
+        """Add an event to its card's history without scoring it"""
+        with self._lock(event.card_id):
+            state = self._state(event.card_id)
+            state.advance(event.timestamp)
+            state.record(event)
+        self._maybe_sweep(event.timestamp)
+
+    def _maybe_sweep(self, now):
+        # Unlocked countdown; an occasional extra or skipped sweep is harmless.
+        # Idleness is measured in event time, like the windows
+        self._until_sweep -= 1
+        if self._until_sweep <= 0:
+            self._until_sweep = RISK_SWEEP_INTERVAL
+            self.evict_idle(now)
+
+    def evict_idle(self, now=None):
+        """Drop cards idle for longer than the state TTL, then the least recently seen over max_cards
+
+        A card seen again while the sweep runs is kept. Returns the number
+        of cards dropped.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.state_ttl
+        seen = [(state.last_seen, card_id) for card_id, state in list(self._states.items())]
+        candidates = [entry for entry in seen if entry[0] < cutoff]
+        over = len(seen) - len(candidates) - self.max_cards
+        if over > 0:
+            candidates.extend(heapq.nsmallest(over, (entry for entry in seen if entry[0] >= cutoff)))
+
+        evicted = 0
+        for last_seen, card_id in candidates:
+            with self._lock(card_id):
+                state = self._states.get(card_id)
+                if state is not None and state.last_seen == last_seen:
+                    del self._states[card_id]
+                    evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def forget(self, card_id):
+        """Drop the state of a card"""
+        self._states.pop(str(card_id), None)
+
+    def reset(self):
+        """Drop the state of every card"""
+        self._states = {}
+
+    def warm_up(self, days=None, limit=None):
+        """Rebuild card state from recent debit transactions
+
+        Reads the newest transactions first, so when limit is reached it is
+        the oldest ones that are left out, then replays them oldest first.
+        Returns the number of transactions replayed.
+        """
+        from models.transaction import Transaction
+
+        days = RISK_WARMUP_DAYS if days is None else days
+        limit = RISK_WARMUP_LIMIT if limit is None else limit
+        since = datetime.utcnow() - timedelta(days=days)
+        cursor = Transaction.objects(
+            transaction_date__gte=since, transaction_type='debit'
+        ).only(
+            'card_id', 'amount', 'merchant_category', 'location', 'transaction_date'
+        ).order_by('-transaction_date').limit(limit).as_pymongo()
+        documents = list(cursor)
+
+        epoch = datetime(1970, 1, 1)
+        replayed = 0
+        for document in reversed(documents):
+            self.record(TransactionEvent(
+                document['card_id'],
+                document.get('amount', 0),
+                document.get('merchant_category'),
+                document.get('location'),
+                timestamp=(document['transaction_date'] - epoch).total_seconds()
+            ))
+            replayed += 1
+        return replayed
+
+    def get_stats(self):
+        """Tracked cards and scored event counters"""
+        return {'cards': len(self._states), 'events': self.events, 'flagged': self.flagged,
+                'evicted': self.evicted}
+
+# Global risk engine instance
+risk_engine = RiskEngine()
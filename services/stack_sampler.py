@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from flask import request, g
+
+# Requests slower than this (ms) get their stack samples saved
+STACK_SAMPLE_BUDGET_MS = float(os.environ.get('STACK_SAMPLE_BUDGET_MS', os.environ.get('LOG_SLOW_REQUEST_MS', '1000')))
+# Sampling of a request starts once it has used this fraction of the budget
+STACK_SAMPLE_ARM_RATIO = float(os.environ.get('STACK_SAMPLE_ARM_RATIO', '0.5'))
+STACK_SAMPLE_INTERVAL_MS = float(os.environ.get('STACK_SAMPLE_INTERVAL_MS', '10'))
+# Upper bound on the share of wall time the sampler thread may spend taking samples
+STACK_SAMPLE_MAX_OVERHEAD = float(os.environ.get('STACK_SAMPLE_MAX_OVERHEAD', '0.02'))
+STACK_SAMPLE_DIR = os.environ.get('STACK_SAMPLE_DIR', os.path.join('logs', 'profiles'))
+STACK_SAMPLE_MAX_FILES = int(os.environ.get('STACK_SAMPLE_MAX_FILES', '200'))
+STACK_SAMPLE_MAX_DEPTH = 128
+
+class RequestSamples:
+    """Stack samples collected for one in-flight request"""
+
+    __slots__ = ('thread_id', 'started', 'method', 'endpoint', 'stacks', 'samples', 'path')
+
+    def __init__(self, thread_id, method, endpoint):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.method = method
+        self.endpoint = endpoint
+        self.stacks = {}  # collapsed stack -> sample count
+        self.samples = 0
+        self.path = None  # set once the profile has been saved
+
+    @property
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+class StackSampler:
+    """Statistical stack sampler for requests that run over a latency budget
+
+    One background thread periodically reads the stacks of the request
+    threads that have been running for longer than the arm point, using
+    sys._current_frames(). Fast requests are never sampled, and the
+    sampling interval grows whenever taking samples would cost more than
+    max_overhead of wall time. Profiles are written in the collapsed stack
+    format ("frame;frame;frame count") read by flamegraph.pl and speedscope,
+    next to a JSON file with the request metadata.
+    """
+
+    def __init__(self, budget_ms=None, arm_ratio=None, interval_ms=None, max_overhead=None,
+                 directory=None, max_files=None):
+        self.budget_ms = STACK_SAMPLE_BUDGET_MS if budget_ms is None else budget_ms
+        self.arm_ratio = STACK_SAMPLE_ARM_RATIO if arm_ratio is None else arm_ratio
+        self.base_interval = (STACK_SAMPLE_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.max_overhead = STACK_SAMPLE_MAX_OVERHEAD if max_overhead is None else max_overhead
+        self.directory = directory or STACK_SAMPLE_DIR
+        self.max_files = STACK_SAMPLE_MAX_FILES if max_files is None else max_files
+        self.interval = self.base_interval
+        self._active = {}  # thread id -> RequestSamples
+        self._lock = threading.Lock()
+        self._labels = {}  # code object -> frame label
+        self._thread = None
+        self._stopped = threading.Event()
+        self.passes = 0
+        self.sampling_seconds = 0.0
+        self.profiles_saved = 0
+
+    # Request scope
+
+    def begin(self, method, endpoint):
+        """Register the calling thread's request for sampling"""
+        samples = RequestSamples(threading.get_ident(), method, endpoint)
+        with self._lock:
+            self._active[samples.thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def current(self):
+        """Samples of the request being served by this thread, if any"""
+        return self._active.get(threading.get_ident())
+
+    def end(self):
+        """Stop sampling the calling thread's request and return its samples"""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def stop(self):
+        """Stop the sampler thread"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # Sampling
+
+    def _run(self):
+        arm_seconds = self.budget_ms * self.arm_ratio / 1000
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            with self._lock:
+                armed = [samples for samples in self._active.values() if now - samples.started >= arm_seconds]
+                if not armed:
+                    continue
+                self._sample(armed)
+            cost = time.perf_counter() - now
+            self.passes += 1
+            self.sampling_seconds += cost
+            # Sleep long enough that sampling stays within max_overhead of wall time
+            self.interval = max(self.base_interval, cost / self.max_overhead)
+
+    def _sample(self, armed):
+        frames = sys._current_frames()
+        try:
+            for samples in armed:
+                frame = frames.get(samples.thread_id)
+                if frame is None:
+                    continue
+                stack = self._collapse(frame)
+                samples.stacks[stack] = samples.stacks.get(stack, 0) + 1
+                samples.samples += 1
+        finally:
+            del frames
+
+    def _collapse(self, frame):
+        """Render a stack root first as "module:function;module:function" """
+        labels = []
+        while frame is not None and len(labels) < STACK_SAMPLE_MAX_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                label = self._labels[code] = f'{module}:{code.co_name}'.replace(';', ':').replace(' ', '_')
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ';'.join(labels)
+
+    # Profiles
+
+    def save(self, samples, metadata=None):
+        """Write a request's samples to disk and return the profile path
+
+        Returns None when the request was never sampled. A request is only
+        saved once, so the first caller's metadata wins.
+        """
+        with self._lock:
+            if samples.path is not None or not samples.samples:
+                return samples.path
+            stacks = dict(samples.stacks)
+            # Microsecond timestamps keep profile names in chronological order for pruning
+            now_us = int(time.time() * 1_000_000)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(now_us // 1_000_000)) + f'{now_us % 1_000_000:06d}'
+            endpoint = ''.join(c if c.isalnum() else '_' for c in samples.endpoint).strip('_') or 'root'
+            samples.path = os.path.join(self.directory, f'{stamp}-{endpoint}-{uuid.uuid4().hex[:8]}.folded')
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(samples.path, 'w') as profile_file:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                profile_file.write(f'{stack} {count}\n')
+        details = {
+            'method': samples.method,
+            'endpoint': samples.endpoint,
+            'samples': samples.samples,
+            'sample_interval_ms': self.base_interval * 1000,
+            'budget_ms': self.budget_ms
+        }
+        details.update(metadata or {})
+        with open(samples.path[:-len('.folded')] + '.json', 'w') as metadata_file:
+            json.dump(details, metadata_file, default=str)
+        self.profiles_saved += 1
+        self._prune()
+        return samples.path
+
+    def save_current(self, metadata=None):
+        """Save the calling thread's request profile if it has been sampled"""
+        samples = self.current()
+        if samples is None:
+            return None
+        return self.save(samples, metadata)
+
+    def _prune(self):
+        """Keep only the newest max_files profiles"""
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+        for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+            base = os.path.join(self.directory, name[:-len('.folded')])
+            for path in (base + '.folded', base + '.json'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get_stats(self):
+        """Sampler overhead and output counters"""
+        return {
+            'active_requests': len(self._active),
+            'sample_passes': self.passes,
+            'sampling_seconds': self.sampling_seconds,
+            'interval_ms': self.interval * 1000,
+            'profiles_saved': self.profiles_saved
+        }
+
+def init_app(app, sampler=None):
+    """Sample the stacks of every request and save the ones over budget
+
+    Each saved profile is also logged to the performance log.
+    """
+    from services.logging_service import log_performance
+    from services.tracing import current_trace
+
+    sampler = sampler or stack_sampler
+    if not app.config.get('STACK_SAMPLER_ENABLED', True):
+        return sampler
+
+    @app.before_request
+    def _begin_stack_samples():
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g._stack_samples = sampler.begin(request.method, endpoint)
+
+    @app.after_request
+    def _capture_stack_status(response):
+        g._stack_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end_stack_samples(error=None):
+        samples = sampler.end()
+        g.pop('_stack_samples', None)
+        status_code = g.pop('_stack_status', 500)
+        if samples is None or not samples.samples or samples.path is not None:
+            return
+        duration = samples.elapsed_ms
+        if duration < sampler.budget_ms:
+            return
+        trace = current_trace()
+        metadata = {
+            'status_code': status_code,
+            'duration_ms': duration,
+            'user_id': getattr(request, 'user_claims', {}).get('user_id'),
+            'trace_id': trace.trace_id if trace is not None else None,
+            'error': type(error).__name__ if error is not None else None
+        }
+        path = sampler.save(samples, metadata)
+        log_performance('slow_request_profile', duration, dict(metadata, profile=path, endpoint=samples.endpoint))
+
+    return sampler
+
+# Global stack sampler instance
+stack_sampler = StackSampler()
@@ -0,0 +1,132 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+def token_digest(token: str) -> str:
+    """Digest used to key a token without keeping the raw token in memory"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of JWT claims that already passed signature verification
+
+    Entries expire at the token's own ``exp`` (capped by ``max_ttl``), so a
+    cached token is never accepted after it would have failed verification.
+    """
+
+    def __init__(self, max_size=None, max_ttl=None):
+        self.max_size = max_size or int(os.environ.get('JWT_CACHE_SIZE', '4096'))
+        self.max_ttl = max_ttl or float(os.environ.get('JWT_CACHE_TTL_SECONDS', '300'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, digest):
+        """Get cached claims for a token digest, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self._misses += 1
+                return None
+            claims, expires_at = entry
+            if expires_at <= now:
+                del self._entries[digest]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._hits += 1
+            # Copy so request handlers cannot alter the cached claims
+            return dict(claims)
+
+    def put(self, digest, claims):
+        """Cache verified claims until the token expires"""
+        expires_at = time.time() + self.max_ttl
+        if isinstance(claims.get('exp'), (int, float)):
+            expires_at = min(expires_at, claims['exp'])
+        with self._lock:
+            self._entries[digest] = (dict(claims), expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, digest):
+        """Drop one token from the cache"""
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        """Drop every cached token (e.g. after the JWT secret changes)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Get cache size and hit rate"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0
+            }
+
+class RevocationList:
+    """Interface for token revocation backends
+
+    Checked on every authenticated request, including cache hits, so
+    implementations should answer from memory or a fast shared store.
+    """
+
+    def revoke(self, digest, expires_at=None):
+        """Revoke one token until it would have expired anyway"""
+        raise NotImplementedError
+
+    def revoke_user(self, user_id, issued_before=None):
+        """Revoke every token issued to a user before a timestamp"""
+        raise NotImplementedError
+
+    def is_revoked(self, digest, claims):
+        """Check if a verified token has been revoked"""
+        raise NotImplementedError
+
+class InMemoryRevocationList(RevocationList):
+    """Process-local revocation list
+
+    Suitable for a single worker; multi-worker deployments should plug in a
+    shared backend through ``services.auth.set_revocation_list``.
+    """
+
+    def __init__(self):
+        self._tokens = {}  # digest -> expiry timestamp
+        self._users = {}  # user_id -> tokens issued before this timestamp are revoked
+        self._lock = threading.Lock()
+
+    def revoke(self, digest, expires_at=None):
+        with self._lock:
+            self._tokens[digest] = expires_at if expires_at is not None else float('inf')
+            self._purge_expired()
+
+    def revoke_user(self, user_id, issued_before=None):
+        with self._lock:
+            # JWT iat has one second resolution; tokens issued within the revoking
+            # second stay valid so a login right after a password change works
+            self._users[str(user_id)] = issued_before if issued_before is not None else int(time.time())
+
+    def is_revoked(self, digest, claims):
+        if digest in self._tokens:
+            return True
+        revoked_before = self._users.get(str(claims.get('user_id')))
+        if revoked_before is None:
+            return False
+        # Tokens without an issue time predate per-user revocation
+        return claims.get('iat', 0) < revoked_before
+
+    def _purge_expired(self):
+        """Forget revoked tokens that have expired on their own"""
+        now = time.time()
+        for digest in [digest for digest, expires_at in self._tokens.items() if expires_at <= now]:
+            del self._tokens[digest]
@@ -0,0 +1,279 @@
+import os
+import time
+import random
+import secrets
+import logging
+from datetime import datetime
+from functools import wraps
+from contextlib import contextmanager
+from flask import request, g, has_request_context
+from pymongo import monitoring
+from services.logging_service import StructuredMessage
+
+# Fraction of requests exported without an upstream sampling decision
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+# Requests slower than this (ms) or failing are always exported
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '500'))
+# Spans kept per trace; a request looping over many documents stays bounded
+TRACE_MAX_SPANS = int(os.environ.get('TRACE_MAX_SPANS', '500'))
+
+# Exported traces are written by the logging listener to logs/traces.log
+trace_logger = logging.getLogger('traces')
+
+def parse_traceparent(value):
+    """Split a W3C traceparent header into (trace_id, parent_id, sampled), or None if invalid"""
+    if not value:
+        return None
+    parts = value.strip().lower().split('-')
+    if len(parts) < 4:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(version) != 2 or version == 'ff' or (version == '00' and len(parts) != 4):
+        return None
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16)
+        int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name, parent_id, attributes=None, start=None):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+class Trace:
+    """Spans recorded while serving one request
+
+    Lives in flask.g, so it is only ever touched by the request's thread.
+    The first span is the request itself.
+    """
+
+    __slots__ = ('trace_id', 'parent_id', 'sampled', 'started_at', 'spans', 'stack', 'pending', 'dropped')
+
+    def __init__(self, trace_id=None, parent_id=None, sampled=False):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.started_at = time.time()
+        self.spans = []
+        self.stack = []
+        self.pending = {}  # MongoDB request_id -> (command name, collection)
+        self.dropped = 0
+
+    @property
+    def root(self):
+        return self.spans[0] if self.spans else None
+
+    def _record(self, span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def start_span(self, name, attributes=None):
+        """Open a span as a child of the innermost open span"""
+        parent_id = self.stack[-1].span_id if self.stack else self.parent_id
+        span = Span(name, parent_id, attributes)
+        self._record(span)
+        self.stack.append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        """Close a span, recording the exception type if it failed"""
+        span.end = time.perf_counter()
+        if error is not None:
+            span.error = type(error).__name__
+        if self.stack and self.stack[-1] is span:
+            self.stack.pop()
+        elif span in self.stack:
+            self.stack.remove(span)
+
+    def add_span(self, name, duration, attributes=None, error=None):
+        """Record an already finished child span of the given duration (seconds)"""
+        end = time.perf_counter()
+        parent_id = self.stack[-1].span_id if self.stack else self.parent_id
+        span = Span(name, parent_id, attributes, start=end - duration)
+        span.end = end
+        span.error = error
+        self._record(span)
+        return span
+
+    def traceparent(self):
+        """traceparent header naming the innermost open span as the parent"""
+        span = self.stack[-1] if self.stack else self.root
+        span_id = span.span_id if span is not None else secrets.token_hex(8)
+        return f"00-{self.trace_id}-{span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self):
+        """Convert the trace to a dictionary for export; span starts are offsets from the request start"""
+        origin = self.root.start if self.root is not None else 0
+        return {
+            'trace_id': self.trace_id,
+            'parent_id': self.parent_id,
+            'name': self.root.name if self.root is not None else None,
+            'started_at': datetime.utcfromtimestamp(self.started_at).isoformat(),
+            'duration_ms': self.root.duration_ms if self.root is not None else 0,
+            'sampled': self.sampled,
+            'dropped_spans': self.dropped,
+            'spans': [
+                {
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'name': span.name,
+                    'start_ms': (span.start - origin) * 1000,
+                    'duration_ms': span.duration_ms,
+                    'attributes': span.attributes,
+                    'error': span.error
+                }
+                for span in self.spans
+            ]
+        }
+
+def current_trace():
+    """Trace of the request being served, if any"""
+    if not has_request_context():
+        return None
+    return g.get('_trace')
+
+def outgoing_headers(headers=None):
+    """Add the traceparent header to the headers of an outbound call"""
+    headers = dict(headers or {})
+    trace = current_trace()
+    if trace is not None:
+        headers['traceparent'] = trace.traceparent()
+    return headers
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a span of the current request; a no-op outside requests"""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    current = trace.start_span(name, attributes)
+    try:
+        yield current
+    except BaseException as e:
+        trace.end_span(current, e)
+        raise
+    trace.end_span(current)
+
+def traced(f=None, *, name=None):
+    """Decorator recording each call as a span named after the function
+
+    Service methods report failures as {'success': False, 'error': ...}
+    instead of raising, so those results mark the span as failed too.
+    """
+    if f is None:
+        return lambda fn: traced(fn, name=name)
+    span_name = name or f.__qualname__
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        trace = current_trace()
+        if trace is None:
+            return f(*args, **kwargs)
+        current = trace.start_span(span_name)
+        try:
+            result = f(*args, **kwargs)
+        except BaseException as e:
+            trace.end_span(current, e)
+            raise
+        trace.end_span(current)
+        if isinstance(result, dict) and result.get('success') is False:
+            current.error = str(result.get('error'))
+        return result
+    return wrapper
+
+class TraceCommandListener(monitoring.CommandListener):
+    """pymongo command listener adding a span per MongoDB command"""
+
+    def started(self, event):
+        trace = current_trace()
+        if trace is not None:
+            collection = event.command.get(event.command_name)
+            trace.pending[event.request_id] = (event.command_name, collection if isinstance(collection, str) else None)
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, 'CommandFailed')
+
+    def _finish(self, event, error):
+        trace = current_trace()
+        if trace is None:
+            return
+        command_name, collection = trace.pending.pop(event.request_id, (event.command_name, None))
+        trace.add_span(f'mongo.{command_name}', event.duration_micros / 1_000_000,
+                       {'collection': collection}, error)
+
+def export_trace(trace):
+    """Write a finished trace to the trace log as one JSON line"""
+    if trace_logger.isEnabledFor(logging.INFO):
+        trace_logger.info(StructuredMessage('trace', 'Trace', trace.to_dict()))
+
+def init_app(app):
+    """Trace every request handled by the app
+
+    Incoming traceparent headers are continued, and every response carries
+    the request's traceparent. Traces are exported when the caller sampled
+    them, at TRACE_SAMPLE_RATE otherwise, and always for slow or failed
+    requests.
+    """
+    if not app.config.get('TRACING_ENABLED', True):
+        return
+
+    @app.before_request
+    def _start_trace():
+        incoming = parse_traceparent(request.headers.get('traceparent'))
+        if incoming is not None:
+            trace = Trace(*incoming)
+        else:
+            trace = Trace(sampled=random.random() < TRACE_SAMPLE_RATE)
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        trace.start_span(f'{request.method} {rule}', {'endpoint': request.endpoint})
+        g._trace = trace
+
+    @app.after_request
+    def _add_traceparent(response):
+        trace = g.get('_trace')
+        if trace is not None:
+            trace.root.attributes['status_code'] = response.status_code
+            response.headers['traceparent'] = trace.traceparent()
+        return response
+
+    @app.teardown_request
+    def _end_trace(error=None):
+        trace = g.pop('_trace', None)
+        if trace is None:
+            return
+        root = trace.root
+        trace.end_span(root, error)
+        failed = error is not None or root.attributes.get('status_code', 500) >= 500
+        if trace.sampled or failed or root.duration_ms >= TRACE_SLOW_MS:
+            export_trace(trace)
+
+# MongoDB commands become spans of the request that issued them
+trace_command_listener = TraceCommandListener()
+monitoring.register(trace_command_listener)
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from services.audit_store import AuditStore
+
+class TestAuditStore(unittest.TestCase):
+    """Test the hash-chained audit event store (no database required)"""
+
+    def setUp(self):
+        """Set up a store writing into a temporary directory"""
+        self.directory = tempfile.mkdtemp()
+        self.store = AuditStore(directory=self.directory, segment_max_bytes=4096)
+
+    def tearDown(self):
+        """Close the store and remove its files"""
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.jsonl'))
+
+    def test_records_are_chained(self):
+        """Test that each record carries the previous record's hash"""
+        first = self.store.record('audit', 'card_created', 'user-1', 'card', 'card-1')
+        second = self.store.record('security', 'login', 'user-1', success=False)
+
+        self.assertEqual(first['seq'], 1)
+        self.assertEqual(second['prev_hash'], first['hash'])
+        self.assertEqual(self.store.verify(), {'valid': True, 'records': 2, 'last_hash': second['hash']})
+
+    def test_tampering_is_detected(self):
+        """Test that editing a committed record breaks the chain"""
+        for position in range(5):
+            self.store.record('audit', 'card_blocked', f'user-{position}', 'card', f'card-{position}')
+        self.store.close()
+
+        path = os.path.join(self.directory, self._segments()[0])
+        with open(path) as segment_file:
+            lines = segment_file.readlines()
+        record = json.loads(lines[2])
+        record['user_id'] = 'someone-else'
+        lines[2] = json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n'
+        with open(path, 'w') as segment_file:
+            segment_file.writelines(lines)
+
+        result = AuditStore(directory=self.directory).verify()
+        self.assertFalse(result['valid'])
+        self.assertEqual(result['seq'], 3)
+
+    def test_segments_roll_and_reopen(self):
+        """Test that segments roll over and a reopened store continues the chain"""
+        for position in range(60):
+            self.store.record('audit', 'card_updated', f'user-{position % 3}', 'card', f'card-{position}')
+        self.store.close()
+        self.assertGreater(len(self._segments()), 1)
+
+        reopened = AuditStore(directory=self.directory, segment_max_bytes=4096)
+        record = reopened.record('audit', 'card_updated', 'user-0', 'card', 'card-60')
+        self.assertEqual(record['seq'], 61)
+        self.assertTrue(reopened.verify()['valid'])
+        reopened.close()
+
+    def test_partial_tail_is_truncated(self):
+        """Test that a half written record from a crash is dropped on reopen"""
+        self.store.record('audit', 'card_created', 'user-1', 'card', 'card-1')
+        self.store.close()
+        with open(os.path.join(self.directory, self._segments()[-1]), 'a') as segment_file:
+            segment_file.write('{"seq":2,"act')
+
+        reopened = AuditStore(directory=self.directory)
+        self.assertEqual(reopened.record('audit', 'card_created', 'user-1', 'card', 'card-2')['seq'], 2)
+        self.assertTrue(reopened.verify()['valid'])
+        reopened.close()
+
+    def test_range_and_user_queries(self):
+        """Test time range, per-user and per-action lookups across segments"""
+        for position in range(40):
+            self.store.record('audit', 'card_blocked' if position % 4 == 0 else 'card_updated',
+                              f'user-{position % 2}', 'card', f'card-{position}')
+        middle = time.time()
+        for position in range(40, 80):
+            self.store.record('audit', 'card_blocked', f'user-{position % 2}', 'card', f'card-{position}')
+
+        blocked = self.store.query(end=middle, user_id='user-0', action='card_blocked')
+        self.assertEqual([event['resource_id'] for event in blocked], [f'card-{n}' for n in range(0, 40, 4)])
+
+        later = self.store.query(start=middle, user_id='user-1')
+        self.assertEqual(len(later), 20)
+        self.assertEqual(self.store.query(user_id='nobody'), [])
+        self.assertEqual(len(self.store.query(limit=5)), 5)
+
+    def test_concurrent_appends_share_commits(self):
+        """Test that concurrent writers are grouped into fewer commits and keep the chain intact"""
+        def write(writer):
+            for position in range(25):
+                self.store.record('audit', 'transaction_created', f'user-{writer}', 'transaction', str(position))
+
+        threads = [threading.Thread(target=write, args=(writer,)) for writer in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = self.store.get_stats()
+        self.assertEqual(stats['records_committed'], 200)
+        self.assertLessEqual(stats['commits'], 200)
+        self.assertTrue(self.store.verify()['valid'])
+
+if __name__ == '__main__':
+    unittest.main()
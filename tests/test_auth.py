@@ -97,7 +97,19 @@ class TestAuthentication(unittest.TestCase):
         self.assertEqual(response.status_code, 401)
         data = json.loads(response.data)
         self.assertIn('error', data)
-    
+
+    def test_lockout_uses_stored_attempt_count(self):
+        """Test that failed logins recorded by other requests count towards the lockout"""
+        user = User.create_user(**self.test_user_data)
+        user.save()
+
+        # Another request already recorded four failures; this copy still sees none
+        User.objects(id=user.id).update_one(set__login_attempts=4)
+        user.increment_login_attempts()
+
+        self.assertEqual(user.login_attempts, 5)
+        self.assertTrue(User.objects.get(id=user.id).is_account_locked())
+
     def test_protected_endpoint(self):
         """Test accessing protected endpoint without token"""
         response = self.client.get('/api/users/me')
@@ -0,0 +1,107 @@
+import uuid
+import unittest
+import threading
+from app import create_app
+from models.user import User
+from models.card import Card
+
+class TestCardBalance(unittest.TestCase):
+    """Test atomic card balance updates"""
+
+    def setUp(self):
+        """Set up a test user with one card"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        unique_id = str(uuid.uuid4())[:8]
+        self.test_username = f'testuser_{unique_id}'
+        self.test_user = User.create_user(
+            username=self.test_username,
+            email=f'test_{unique_id}@example.com',
+            password='TestPassword123!',
+            first_name='Test',
+            last_name='User'
+        )
+        self.test_user.save()
+
+        self.card = Card.create_card(
+            user_id=self.test_user.id,
+            card_number='4111111111111111',
+            card_holder_name='Test User',
+            expiry_month=12,
+            expiry_year=2030,
+            cvv='123',
+            card_type='visa',
+            card_brand='Visa Classic',
+            card_name='Test Card',
+            credit_limit=2000
+        )
+        self.card.save()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        Card.objects(user_id=self.test_user.id).delete()
+        User.objects(username=self.test_username).delete()
+        self.app_context.pop()
+
+    def test_authorize_debit_recomputes_derived_fields(self):
+        """Test that a debit updates available credit and minimum payment on the server"""
+        document = Card.authorize_debit(self.card.id, 500)
+
+        self.assertEqual(document['outstanding_balance'], 500)
+        self.assertEqual(document['available_credit'], 1500)
+        self.assertEqual(document['minimum_payment'], 100.0)
+        self.assertIsNotNone(document['last_used'])
+
+    def test_authorize_debit_declines_over_limit(self):
+        """Test that a debit above the available credit is declined without a write"""
+        self.assertIsNone(Card.authorize_debit(self.card.id, 2500))
+        self.card.reload()
+        self.assertEqual(self.card.outstanding_balance, 0)
+
+    def test_authorize_debit_declines_blocked_card(self):
+        """Test that blocked cards cannot be debited"""
+        self.card.block_card()
+        self.assertIsNone(Card.authorize_debit(self.card.id, 100))
+
+    def test_credit_does_not_go_negative(self):
+        """Test that a credit larger than the balance stops at zero"""
+        Card.authorize_debit(self.card.id, 300)
+        document = Card.apply_balance_change(self.card.id, 500, 'credit')
+
+        self.assertEqual(document['outstanding_balance'], 0)
+        self.assertEqual(document['available_credit'], 2000)
+
+    def test_update_balance_refreshes_instance_without_rewrite(self):
+        """Test that update_balance leaves no balance fields for save() to overwrite"""
+        self.card.update_balance(400, 'debit')
+
+        self.assertEqual(self.card.available_credit, 1600)
+        self.assertNotIn('outstanding_balance', self.card._get_changed_fields())
+
+    def test_concurrent_debits_are_not_lost(self):
+        """Test many threads debiting one card; no update may be lost or overdraw it"""
+        threads_count, attempts, amount = 16, 25, 10
+        approved = []
+        approved_lock = threading.Lock()
+
+        def hammer():
+            for _ in range(attempts):
+                if Card.authorize_debit(self.card.id, amount) is not None:
+                    with approved_lock:
+                        approved.append(amount)
+
+        threads = [threading.Thread(target=hammer) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.card.reload()
+        self.assertEqual(len(approved), 200)  # 2000 limit / 10 per debit
+        self.assertEqual(self.card.outstanding_balance, sum(approved))
+        self.assertEqual(self.card.available_credit, 0)
+
+if __name__ == '__main__':
+    unittest.main()
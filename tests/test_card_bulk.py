@@ -0,0 +1,155 @@
+import uuid
+import unittest
+from app import create_app
+from models.user import User
+from models.card import Card
+from models.notification import Notification
+from models.migration_checkpoint import MigrationCheckpoint
+from services.card_bulk_service import CardBulkService
+
+# Distinct Luhn-valid numbers, since card numbers are unique per blind index
+CARD_NUMBERS = (
+    '4242424242424242', '4012888888881881', '4000056655665556', '4000000000000002',
+    '4000000000000010', '4000000000000028', '4000000000000036'
+)
+
+class TestCardBulkValidation(unittest.TestCase):
+    """Test bulk job validation (no database required)"""
+
+    def setUp(self):
+        self.service = CardBulkService()
+
+    def test_unknown_operation(self):
+        """Test that only supported operations are accepted"""
+        result = self.service.create_job('delete', card_ids=['507f1f77bcf86cd799439011'])
+        self.assertFalse(result['success'])
+
+    def test_requires_one_selection(self):
+        """Test that a job selects cards by ids or by filter, not both"""
+        self.assertFalse(self.service.create_job('block')['success'])
+        self.assertFalse(self.service.create_job(
+            'block', card_ids=['507f1f77bcf86cd799439011'], filters={'card_brand': 'Visa'}
+        )['success'])
+
+    def test_filter_fields_are_restricted(self):
+        """Test that filters only use allowed card fields"""
+        with self.assertRaises(ValueError):
+            CardBulkService._build_filter({'card_number': '4111111111111111'})
+        self.assertEqual(CardBulkService._build_filter({'card_brand': 'Visa'}), {'card_brand': 'Visa'})
+
+class TestCardBulkOperations(unittest.TestCase):
+    """Test bulk block and unblock jobs"""
+
+    def setUp(self):
+        """Set up a test user with several cards"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        unique_id = str(uuid.uuid4())[:8]
+        self.test_username = f'testuser_{unique_id}'
+        self.test_user = User.create_user(
+            username=self.test_username,
+            email=f'test_{unique_id}@example.com',
+            password='TestPassword123!',
+            first_name='Test',
+            last_name='User'
+        )
+        self.test_user.save()
+
+        self.cards = []
+        for position, card_number in enumerate(CARD_NUMBERS):
+            card = Card.create_card(
+                user_id=self.test_user.id,
+                card_number=card_number,
+                card_holder_name='Test User',
+                expiry_month=12,
+                expiry_year=2030,
+                cvv='123',
+                card_type='visa',
+                card_brand='Visa Classic',
+                card_name=f'Test Card {position}',
+                credit_limit=2000
+            )
+            card.save()
+            self.cards.append(card)
+        self.card_ids = [str(card.id) for card in self.cards]
+        self.service = CardBulkService(chunk_size=3)
+        self.job_ids = []
+
+    def tearDown(self):
+        """Clean up after tests"""
+        MigrationCheckpoint.objects(job_id__in=self.job_ids).delete()
+        Notification.objects(user_id=self.test_user.id).delete()
+        Card.objects(user_id=self.test_user.id).delete()
+        User.objects(username=self.test_username).delete()
+        self.app_context.pop()
+
+    def _create(self, operation, **kwargs):
+        result = self.service.create_job(operation, **kwargs)
+        self.assertTrue(result['success'])
+        self.job_ids.append(result['job']['job_id'])
+        return result['job']['job_id']
+
+    def test_block_by_ids_streams_progress(self):
+        """Test that a job blocks every card in chunks and notifies each owner once"""
+        job_id = self._create('block', card_ids=self.card_ids, reason='Merchant breach')
+        updates = list(self.service.run_job(job_id))
+
+        self.assertEqual(len(updates), 4)  # 3 chunks and the final summary
+        self.assertEqual(updates[-1]['status'], 'completed')
+        self.assertEqual(updates[-1]['processed'], 7)
+        self.assertEqual(Card.objects(user_id=self.test_user.id, is_blocked=True).count(), 7)
+        self.assertEqual(Notification.objects(user_id=self.test_user.id, title='Card Blocked').count(), 7)
+
+    def test_unblock_by_filter(self):
+        """Test that filters select cards and only cards needing the change are touched"""
+        Card.objects(id__in=self.card_ids[:2]).update(set__is_blocked=True, set__is_active=False)
+        job_id = self._create('unblock', filters={'user_id': str(self.test_user.id)})
+        updates = list(self.service.run_job(job_id))
+
+        self.assertEqual(updates[-1]['processed'], 2)
+        self.assertEqual(Card.objects(user_id=self.test_user.id, is_blocked=True).count(), 0)
+
+    def test_filter_is_not_overridden_by_guard(self):
+        """Test that an expire job filtering on inactive cards leaves active cards alone"""
+        job_id = self._create('expire', filters={'user_id': str(self.test_user.id), 'is_active': False})
+        updates = list(self.service.run_job(job_id))
+
+        self.assertEqual(updates[-1]['status'], 'completed')
+        self.assertEqual(updates[-1]['processed'], 0)
+        self.assertEqual(Card.objects(user_id=self.test_user.id, is_active=True).count(), 7)
+
+    def test_resume_finishes_pending_chunk_without_duplicates(self):
+        """Test that a job stopped mid-chunk resumes without notifying twice"""
+        job_id = self._create('block', card_ids=self.card_ids)
+        for update in self.service.run_job(job_id, max_documents=3):
+            pass
+
+        # Simulate a crash after the next chunk's cards were changed and one owner notified
+        checkpoint = MigrationCheckpoint.objects.get(job_id=job_id)
+        pending = [card.id for card in self.cards[3:6]]
+        checkpoint.details['pending_ids'] = pending
+        checkpoint.last_id = pending[-1]
+        checkpoint.save()
+        Card.objects(id__in=pending).update(set__is_blocked=True, set__is_active=False)
+        Notification.create_notification(
+            user_id=self.test_user.id, title='Card Blocked', message='Blocked', notification_type='card',
+            related_entity_type='card', related_entity_id=str(pending[0]), tags=[f'bulk:{job_id}']
+        ).save()
+
+        updates = list(self.service.run_job(job_id))
+        self.assertEqual(updates[-1]['status'], 'completed')
+        self.assertEqual(Card.objects(user_id=self.test_user.id, is_blocked=True).count(), 7)
+        self.assertEqual(Notification.objects(user_id=self.test_user.id, title='Card Blocked').count(), 7)
+
+    def test_bulk_block_and_single_block(self):
+        """Test that a bulk job and per-card blocking can be mixed"""
+        job_id = self._create('block', card_ids=self.card_ids[:4])
+        list(CardBulkService().run_job(job_id))
+        for card in self.cards[4:]:
+            card.block_card()
+        self.assertEqual(Card.objects(user_id=self.test_user.id, is_blocked=True).count(), 7)
+
+if __name__ == '__main__':
+    unittest.main()
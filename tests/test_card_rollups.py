@@ -0,0 +1,135 @@
+import time
+import uuid
+import unittest
+from datetime import datetime
+from app import create_app
+from models.user import User
+from models.card import Card
+from models.transaction import Transaction
+from models.card_daily_rollup import CardDailyRollup
+from services.card_service import CardService
+from services.card_migration_service import CardMigrationService
+
+class TestRollupKeys(unittest.TestCase):
+    """Test rollup bucketing (no database required)"""
+
+    def test_day_of(self):
+        """Test that timestamps are bucketed by UTC day"""
+        self.assertEqual(CardDailyRollup.day_of(datetime(2026, 3, 14, 23, 59)), datetime(2026, 3, 14))
+
+    def test_category_key(self):
+        """Test that categories become valid field names"""
+        self.assertEqual(CardDailyRollup.category_key('food.delivery'), 'food_delivery')
+        self.assertEqual(CardDailyRollup.category_key('$shopping'), 'shopping')
+        self.assertEqual(CardDailyRollup.category_key(None), 'uncategorized')
+
+class TestCardRollups(unittest.TestCase):
+    """Test incrementally maintained card analytics"""
+
+    def setUp(self):
+        """Set up a test user with one card"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        unique_id = str(uuid.uuid4())[:8]
+        self.test_username = f'testuser_{unique_id}'
+        self.test_user = User.create_user(
+            username=self.test_username,
+            email=f'test_{unique_id}@example.com',
+            password='TestPassword123!',
+            first_name='Test',
+            last_name='User'
+        )
+        self.test_user.save()
+
+        self.card = Card.create_card(
+            user_id=self.test_user.id,
+            card_number='4111111111111111',
+            card_holder_name='Test User',
+            expiry_month=12,
+            expiry_year=2030,
+            cvv='123',
+            card_type='visa',
+            card_brand='Visa Classic',
+            card_name='Test Card',
+            credit_limit=100000
+        )
+        self.card.save()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        CardDailyRollup.objects(card_id=self.card.id).delete()
+        Transaction.objects(card_id=self.card.id).delete()
+        Card.objects(user_id=self.test_user.id).delete()
+        User.objects(username=self.test_username).delete()
+        self.app_context.pop()
+
+    def _transaction(self, amount, category='shopping'):
+        transaction = Transaction.create_transaction(
+            user_id=self.test_user.id,
+            card_id=self.card.id,
+            transaction_id=f"TXN_{uuid.uuid4().hex[:12].upper()}",
+            merchant_name='Test Store',
+            merchant_category=category,
+            amount=amount
+        )
+        transaction.save()
+        return transaction
+
+    def test_completion_and_refund_update_rollup(self):
+        """Test that completed transactions are added and refunds taken back out"""
+        first = self._transaction(100)
+        first.process_transaction()
+        self._transaction(50, 'food').process_transaction()
+        self._transaction(999)  # pending transactions don't count
+
+        analytics = CardService.get_card_analytics(self.card.id)['analytics']
+        self.assertEqual(analytics['transaction_count'], 2)
+        self.assertEqual(analytics['total_spent'], 150)
+        self.assertEqual(analytics['category_breakdown']['food'], {'count': 1, 'amount': 50})
+
+        first.refund_transaction()
+        analytics = CardService.get_card_analytics(self.card.id)['analytics']
+        self.assertEqual(analytics['transaction_count'], 1)
+        self.assertNotIn('shopping', analytics['category_breakdown'])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test that the rebuild job reproduces the maintained rollups"""
+        for amount in (10, 20, 30):
+            self._transaction(amount).process_transaction()
+        before = CardService.get_card_analytics(self.card.id)['analytics']
+
+        CardDailyRollup.objects(card_id=self.card.id).delete()
+        result = CardMigrationService().rebuild_card_rollups(job_id=f'test_rollups_{uuid.uuid4().hex[:8]}')
+        self.assertTrue(result['success'])
+        self.assertEqual(CardService.get_card_analytics(self.card.id)['analytics'], before)
+
+    def test_rebuild_over_existing_rollups(self):
+        """Test that a rebuild overwrites existing rollups and drops days without transactions"""
+        for amount in (10, 20):
+            self._transaction(amount).process_transaction()
+        before = CardService.get_card_analytics(self.card.id)['analytics']
+        CardDailyRollup.record(self.card.id, self.test_user.id, datetime(2020, 1, 1), 'travel', 99)
+
+        result = CardMigrationService().rebuild_card_rollups(job_id=f'test_rollups_{uuid.uuid4().hex[:8]}')
+        self.assertTrue(result['success'])
+        self.assertEqual(CardDailyRollup.objects(card_id=self.card.id).count(), 1)
+        self.assertEqual(CardService.get_card_analytics(self.card.id)['analytics'], before)
+
+    def test_analytics_benchmark(self):
+        """Benchmark analytics reads over a window of rollups"""
+        for position in range(50):
+            self._transaction(10 + position, f'category-{position % 5}').process_transaction()
+
+        calls = 20
+        start_time = time.perf_counter()
+        for _ in range(calls):
+            analytics = CardService.get_card_analytics(self.card.id)['analytics']
+        elapsed = time.perf_counter() - start_time
+
+        print(f"\nCard analytics: {elapsed * 1_000_000 / calls:.2f} us/call")
+        self.assertEqual(analytics['transaction_count'], 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
 import unittest
 import json
 import uuid
+from bson import ObjectId
 from app import create_app
 from models.user import User
 from models.card import Card
 from services.auth import generate_token
+from services.card_migration_service import CardMigrationService
 
 class TestCards(unittest.TestCase):
     """Test credit card functionality"""
@@ -319,5 +321,37 @@ class TestCards(unittest.TestCase):
         # Clean up
         other_user.delete()
 
+    def _create_card(self):
+        card = Card.create_card(user_id=self.test_user.id, **self.test_card_data)
+        card.save()
+        return card
+    
+    def test_card_summary(self):
+        """Test that the lightweight view carries balance and status only"""
+        card = self._create_card()
+        summary = Card.get_summary(id=card.id, user_id=self.test_user.id)
+        
+        self.assertEqual(summary.credit_limit, 10000)
+        self.assertTrue(summary.is_usable())
+        self.assertFalse(hasattr(summary, 'card_number'))
+        self.assertNotIn('cvv', summary.to_dict())
+        
+        with self.assertRaises(Card.DoesNotExist):
+            Card.get_summary(id=card.id, user_id=ObjectId())
+    
+    def test_drop_reference_arrays(self):
+        """Test that the migration removes legacy reference arrays from cards"""
+        card = self._create_card()
+        Card._get_collection().update_one({'_id': card.id}, {'$set': {'transactions': [], 'emis': []}})
+        
+        # Cards with the legacy arrays still load
+        self.assertEqual(Card.objects.get(id=card.id).card_name, 'Test Card')
+        
+        result = CardMigrationService().drop_reference_arrays(job_id=f'test_drop_arrays_{uuid.uuid4().hex[:8]}')
+        self.assertTrue(result['success'])
+        document = Card._get_collection().find_one({'_id': card.id})
+        self.assertNotIn('transactions', document)
+        self.assertNotIn('emis', document)
+
 if __name__ == '__main__':
     unittest.main()
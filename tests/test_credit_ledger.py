@@ -0,0 +1,198 @@
+import time
+import uuid
+import unittest
+import threading
+from unittest import mock
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app import create_app
+from models.user import User
+from models.card import Card
+from models.credit_ledger import CreditLedger
+from services.credit_ledger import CreditLedgerService, LedgerEntry
+
+class TestLedgerEntry(unittest.TestCase):
+    """Test cached ledger entries (no database required)"""
+
+    def _document(self, **kwargs):
+        document = {
+            'card_id': ObjectId(),
+            'user_id': ObjectId(),
+            'credit_limit': 1000.0,
+            'outstanding_balance': 200.0,
+            'held_amount': 150.0,
+            'holds': {}
+        }
+        document.update(kwargs)
+        return document
+
+    def test_available_credit_excludes_holds(self):
+        """Test that held amounts reduce available credit"""
+        self.assertEqual(LedgerEntry(self._document()).available, 650.0)
+
+    def test_expired_holds(self):
+        """Test that only lapsed holds are reported as expired"""
+        now = datetime.utcnow()
+        entry = LedgerEntry(self._document(holds={
+            'old': {'amount': 100.0, 'expires_at': now - timedelta(seconds=1)},
+            'new': {'amount': 50.0, 'expires_at': now + timedelta(minutes=5)}
+        }))
+        self.assertEqual(entry.expired_holds(now), {'old': 100.0})
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used entries are evicted"""
+        service = CreditLedgerService(cache_size=2)
+        documents = [self._document() for _ in range(3)]
+        for document in documents:
+            service._cache(document)
+
+        self.assertIsNone(service._cached(str(documents[0]['card_id'])))
+        self.assertIsNotNone(service._cached(str(documents[2]['card_id'])))
+        self.assertEqual(service.get_stats()['cached_cards'], 2)
+
+    def test_stale_entries_are_reread(self):
+        """Test that entries older than the cache TTL are not served"""
+        service = CreditLedgerService(cache_ttl=0)
+        document = self._document()
+        service._cache(document)
+        self.assertIsNone(service._cached(str(document['card_id'])))
+
+class TestCreditLedger(unittest.TestCase):
+    """Test authorization holds on the credit ledger"""
+
+    def setUp(self):
+        """Set up a test user with one card"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        unique_id = str(uuid.uuid4())[:8]
+        self.test_username = f'testuser_{unique_id}'
+        self.test_user = User.create_user(
+            username=self.test_username,
+            email=f'test_{unique_id}@example.com',
+            password='TestPassword123!',
+            first_name='Test',
+            last_name='User'
+        )
+        self.test_user.save()
+
+        self.card = Card.create_card(
+            user_id=self.test_user.id,
+            card_number='4111111111111111',
+            card_holder_name='Test User',
+            expiry_month=12,
+            expiry_year=2030,
+            cvv='123',
+            card_type='visa',
+            card_brand='Visa Classic',
+            card_name='Test Card',
+            credit_limit=2000
+        )
+        self.card.save()
+        self.ledger = CreditLedgerService()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        CreditLedger.objects(card_id=self.card.id).delete()
+        Card.objects(user_id=self.test_user.id).delete()
+        User.objects(username=self.test_username).delete()
+        self.app_context.pop()
+
+    def test_hold_reserves_credit_until_captured(self):
+        """Test that a hold reduces available credit and capture debits the card"""
+        hold = self.ledger.authorize(self.card.id, 500)
+        self.assertTrue(hold['success'])
+        self.assertEqual(hold['available_credit'], 1500)
+
+        self.card.reload()
+        self.assertEqual(self.card.outstanding_balance, 0)
+
+        self.assertTrue(self.ledger.capture(self.card.id, hold['hold_id'])['success'])
+        self.card.reload()
+        self.assertEqual(self.card.outstanding_balance, 500)
+        self.assertEqual(self.card.available_credit, 1500)
+
+    def test_release_returns_credit(self):
+        """Test that releasing a hold frees its credit without debiting the card"""
+        hold = self.ledger.authorize(self.card.id, 1500)
+        self.assertFalse(self.ledger.authorize(self.card.id, 600)['success'])
+
+        self.assertTrue(self.ledger.release(self.card.id, hold['hold_id'])['success'])
+        self.assertTrue(self.ledger.check(self.card.id, 2000))
+        self.assertFalse(self.ledger.capture(self.card.id, hold['hold_id'])['success'])
+
+    def test_capture_fails_when_card_is_gone(self):
+        """Test that capture reports failure and leaves the ledger undebited if the card can't be debited"""
+        hold = self.ledger.authorize(self.card.id, 500)
+        Card.objects(id=self.card.id).delete()
+
+        result = self.ledger.capture(self.card.id, hold['hold_id'])
+        self.assertFalse(result['success'])
+        self.assertEqual(CreditLedger.objects.get(card_id=self.card.id).outstanding_balance, 0)
+
+    def test_declines_other_users_and_blocked_cards(self):
+        """Test ownership and card status checks"""
+        self.assertEqual(self.ledger.authorize(self.card.id, 100, user_id=ObjectId())['error'], 'Card not found')
+
+        self.card.block_card()
+        self.assertEqual(self.ledger.authorize(self.card.id, 100)['error'], 'Card is not active or is blocked')
+
+    def test_decline_rereads_stale_entry(self):
+        """Test that a decline is never based on a cached entry another worker has since changed"""
+        other_worker = CreditLedgerService()
+        hold = self.ledger.authorize(self.card.id, 1500)
+        self.assertFalse(self.ledger.authorize(self.card.id, 600)['success'])
+
+        self.assertTrue(other_worker.release(self.card.id, hold['hold_id'])['success'])
+        self.assertTrue(self.ledger.authorize(self.card.id, 600)['success'])
+
+    def test_expired_holds_are_dropped(self):
+        """Test that a lapsed hold no longer reserves credit"""
+        self.ledger.authorize(self.card.id, 2000, ttl=0)
+        self.assertTrue(self.ledger.authorize(self.card.id, 2000)['success'])
+
+    def test_reconcile_follows_card_balance(self):
+        """Test that reconciliation realigns the ledger with the card"""
+        self.ledger.authorize(self.card.id, 100)
+        Card.apply_balance_change(self.card.id, 700, 'debit')
+
+        stats = self.ledger.reconcile(grace=0)
+        self.assertGreaterEqual(stats['corrected'], 1)
+        self.assertEqual(self.ledger.entry(self.card.id).available, 1200)  # 2000 - 700 - 100 held
+
+    def test_checks_are_answered_from_memory(self):
+        """Test that credit checks on a cached ledger do not touch the database"""
+        self.ledger.entry(self.card.id)
+        with mock.patch.object(self.ledger, '_collection') as collection:
+            for _ in range(1000):
+                self.assertTrue(self.ledger.check(self.card.id, 10))
+            self.assertFalse(self.ledger.check(self.card.id, 5000))
+        collection.assert_not_called()
+
+    def test_concurrent_holds_never_exceed_limit(self):
+        """Test concurrent holds and captures; the limit is never exceeded"""
+        threads_count, attempts, amount = 16, 25, 10
+        approved = []
+        approved_lock = threading.Lock()
+
+        def hammer():
+            for _ in range(attempts):
+                hold = self.ledger.authorize(self.card.id, amount)
+                if hold['success']:
+                    self.ledger.capture(self.card.id, hold['hold_id'])
+                    with approved_lock:
+                        approved.append(amount)
+
+        threads = [threading.Thread(target=hammer) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.card.reload()
+        self.assertEqual(len(approved), 200)  # 2000 limit / 10 per debit
+        self.assertEqual(self.card.outstanding_balance, sum(approved))
+
+if __name__ == '__main__':
+    unittest.main()
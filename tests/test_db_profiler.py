@@ -0,0 +1,75 @@
+import unittest
+from types import SimpleNamespace
+from bson import ObjectId
+from flask import Flask, jsonify
+from services import db_profiler
+from services.db_profiler import CommandProfiler, query_shape
+import models.card  # noqa: F401  (registers the cards collection indexes)
+
+class TestDBProfiler(unittest.TestCase):
+    """Test the MongoDB command profiler with synthetic command events (no database required)"""
+
+    def setUp(self):
+        """Set up a profiler and an app whose views replay command events"""
+        self.profiler = CommandProfiler(measure_bytes=True)
+        self.app = Flask(__name__)
+        self.app.config['DB_PROFILER_HEADER'] = True
+        db_profiler.init_app(self.app, self.profiler)
+        self.request_id = 0
+
+        @self.app.route('/cards')
+        def list_cards():
+            user_id = ObjectId()
+            self._run('find', 'cards', {'find': 'cards', 'filter': {'user_id': user_id}}, 3)
+            for _ in range(6):
+                self._run('find', 'users', {'find': 'users', 'filter': {'_id': ObjectId()}, 'limit': 1}, 1)
+            self._run('find', 'cards', {'find': 'cards', 'filter': {'expiry_year': 2030}}, 0)
+            return jsonify(self.profiler.current().to_dict()), 200
+
+        self.client = self.app.test_client()
+
+    def _run(self, command_name, collection, command, documents, duration_micros=1500):
+        """Publish a started/succeeded event pair like pymongo does"""
+        self.request_id += 1
+        self.profiler.started(SimpleNamespace(
+            command_name=command_name, command=command, database_name='ccms_db', request_id=self.request_id
+        ))
+        self.profiler.succeeded(SimpleNamespace(
+            command_name=command_name, database_name='ccms_db', request_id=self.request_id,
+            duration_micros=duration_micros,
+            reply={'cursor': {'firstBatch': [{'_id': ObjectId()} for _ in range(documents)], 'id': 0}, 'ok': 1.0}
+        ))
+
+    def test_query_shape_ignores_values(self):
+        """Test that filters differing only in values share a shape"""
+        self.assertEqual(query_shape({'_id': ObjectId()}), query_shape({'_id': ObjectId()}))
+        self.assertNotEqual(query_shape({'_id': 1}), query_shape({'user_id': 1}))
+
+    def test_request_profile(self):
+        """Test per-request totals, N+1 and collection scan detection"""
+        response = self.client.get('/cards')
+        profile = response.get_json()
+
+        self.assertEqual(profile['endpoint'], '/cards')
+        self.assertEqual(profile['commands'], 8)
+        self.assertEqual(profile['documents_returned'], 9)
+        self.assertAlmostEqual(profile['db_time_ms'], 12.0)
+        self.assertGreater(profile['reply_bytes'], 0)
+        self.assertEqual(profile['breakdown']['users.find']['count'], 6)
+        self.assertEqual(profile['n_plus_one'], [{'command': 'find', 'collection': 'users', 'count': 6}])
+        self.assertEqual(profile['collection_scans'], ['cards'])
+
+    def test_debug_header(self):
+        """Test that the breakdown is exposed in the X-DB-Profile header"""
+        header = self.client.get('/cards').headers['X-DB-Profile']
+
+        self.assertTrue(header.startswith('total=12.00ms;commands=8;'))
+        self.assertIn('users.find=9.00ms/6', header)
+
+    def test_commands_outside_requests_are_ignored(self):
+        """Test that background commands are not attributed to any request"""
+        self._run('find', 'cards', {'find': 'cards', 'filter': {}}, 1)
+        self.assertIsNone(self.profiler.current())
+
+if __name__ == '__main__':
+    unittest.main()
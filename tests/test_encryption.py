@@ -0,0 +1,263 @@
+import unittest
+import base64
+import threading
+from unittest import mock
+from services.encryption import EncryptionService, DEFAULT_SALT
+
+class TestEncryption(unittest.TestCase):
+    """Test encryption service key handling (no database required)"""
+
+    def setUp(self):
+        """Set up a fresh encryption service"""
+        self.service = EncryptionService()
+
+    def test_fernet_key_is_cached_per_salt(self):
+        """Test that PBKDF2 derivation runs once per salt"""
+        first = self.service._get_fernet_key()
+        second = self.service._get_fernet_key()
+        other = self.service._get_fernet_key(b'other_salt')
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_key_cache_is_thread_safe(self):
+        """Test that concurrent callers share one derived key"""
+        results = []
+
+        def worker():
+            results.append(self.service._get_fernet_key(b'threaded_salt'))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_decryptor_built_during_ring_change_is_not_cached(self):
+        """Test that a decryptor built from a ring changed meanwhile is not cached"""
+        get_fernet_key = self.service._get_fernet_key
+
+        def add_key_midway(salt=None, version=None):
+            if 2 not in self.service._key_ring:
+                self.service.add_key(2, 'a-second-master-key')
+            return get_fernet_key(salt, version)
+
+        with mock.patch.object(self.service, '_get_fernet_key', side_effect=add_key_midway):
+            self.service._get_decryptor()
+        self.assertNotIn(DEFAULT_SALT, self.service._decryptor_cache)
+        self.assertEqual(len(self.service._get_decryptor()._fernets), 2)
+
+    def test_invalidate_key_cache(self):
+        """Test explicit invalidation of cached key material"""
+        first = self.service._get_fernet_key()
+        self.service.invalidate_key_cache()
+        second = self.service._get_fernet_key()
+
+        self.assertIsNot(first, second)
+        # Same master key and salt, so old ciphertexts still decrypt
+        encrypted = first.encrypt(b'4111111111111111')
+        self.assertEqual(second.decrypt(encrypted), b'4111111111111111')
+
+    def test_rotate_master_key(self):
+        """Test that rotate() activates a new key version and keeps the old one for decryption"""
+        encrypted = self.service.encrypt_cvv('123')
+        old_version = self.service.active_key_version
+        new_version = self.service.rotate('a-completely-different-master-key')
+
+        self.assertEqual(new_version, old_version + 1)
+        self.assertEqual(self.service.active_key_version, new_version)
+        self.assertEqual(self.service.decrypt_cvv(encrypted), '123')
+
+        encrypted = self.service.encrypt_cvv('456')
+        self.assertEqual(self.service.decrypt_cvv(encrypted), '456')
+
+    def test_retired_key_no_longer_decrypts(self):
+        """Test that retiring a key version removes it from the ring"""
+        encrypted = self.service.encrypt_cvv('123')
+        old_version = self.service.active_key_version
+        self.service.rotate('a-completely-different-master-key')
+        self.service.retire_key(old_version)
+
+        self.assertNotIn(old_version, self.service.key_versions)
+        with self.assertRaises(ValueError):
+            self.service.decrypt_cvv(encrypted)
+
+    def test_cannot_retire_active_key(self):
+        """Test that the active key version cannot be retired"""
+        with self.assertRaises(ValueError):
+            self.service.retire_key(self.service.active_key_version)
+
+    def test_reencrypt_moves_ciphertext_to_active_key(self):
+        """Test that reencrypt() produces ciphertext readable with only the new key"""
+        encrypted = self.service.encrypt_card_number('4111111111111111')
+        old_version = self.service.active_key_version
+        self.service.rotate('a-completely-different-master-key')
+
+        reencrypted = self.service.reencrypt(encrypted)
+        self.service.retire_key(old_version)
+
+        self.assertEqual(self.service.decrypt_card_number(reencrypted), '4111111111111111')
+        with self.assertRaises(ValueError):
+            self.service.decrypt_card_number(encrypted)
+
+    def test_rotate_rejects_empty_key(self):
+        """Test that rotate() refuses an empty master key"""
+        with self.assertRaises(ValueError):
+            self.service.rotate('')
+
+    def test_blind_index_is_deterministic(self):
+        """Test that the blind index matches for equal card numbers only"""
+        index = self.service.compute_blind_index('4111111111111111')
+
+        self.assertEqual(index, self.service.compute_blind_index('4111-1111-1111-1111'))
+        self.assertNotEqual(index, self.service.compute_blind_index('5555555555554444'))
+        self.assertEqual(len(index), 64)
+
+    def test_blind_index_survives_key_rotation(self):
+        """Test that rotating the master key does not change the blind index"""
+        index = self.service.compute_blind_index('4111111111111111')
+        self.service.rotate('a-completely-different-master-key')
+
+        self.assertEqual(index, self.service.compute_blind_index('4111111111111111'))
+
+    def test_blind_index_is_pinned_across_processes(self):
+        """Test that a service started after a rotation derives the same blind index"""
+        with mock.patch.dict('os.environ', {'ENCRYPTION_MASTER_KEY': 'first-key', 'ENCRYPTION_KEY_VERSION': '1',
+                                            'ENCRYPTION_RETIRED_KEYS': '', 'BLIND_INDEX_KEY': ''}):
+            index = EncryptionService().compute_blind_index('4111111111111111')
+        with mock.patch.dict('os.environ', {'ENCRYPTION_MASTER_KEY': 'second-key', 'ENCRYPTION_KEY_VERSION': '2',
+                                            'ENCRYPTION_RETIRED_KEYS': '1:first-key', 'BLIND_INDEX_KEY': ''}):
+            self.assertEqual(EncryptionService().compute_blind_index('4111111111111111'), index)
+
+    def test_blind_index_requires_its_key_version(self):
+        """Test that a missing pinned key version fails instead of silently changing the index"""
+        with mock.patch.dict('os.environ', {'ENCRYPTION_MASTER_KEY': 'second-key', 'ENCRYPTION_KEY_VERSION': '2',
+                                            'ENCRYPTION_RETIRED_KEYS': '', 'BLIND_INDEX_KEY': ''}):
+            service = EncryptionService()
+        with self.assertRaises(ValueError):
+            service.compute_blind_index('4111111111111111')
+
+    def test_ciphertext_uses_compact_v2_format(self):
+        """Test that new ciphertexts carry the v2 prefix and no extra base64 layer"""
+        encrypted = self.service.encrypt_card_number('4111111111111111')
+
+        self.assertTrue(encrypted.startswith('v2:'))
+        self.assertFalse(self.service.is_legacy_ciphertext(encrypted))
+        self.assertEqual(self.service.decrypt_card_number(encrypted), '4111111111111111')
+
+    def test_legacy_ciphertext_still_decrypts(self):
+        """Test that double base64 v1 ciphertexts decrypt and upgrade without re-encryption"""
+        token = self.service._get_fernet_key().encrypt(b'123')
+        legacy = base64.urlsafe_b64encode(token).decode()
+
+        self.assertTrue(self.service.is_legacy_ciphertext(legacy))
+        self.assertEqual(self.service.decrypt_cvv(legacy), '123')
+
+        upgraded = self.service.upgrade_ciphertext(legacy)
+        self.assertEqual(upgraded, 'v2:' + token.decode())
+        self.assertEqual(self.service.decrypt_cvv(upgraded), '123')
+        self.assertLess(len(upgraded), len(legacy))
+        self.assertEqual(self.service.upgrade_ciphertext(upgraded), upgraded)
+
+    def test_aes_gcm_round_trip(self):
+        """Test the AES-GCM backend with the document id as associated data"""
+        self.service.use_cipher('aes-gcm')
+        document_id = '64b7f0c2a1b2c3d4e5f60718'
+
+        encrypted = self.service.encrypt_card_number('4111111111111111', associated_data=document_id)
+        self.assertTrue(encrypted.startswith(f'g1:{self.service.active_key_version}:'))
+        self.assertEqual(self.service.decrypt_card_number(encrypted, associated_data=document_id), '4111111111111111')
+
+    def test_aes_gcm_rejects_wrong_document(self):
+        """Test that a GCM ciphertext cannot be replayed onto another document"""
+        self.service.use_cipher('aes-gcm')
+        encrypted = self.service.encrypt_cvv('123', associated_data='document-a')
+
+        with self.assertRaises(ValueError):
+            self.service.decrypt_cvv(encrypted, associated_data='document-b')
+
+    def test_aes_gcm_uses_per_field_keys(self):
+        """Test that each field kind is encrypted under its own data key"""
+        self.service.use_cipher('aes-gcm')
+        encrypted = self.service.encrypt_cvv('123')
+
+        self.assertIsNot(self.service._get_data_key('cvv'), self.service._get_data_key('pin'))
+        with self.assertRaises(ValueError):
+            self.service.decrypt_pin(encrypted)
+
+    def test_aes_gcm_survives_key_rotation(self):
+        """Test that GCM ciphertexts record their key version"""
+        self.service.use_cipher('aes-gcm')
+        encrypted = self.service.encrypt_pin('1234')
+        self.service.rotate('a-completely-different-master-key')
+
+        self.assertEqual(self.service.decrypt_pin(encrypted), '1234')
+
+    def test_reencrypt_fernet_to_aes_gcm(self):
+        """Test migrating a Fernet ciphertext to AES-GCM bound to a document"""
+        encrypted = self.service.encrypt_cvv('123')
+        self.service.use_cipher('aes-gcm')
+
+        reencrypted = self.service.reencrypt(encrypted, field='cvv', associated_data='document-a')
+        self.assertTrue(reencrypted.startswith('g1:'))
+        self.assertEqual(self.service.decrypt_cvv(reencrypted, associated_data='document-a'), '123')
+
+    def test_unknown_cipher_rejected(self):
+        """Test that selecting an unknown cipher backend fails"""
+        with self.assertRaises(ValueError):
+            self.service.use_cipher('rot13')
+
+    def test_encrypt_many_round_trip(self):
+        """Test batch encryption matches the single-value format"""
+        card_numbers = [f'4111111111{i:06d}' for i in range(1, 1201)]
+        encrypted = list(self.service.encrypt_many(card_numbers, field='card_number', chunk_size=100))
+
+        self.assertEqual(len(encrypted), len(card_numbers))
+        self.assertEqual(self.service.decrypt_card_number(encrypted[0]), card_numbers[0].rstrip('0'))
+
+        decrypted = list(self.service.decrypt_many(encrypted, field='card_number', chunk_size=100))
+        self.assertEqual(decrypted, [number.rstrip('0') for number in card_numbers])
+
+    def test_decrypt_many_is_streamed(self):
+        """Test that batch results are yielded lazily from a generator"""
+        cvvs = (str(100 + i) for i in range(50))
+        results = self.service.decrypt_many(self.service.encrypt_many(cvvs, field='cvv'), field='cvv')
+
+        self.assertEqual(next(results), '100')
+        self.assertEqual(len(list(results)), 49)
+
+    def test_encrypt_many_invalid_field(self):
+        """Test that unknown batch fields are rejected"""
+        with self.assertRaises(ValueError):
+            self.service.encrypt_many(['123'], field='unknown')
+
+    def test_decrypt_many_invalid_token(self):
+        """Test that a bad ciphertext in a batch raises ValueError"""
+        with self.assertRaises(ValueError):
+            list(self.service.decrypt_many(['not-a-token'], field='pin'))
+
+    def test_encrypt_decrypt_reuse_cached_key(self):
+        """Test that repeated encrypt/decrypt calls do not derive the key again"""
+        self.service._get_decryptor()  # Warm the cache
+        with mock.patch.object(self.service, '_derive_key', wraps=self.service._derive_key) as derive_key:
+            for _ in range(20):
+                encrypted = self.service.encrypt_card_number('4111111111111111')
+                self.assertEqual(self.service.decrypt_card_number(encrypted), '4111111111111111')
+        self.assertEqual(derive_key.call_count, 0)
+
+    def test_aes_gcm_ciphertext_is_shorter(self):
+        """Test that AES-GCM stores card numbers more compactly than Fernet"""
+        lengths = {}
+        for cipher in ('fernet', 'aes-gcm'):
+            self.service.use_cipher(cipher)
+            encrypted = self.service.encrypt_card_number('4111111111111111', associated_data='document-a')
+            self.assertEqual(self.service.decrypt_card_number(encrypted, associated_data='document-a'),
+                             '4111111111111111')
+            lengths[cipher] = len(encrypted)
+        self.assertLess(lengths['aes-gcm'], lengths['fernet'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+import os
+import glob
+import gzip
+import json
+import time
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask, jsonify
+from services.metrics import RequestMetrics
+from services.logging_service import (
+    LoggingService, StructuredMessage, RotatingBufferedFileHandler, LogArchiver, ConsoleFilter,
+    RequestLogSampler, logging_service, init_app as init_request_logging
+)
+
+class TestLoggingService(unittest.TestCase):
+    """Test the queue-backed logging pipeline (no database required)"""
+
+    def setUp(self):
+        """Route logging to a service writing into a temporary directory"""
+        self.log_dir = tempfile.mkdtemp()
+        logging.getLogger().removeHandler(logging_service.queue_handler)
+        self.service = LoggingService(log_dir=self.log_dir)
+
+    def tearDown(self):
+        """Shut down the test service and restore the global one"""
+        self.service.shutdown()
+        logging.getLogger().addHandler(logging_service.queue_handler)
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def _read(self, filename):
+        with open(os.path.join(self.log_dir, filename)) as log_file:
+            return log_file.read()
+
+    def test_records_are_routed_to_category_files(self):
+        """Test that category records reach their own file and the application log"""
+        self.service.log_performance('card_lookup', 12.5)
+        self.service.log_audit('card_created', 'user-1', 'card', 'card-1')
+        self.service.flush()
+
+        self.assertIn('card_lookup', self._read('performance.log'))
+        self.assertIn('card_created', self._read('audit.log'))
+        self.assertNotIn('card_lookup', self._read('audit.log'))
+        self.assertIn('card_lookup', self._read('application.log'))
+
+    def test_traces_only_go_to_their_own_file(self):
+        """Test that exclusive categories skip the application log"""
+        logging.getLogger('traces').info(StructuredMessage('trace', 'Trace', {'trace_id': 'abc123'}))
+        self.service.flush()
+
+        self.assertIn('abc123', self._read('traces.log'))
+        self.assertNotIn('abc123', self._read('application.log'))
+
+    def test_shutdown_flushes_pending_records(self):
+        """Test that records queued before shutdown are written"""
+        for i in range(500):
+            self.service.log_performance('bulk', i)
+        self.service.shutdown()
+
+        self.assertEqual(self._read('performance.log').count('"operation":"bulk"'), 500)
+
+    def test_full_queue_drops_records(self):
+        """Test that a full queue drops low severity records instead of blocking"""
+        self.service.listener.stop()
+        original_size = self.service.log_queue.maxsize
+        self.service.log_queue.maxsize = 5
+        try:
+            for i in range(10):
+                self.service.log_performance('burst', i)
+            self.assertEqual(self.service.get_stats()['dropped'], 5)
+        finally:
+            self.service.log_queue.maxsize = original_size
+            self.service.listener.start()
+
+        self.service.flush()
+        self.assertEqual(self._read('performance.log').count('"operation":"burst"'), 5)
+        self.assertIn('Dropped 5 log records', self._read('application.log'))
+
+    def test_category_logs_are_json_lines(self):
+        """Test that category log lines parse as JSON with a common schema"""
+        self.service.log_performance('card_lookup', 12.5, {'cards': 3})
+        self.service.log_security_event('login', 'user-1', False)
+        logging.getLogger('audit').warning('plain message %s', 42)
+        self.service.flush()
+
+        performance = json.loads(self._read('performance.log').splitlines()[0])
+        security = json.loads(self._read('security.log').splitlines()[0])
+        plain = json.loads(self._read('audit.log').splitlines()[0])
+
+        self.assertEqual(performance['event'], 'performance')
+        self.assertEqual(performance['category'], 'performance')
+        self.assertEqual(performance['details'], {'cards': 3})
+        self.assertEqual(security['level'], 'WARNING')
+        self.assertFalse(security['success'])
+        self.assertEqual(plain['message'], 'plain message 42')
+        for record in (performance, security, plain):
+            self.assertTrue({'timestamp', 'level', 'category', 'event'} <= set(record))
+
+    def test_payload_is_serialized_lazily(self):
+        """Test that records below the logger level are never serialized"""
+        message = StructuredMessage('performance', 'Performance', {'operation': 'x'})
+        logger = self.service.performance_logger
+        logger.setLevel(logging.WARNING)
+        try:
+            logger.info(message)
+            self.service.log_performance('skipped', 1.0)
+        finally:
+            logger.setLevel(logging.NOTSET)
+        self.service.flush()
+
+        self.assertIsNone(message._json)
+        self.assertEqual(self._read('performance.log'), '')
+
+    def _record(self, name, message):
+        return logging.LogRecord(name, logging.INFO, __file__, 0, message, None, None)
+
+    def test_size_rotation_compresses_and_prunes(self):
+        """Test that full segments are gzipped and only the newest archives are kept"""
+        path = os.path.join(self.log_dir, 'rotating.log')
+        archiver = LogArchiver()
+        handler = RotatingBufferedFileHandler(path, retention=2, max_bytes=200, interval_hours=0, archiver=archiver)
+        try:
+            for line in range(20):
+                handler.emit(self._record('audit', f'line {line:02d} ' + 'x' * 40))
+            handler.flush()
+            archiver.join()
+        finally:
+            handler.close()
+
+        archives = sorted(glob.glob(path + '.*.gz'))
+        self.assertEqual(len(archives), 2)
+        with gzip.open(archives[-1], 'rt') as archive:
+            self.assertIn('line 15', archive.read())
+        with open(path) as current:
+            self.assertIn('line 19', current.read())
+        self.assertEqual(glob.glob(path + '.*[0-9]'), [])
+
+    def test_time_rotation(self):
+        """Test that a segment rolls over at the interval boundary"""
+        path = os.path.join(self.log_dir, 'daily.log')
+        archiver = LogArchiver()
+        handler = RotatingBufferedFileHandler(path, retention=5, max_bytes=0, interval_hours=24, archiver=archiver)
+        try:
+            handler.emit(self._record('app', 'before midnight'))
+            handler._rollover_at = time.time() - 1
+            handler.emit(self._record('app', 'after midnight'))
+            handler.flush()
+            archiver.join()
+        finally:
+            handler.close()
+
+        self.assertEqual(len(glob.glob(path + '.*.gz')), 1)
+        with open(path) as current:
+            self.assertEqual(current.read().strip(), 'after midnight')
+
+    def test_console_filter(self):
+        """Test the per-logger console echo switch"""
+        selected = ConsoleFilter('error,security')
+
+        self.assertTrue(selected.filter(self._record('security', 'x')))
+        self.assertFalse(selected.filter(self._record('performance', 'x')))
+        self.assertTrue(ConsoleFilter('*').filter(self._record('performance', 'x')))
+        self.assertFalse(ConsoleFilter('none').filter(self._record('error', 'x')))
+
+    def test_request_thread_only_enqueues(self):
+        """Test that records wait in the queue until the listener writes them"""
+        iterations = 200
+        logger = logging.getLogger('queued_writer')
+        logger.propagate = False
+        logger.addHandler(self.service.queue_handler)
+
+        # Pause the listener so only the request-thread side runs
+        self.service.listener.stop()
+        try:
+            for i in range(iterations):
+                logger.info('Performance: %s', i)
+            self.assertNotIn('queued_writer', self._read('application.log'))
+        finally:
+            logger.removeHandler(self.service.queue_handler)
+            self.service.listener.start()
+        self.service.flush()
+
+        self.assertEqual(self.service.get_stats()['dropped'], 0)
+        self.assertEqual(self._read('application.log').count('queued_writer'), iterations)
+
+    def test_structured_message_matches_eager_format(self):
+        """Test that a structured message renders the same text as an eager json.dumps message"""
+        data = {'endpoint': 'cards.get_cards', 'method': 'GET', 'user_id': 'user-1', 'status_code': 200,
+                'duration_ms': 12.5, 'details': {'page': 1, 'per_page': 20}}
+        message = StructuredMessage('api_request', 'API Request', data)
+
+        self.assertTrue(str(message).startswith('API Request: '))
+        self.assertEqual(json.loads(str(message).split(': ', 1)[1]), data)
+
+class TestRequestLogSampler(unittest.TestCase):
+    """Test request log sampling decisions (no database required)"""
+
+    def setUp(self):
+        """Set up a sampler with per blueprint and per endpoint rates"""
+        self.metrics = RequestMetrics()
+        self.sampler = RequestLogSampler(default_rate=0.1, rates={'cards': 0.05, 'users.login': 1.0},
+                                         slow_ms=500, metrics=self.metrics)
+
+    def test_rate_lookup(self):
+        """Test that endpoint rates win over blueprint rates, which win over the default"""
+        self.assertEqual(self.sampler.rate_for('users.login'), 1.0)
+        self.assertEqual(self.sampler.rate_for('cards.get_cards'), 0.05)
+        self.assertEqual(self.sampler.rate_for('users.signup'), 0.1)
+        self.assertEqual(self.sampler.rate_for(None), 0.1)
+        self.assertEqual(RequestLogSampler._parse_rates('cards=0.05, users.login=1,bad'),
+                         {'cards': 0.05, 'users.login': 1.0})
+
+    def test_errors_and_slow_requests_are_always_logged(self):
+        """Test that unsampled requests are still logged when they fail or are slow"""
+        self.assertEqual(self.sampler.reason(False, 503, 10), 'error')
+        self.assertEqual(self.sampler.reason(False, 200, 750), 'slow')
+        self.assertEqual(self.sampler.reason(True, 200, 10), 'sampled')
+        self.assertIsNone(self.sampler.reason(False, 404, 10))
+
+    def test_tail_latency_capture(self):
+        """Test that requests above their route's p99 are logged once the route has history"""
+        for _ in range(RequestLogSampler.TAIL_MIN_REQUESTS):
+            self.metrics.start('/cards')
+            self.metrics.finish('/cards', 'GET', 200, 0.010)
+        self.assertEqual(self.sampler.reason(False, 200, 50, '/cards'), 'tail')
+        self.assertIsNone(self.sampler.reason(False, 200, 5, '/cards'))
+        self.assertIsNone(self.sampler.reason(False, 200, 50, '/bills'))
+
+    def test_app_hooks_log_one_record_for_logged_requests(self):
+        """Test that unsampled requests are skipped and logged ones write one record"""
+        app = Flask(__name__)
+        init_request_logging(app)
+
+        @app.route('/quiet')
+        def quiet():
+            return jsonify({'ok': True}), 200
+
+        @app.route('/broken')
+        def broken():
+            return jsonify({'error': 'failed'}), 502
+
+        @app.route('/always')
+        def always():
+            return jsonify({'ok': True})
+
+        client = app.test_client()
+        with mock.patch.object(logging_service, 'log_request') as log_request, \
+                mock.patch.dict('services.logging_service.request_log_sampler.rates',
+                                {'quiet': 0.0, 'broken': 0.0, 'always': 1.0}):
+            client.get('/quiet')
+            self.assertEqual(log_request.call_count, 0)
+
+            client.get('/broken')
+            self.assertEqual(log_request.call_args.kwargs['status_code'], 502)
+            self.assertEqual(log_request.call_args.kwargs['details']['sample_reason'], 'error')
+
+            client.get('/always')
+            self.assertEqual(log_request.call_count, 2)
+            self.assertEqual(log_request.call_args.kwargs['details']['sample_reason'], 'sampled')
+
+    def test_blueprint_rates_apply_to_blueprint_routes(self):
+        """Test that a blueprint route of the app is sampled with its blueprint's rate"""
+        app = Flask(__name__)
+        init_request_logging(app)
+        from routes.cards import cards_bp
+        app.register_blueprint(cards_bp, url_prefix='/api/cards')
+
+        client = app.test_client()
+        with mock.patch.object(logging_service, 'log_request') as log_request:
+            with mock.patch.dict('services.logging_service.request_log_sampler.rates', {'cards': 0.0}):
+                client.get('/api/cards/')
+                self.assertEqual(log_request.call_count, 0)
+
+            with mock.patch.dict('services.logging_service.request_log_sampler.rates', {'cards': 1.0}):
+                client.get('/api/cards/')
+                self.assertEqual(log_request.call_count, 1)
+                self.assertEqual(log_request.call_args.kwargs['endpoint'], 'cards.get_cards')
+                self.assertEqual(log_request.call_args.kwargs['details']['sample_rate'], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import unittest
+from unittest import mock
+from flask import Flask, jsonify
+from services import metrics
+from services.metrics import RequestMetrics, bucket_index, bucket_value
+
+class TestMetrics(unittest.TestCase):
+    """Test request latency metrics and the Prometheus output (no database required)"""
+
+    def setUp(self):
+        """Set up a minimal app instrumented with its own metrics"""
+        self.app = Flask(__name__)
+        self.metrics = metrics.init_app(self.app, RequestMetrics())
+
+        @self.app.route('/cards/<card_id>')
+        def get_card(card_id):
+            return jsonify({'id': card_id}), 200
+
+        @self.app.route('/fail')
+        def fail():
+            raise RuntimeError('boom')
+
+        self.client = self.app.test_client()
+
+    def test_bucket_precision(self):
+        """Test that bucketed latencies stay within 1% of the recorded value"""
+        for value in (0, 1, 127, 128, 999, 12_345, 1_000_000, 987_654_321):
+            self.assertLessEqual(abs(bucket_value(bucket_index(value)) - value), max(value * 0.01, 0.5))
+
+    def test_requests_are_recorded_per_route_template(self):
+        """Test that requests are grouped by route template, not URL"""
+        for card_id in ('a', 'b', 'c'):
+            self.client.get(f'/cards/{card_id}')
+        self.client.get('/missing')
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['/cards/<card_id>'].count, 3)
+        self.assertEqual(snapshot['/cards/<card_id>'].statuses, {('GET', 200): 3})
+        self.assertEqual(snapshot['unmatched'].statuses, {('GET', 404): 1})
+        self.assertEqual(snapshot['/cards/<card_id>'].in_flight, 0)
+
+    def test_errors_are_counted(self):
+        """Test that unhandled exceptions count as errors"""
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        self.client.get('/fail')
+
+        stats = self.metrics.snapshot()['/fail']
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.statuses, {('GET', 500): 1})
+
+    def test_quantiles(self):
+        """Test quantiles over a known latency distribution"""
+        for millis in range(1, 101):
+            self.metrics.start('/x')
+            self.metrics.finish('/x', 'GET', 200, millis / 1000)
+
+        stats = self.metrics.snapshot()['/x']
+        self.assertAlmostEqual(stats.quantile(0.5), 0.050, delta=0.001)
+        self.assertAlmostEqual(stats.quantile(0.99), 0.099, delta=0.001)
+
+    def test_buffers_of_exited_threads_are_kept(self):
+        """Test that counts survive the recording thread exiting"""
+        def worker():
+            self.metrics.start('/x')
+            self.metrics.finish('/x', 'POST', 201, 0.002)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.metrics.snapshot()['/x'].count, 4)
+        self.assertEqual(self.metrics.snapshot()['/x'].count, 4)
+
+    def test_prometheus_output(self):
+        """Test the Prometheus text exposition"""
+        self.client.get('/cards/a')
+        output = self.metrics.render_prometheus()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', output)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="/cards/<card_id>",le="+Inf"} 1', output)
+        self.assertIn('http_requests_total{endpoint="/cards/<card_id>",method="GET",status="200"} 1', output)
+        self.assertIn('http_requests_in_flight{endpoint="/cards/<card_id>"} 0', output)
+        self.assertIn('quantile="0.99"', output)
+
+    def test_recording_takes_no_lock(self):
+        """Test that once a thread has its buffer, recording never takes the registry lock"""
+        iterations = 2000
+        self.metrics.start('/x')
+        self.metrics.finish('/x', 'GET', 200, 0.001)
+
+        with mock.patch.object(self.metrics, '_registry_lock') as registry_lock:
+            for i in range(iterations):
+                self.metrics.start('/x')
+                self.metrics.finish('/x', 'GET', 200, (i % 500) / 1000)
+        registry_lock.__enter__.assert_not_called()
+
+        stats = self.metrics.snapshot()['/x']
+        self.assertEqual(stats.count, iterations + 1)
+        self.assertLessEqual(len(stats.buckets), 500)
+
+if __name__ == '__main__':
+    unittest.main()
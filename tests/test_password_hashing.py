@@ -0,0 +1,68 @@
+import unittest
+import threading
+from services.password_hashing import (
+    PasswordHasher, HashingQueueFull, ClientHashingLimitExceeded
+)
+
+class TestPasswordHashing(unittest.TestCase):
+    """Test the bounded password hashing executor (no database required)"""
+
+    def setUp(self):
+        """Set up a hasher with a cheap work factor"""
+        self.hasher = PasswordHasher(max_workers=1, max_queue=2, per_client_limit=2, method='pbkdf2:sha256:1000')
+
+    def test_hash_and_check_password(self):
+        """Test that hashes made on the executor verify"""
+        password_hash = self.hasher.hash_password('secret123')
+
+        self.assertTrue(self.hasher.check_password(password_hash, 'secret123'))
+        self.assertFalse(self.hasher.check_password(password_hash, 'wrong'))
+        self.assertEqual(self.hasher.get_metrics()['completed'], 3)
+
+    def test_needs_rehash(self):
+        """Test that hashes with another work factor are flagged for upgrade"""
+        current = self.hasher.hash_password('secret123')
+        outdated = PasswordHasher(max_workers=1, method='pbkdf2:sha256:500').hash_password('secret123')
+
+        self.assertFalse(self.hasher.needs_rehash(current))
+        self.assertTrue(self.hasher.needs_rehash(outdated))
+
+    def _block_executor(self, client_id, count):
+        """Occupy executor slots until the returned event is set"""
+        release = threading.Event()
+        futures = [self.hasher.submit(release.wait, client_id=client_id) for _ in range(count)]
+        return release, futures
+
+    def test_per_client_limit(self):
+        """Test that one client cannot hold more than its share of slots"""
+        release, futures = self._block_executor('10.0.0.1', 2)
+        try:
+            with self.assertRaises(ClientHashingLimitExceeded):
+                self.hasher.hash_password('secret123', client_id='10.0.0.1')
+            self.assertIsNone(self.hasher.submit(len, '', client_id='10.0.0.1'))
+            self.assertEqual(self.hasher.get_metrics()['rejected_client_limit'], 2)
+        finally:
+            release.set()
+            for future in futures:
+                future.result()
+
+    def test_queue_full(self):
+        """Test that work is rejected once workers and queue are saturated"""
+        first, first_futures = self._block_executor('10.0.0.1', 2)
+        second, second_futures = self._block_executor('10.0.0.2', 1)
+        try:
+            with self.assertRaises(HashingQueueFull) as context:
+                self.hasher.hash_password('secret123', client_id='10.0.0.3')
+            self.assertEqual(context.exception.retry_after, 1)
+            self.assertEqual(self.hasher.get_metrics()['rejected_queue_full'], 1)
+        finally:
+            first.set()
+            second.set()
+            for future in first_futures + second_futures:
+                future.result()
+
+        self.assertTrue(self.hasher.check_password(self.hasher.hash_password('secret123'), 'secret123'))
+        self.assertEqual(self.hasher.get_metrics()['clients_pending'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
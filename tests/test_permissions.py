@@ -0,0 +1,71 @@
+import os
+import unittest
+from flask import Flask, jsonify
+from services import auth
+from models.user import User
+from services.permissions import (
+    PERMISSIONS, ROLE_MASKS, permission_bit, role_mask, claims_mask, permissions_from_mask
+)
+
+class TestPermissions(unittest.TestCase):
+    """Test the compiled permission registry (no database required)"""
+
+    def setUp(self):
+        """Set up a minimal app with a permission guarded route"""
+        os.environ.setdefault('JWT_SECRET_KEY', 'test-jwt-secret')
+        self.app = Flask(__name__)
+
+        @self.app.route('/analytics')
+        @auth.token_required
+        @auth.require_permission('view_analytics')
+        def analytics():
+            return jsonify({'ok': True}), 200
+
+        self.client = self.app.test_client()
+
+    def _headers(self, role):
+        """Build an Authorization header for a token with the given role"""
+        token = auth.generate_token({'user_id': f'{role}-1', 'username': role, 'role': role, 'perms': role_mask(role)})
+        return {'Authorization': f'Bearer {token}'}
+
+    def test_permission_bits_are_unique(self):
+        """Test that every permission gets its own bit"""
+        bits = [permission_bit(name) for name in PERMISSIONS]
+        self.assertEqual(len(set(bits)), len(PERMISSIONS))
+
+    def test_role_inheritance(self):
+        """Test that admin includes manager, and manager includes user"""
+        self.assertEqual(ROLE_MASKS['manager'] & ROLE_MASKS['user'], ROLE_MASKS['user'])
+        self.assertEqual(ROLE_MASKS['admin'] & ROLE_MASKS['manager'], ROLE_MASKS['manager'])
+        self.assertIn('view_own_cards', auth.get_user_permissions('admin'))
+        self.assertNotIn('view_all_cards', auth.get_user_permissions('user'))
+        self.assertEqual(auth.get_user_permissions('unknown'), [])
+
+    def test_mask_round_trip(self):
+        """Test that a mask expands back to the role's permissions"""
+        self.assertEqual(permissions_from_mask(role_mask('manager')), auth.get_user_permissions('manager'))
+
+    def test_claims_without_mask_fall_back_to_role(self):
+        """Test that tokens issued before masks existed still authorize"""
+        self.assertEqual(claims_mask({'role': 'manager'}), ROLE_MASKS['manager'])
+        self.assertEqual(claims_mask({}), ROLE_MASKS['user'])
+        self.assertEqual(claims_mask({'role': 'admin', 'perms': 0}), 0)
+
+    def test_unknown_permission_fails_at_decoration(self):
+        """Test that a misspelled permission is rejected when the route is defined"""
+        with self.assertRaises(ValueError):
+            auth.require_permission('view_analytic')
+
+    def test_has_permission_is_false_for_unknown_names(self):
+        """Test that a runtime check of an unknown permission denies instead of raising"""
+        user = User(role='admin')
+        self.assertTrue(user.has_permission('view_analytics'))
+        self.assertFalse(user.has_permission('view_analytic'))
+
+    def test_require_permission(self):
+        """Test that require_permission checks the mask in the token"""
+        self.assertEqual(self.client.get('/analytics', headers=self._headers('admin')).status_code, 200)
+        self.assertEqual(self.client.get('/analytics', headers=self._headers('manager')).status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from flask import Flask, jsonify
+from services.rate_limiter import InMemoryRateLimitBackend, RateLimiter, username_key
+
+class TestRateLimiter(unittest.TestCase):
+    """Test the sliding window rate limiter (no database required)"""
+
+    def setUp(self):
+        """Set up a limiter with a fresh local backend"""
+        self.backend = InMemoryRateLimitBackend()
+        self.limiter = RateLimiter(self.backend)
+
+    def test_allows_up_to_limit(self):
+        """Test that requests beyond the limit in one window are rejected"""
+        results = [self.backend.hit('client', 3, 60, now=1200.0 + i) for i in range(4)]
+
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertEqual(results[0].remaining, 2)
+        self.assertGreaterEqual(results[3].retry_after, 1)
+
+    def test_previous_window_is_weighted(self):
+        """Test that the sliding window carries over part of the previous window"""
+        for i in range(4):
+            self.backend.hit('client', 4, 60, now=1200.0 + i)
+
+        # A quarter into the next window, 3 of the previous 4 requests still count
+        self.assertTrue(self.backend.hit('client', 4, 60, now=1275.0).allowed)
+        self.assertFalse(self.backend.hit('client', 4, 60, now=1275.0).allowed)
+        # Two windows later the old counts no longer apply
+        self.assertTrue(self.backend.hit('client', 4, 60, now=1400.0).allowed)
+
+    def test_keys_are_independent(self):
+        """Test that one client's usage does not limit another"""
+        self.backend.hit('a', 1, 60, now=1200.0)
+
+        self.assertFalse(self.backend.hit('a', 1, 60, now=1201.0).allowed)
+        self.assertTrue(self.backend.hit('b', 1, 60, now=1201.0).allowed)
+
+    def test_idle_keys_are_purged(self):
+        """Test that the local backend stays bounded"""
+        backend = InMemoryRateLimitBackend(max_keys=2)
+        backend.hit('a', 5, 60, now=1200.0)
+        backend.hit('b', 5, 60, now=1200.0)
+        backend.hit('c', 5, 60, now=1400.0)
+
+        self.assertEqual(set(backend._windows), {'c'})
+
+    def test_active_keys_are_capped(self):
+        """Test that keys still inside their window are evicted, oldest first, past max_keys"""
+        backend = InMemoryRateLimitBackend(max_keys=10)
+        # All within the sliding window, so none of them is idle
+        for position in range(25):
+            backend.hit(f'client-{position}', 5, 60, now=1200.0 + position * 4)
+
+        self.assertLessEqual(len(backend._windows), 10)
+        self.assertIn('client-24', backend._windows)
+        self.assertNotIn('client-0', backend._windows)
+
+    def test_decorator_rejects_before_handler(self):
+        """Test that the decorator returns 429 without running the view"""
+        app = Flask(__name__)
+        calls = []
+
+        @app.route('/login', methods=['POST'])
+        @self.limiter.limit('test_login', 2, per=60, key_func=username_key)
+        def login():
+            calls.append(1)
+            return jsonify({'ok': True}), 200
+
+        client = app.test_client()
+        statuses = [client.post('/login', json={'username': 'Alice'}).status_code for _ in range(3)]
+        other = client.post('/login', json={'username': 'bob'})
+        response = client.post('/login', json={'username': 'alice'})
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(len(calls), 3)
+
+    def test_decorator_can_be_disabled(self):
+        """Test that RATE_LIMIT_ENABLED turns the limits off"""
+        app = Flask(__name__)
+        app.config['RATE_LIMIT_ENABLED'] = False
+
+        @app.route('/signup', methods=['POST'])
+        @self.limiter.limit('test_signup', 1, per=60)
+        def signup():
+            return jsonify({'ok': True}), 201
+
+        client = app.test_client()
+        self.assertEqual([client.post('/signup').status_code for _ in range(3)], [201, 201, 201])
+
+if __name__ == '__main__':
+    unittest.main()
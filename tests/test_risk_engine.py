@@ -0,0 +1,105 @@
+import unittest
+from services.risk_engine import RiskEngine, RiskRule, TransactionEvent, SlidingWindow
+
+class TestRiskEngine(unittest.TestCase):
+    """Test the streaming fraud risk engine (no database required)"""
+
+    def setUp(self):
+        """Set up an engine with the default rules"""
+        self.engine = RiskEngine()
+        self.now = 1_700_000_000.0
+
+    def _event(self, offset=0, amount=100.0, card_id='card-1', **kwargs):
+        kwargs.setdefault('merchant_category', 'shopping')
+        kwargs.setdefault('location', 'Bengaluru')
+        kwargs.setdefault('credit_limit', 100000.0)
+        return TransactionEvent(card_id, amount, timestamp=self.now + offset, **kwargs)
+
+    def test_sliding_window_evicts_old_entries(self):
+        """Test that window totals only cover the last window"""
+        window = SlidingWindow(60)
+        window.add(0, 10)
+        window.add(30, 20)
+        window.evict(70)
+        self.assertEqual((window.count, window.total), (1, 20))
+
+    def test_high_value_transaction(self):
+        """Test that a transaction above 80% of the credit limit is suspicious"""
+        assessment = self.engine.assess(self._event(amount=9000, credit_limit=10000))
+        self.assertTrue(assessment.suspicious)
+        self.assertIn('high_value', assessment.reasons)
+
+    def test_velocity(self):
+        """Test that the seventh transaction within ten minutes is suspicious"""
+        results = [self.engine.assess(self._event(offset=position * 10)).suspicious for position in range(7)]
+        self.assertEqual(results, [False] * 6 + [True])
+
+        # Once the window has passed the card is trusted again
+        self.assertFalse(self.engine.assess(self._event(offset=1300)).suspicious)
+
+    def test_spend_window_and_novelty_combine(self):
+        """Test that weaker signals only block together"""
+        for position in range(5):
+            self.engine.assess(self._event(offset=position * 300, amount=1000))
+
+        novel = self.engine.assess(self._event(offset=1600, merchant_category='jewellery', location='Lagos'))
+        self.assertEqual(sorted(novel.reasons), ['new_merchant_category', 'unusual_location'])
+        self.assertFalse(novel.suspicious)
+
+        combined = self.engine.assess(self._event(offset=1700, amount=5000, location='Oslo'))
+        self.assertEqual(sorted(combined.reasons), ['high_value_transactions', 'unusual_location'])
+        self.assertTrue(combined.suspicious)
+
+    def test_unexpected_international(self):
+        """Test that international use of a domestic card is suspicious"""
+        assessment = self.engine.assess(self._event(is_international=True, card_international=False))
+        self.assertEqual(assessment.reasons, ['unexpected_international'])
+        self.assertTrue(assessment.suspicious)
+
+    def test_cards_are_independent(self):
+        """Test that one card's history does not affect another"""
+        for position in range(6):
+            self.engine.assess(self._event(offset=position))
+        self.assertFalse(self.engine.assess(self._event(offset=7, card_id='card-2')).suspicious)
+
+    def test_idle_cards_are_evicted(self):
+        """Test that idle cards are dropped and the least recently seen go first over the cap"""
+        engine = RiskEngine(state_ttl=3600, max_cards=2)
+        engine.record(self._event(offset=-7200, card_id='idle'))
+        for position, card_id in enumerate(('old', 'recent', 'newest')):
+            engine.record(self._event(offset=position, card_id=card_id))
+
+        self.assertEqual(engine.evict_idle(now=self.now + 10), 2)
+        self.assertEqual(sorted(engine._states), ['newest', 'recent'])
+        self.assertEqual(engine.get_stats()['evicted'], 2)
+
+    def test_pluggable_rule(self):
+        """Test that added rules take part in scoring"""
+        class NightRule(RiskRule):
+            name = 'night'
+            score = 1.0
+
+            def evaluate(self, state, event):
+                return event.merchant_category == 'casino'
+
+        self.engine.add_rule(NightRule())
+        self.assertEqual(self.engine.assess(self._event(merchant_category='casino')).reasons, ['night'])
+
+    def test_card_state_stays_bounded(self):
+        """Test that a long stream keeps only in-window entries and matching running totals per card"""
+        events = [self._event(offset=position * 6, card_id=f'card-{position % 10}',
+                              location=f'city-{position % 7}') for position in range(10000)]
+        for event in events:
+            self.engine.assess(event)
+
+        self.assertEqual(self.engine.get_stats()['events'], len(events))
+        self.assertEqual(self.engine.get_stats()['cards'], 10)
+        state = self.engine._states['card-0']
+        # One event per card every 60 seconds
+        self.assertLessEqual(state.velocity.count, 600 // 60)
+        self.assertLessEqual(state.spend.count, 3600 // 60)
+        self.assertAlmostEqual(state.spend.total, sum(value for _, value in state.spend.entries))
+        self.assertLessEqual(len(state.locations.items), 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 import json
 import uuid
+from unittest import mock
+from datetime import datetime
 from app import create_app
 from models.user import User
 from models.card import Card
@@ -11,6 +13,7 @@ from models.notification import Notification
 from services.card_service import CardService
 from services.notification_service import NotificationService
 from services.encryption import encryption_service
+from services.risk_engine import risk_engine
 from services.auth import generate_token
 
 class TestServices(unittest.TestCase):
@@ -66,7 +69,7 @@ class TestServices(unittest.TestCase):
     def test_card_service_create_card(self):
         """Test CardService.create_card"""
         card_data = {
-            'card_number': '4111111111111111',
+            'card_number': '5555555555554444',
             'card_holder_name': 'Test User',
             'expiry_month': 12,
             'expiry_year': 2025,
@@ -83,6 +86,25 @@ class TestServices(unittest.TestCase):
         self.assertIn('card', result)
         self.assertEqual(result['card']['card_name'], 'Service Test Card')
     
+    def test_card_service_create_duplicate_card(self):
+        """Test CardService.create_card rejects an already registered card number"""
+        card_data = {
+            'card_number': '4111111111111111',  # Same number as the setUp card
+            'card_holder_name': 'Test User',
+            'expiry_month': 12,
+            'expiry_year': datetime.utcnow().year + 3,
+            'cvv': '123',
+            'card_type': 'visa',
+            'card_brand': 'Visa Classic',
+            'card_name': 'Duplicate Card',
+            'credit_limit': 5000
+        }
+        
+        result = CardService.create_card(self.test_user.id, card_data)
+        
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], 'Card is already registered')
+    
     def test_card_service_create_invalid_card(self):
         """Test CardService.create_card with invalid data"""
         invalid_card_data = {
@@ -288,6 +310,25 @@ class TestServices(unittest.TestCase):
         # The transaction should be blocked due to suspicious activity
         self.assertFalse(result['success'])
         self.assertIn('Suspicious activity detected', result['error'])
+    
+    def test_card_service_declined_transaction_not_recorded_for_risk(self):
+        """Test that only debits that went through count towards the card's risk windows"""
+        transaction_data = {
+            'merchant_name': 'Test Store',
+            'merchant_category': 'shopping',
+            'amount': 100.00
+        }
+        risk_engine.forget(self.test_card.id)
+        
+        with mock.patch('services.card_service.credit_ledger.authorize',
+                        return_value={'success': False, 'error': 'Insufficient credit limit'}):
+            result = CardService.process_transaction(self.test_card.id, transaction_data)
+        self.assertFalse(result['success'])
+        self.assertNotIn(str(self.test_card.id), risk_engine._states)
+        
+        result = CardService.process_transaction(self.test_card.id, transaction_data)
+        self.assertTrue(result['success'])
+        self.assertEqual(risk_engine._states[str(self.test_card.id)].history, 1)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from flask import Flask, jsonify
+from services import stack_sampler
+from services.stack_sampler import StackSampler
+
+def slow_lookup(seconds):
+    """Stand-in for a slow query"""
+    time.sleep(seconds)
+
+class TestStackSampler(unittest.TestCase):
+    """Test the slow request stack sampler (no database required)"""
+
+    def setUp(self):
+        """Set up a minimal app sampled with a 50ms budget"""
+        self.directory = tempfile.mkdtemp()
+        self.sampler = StackSampler(budget_ms=50, arm_ratio=0.5, interval_ms=2, max_overhead=0.05,
+                                    directory=self.directory, max_files=3)
+        self.app = Flask(__name__)
+        stack_sampler.init_app(self.app, self.sampler)
+
+        @self.app.route('/cards/<card_id>')
+        def get_card(card_id):
+            slow_lookup(0.15 if card_id == 'slow' else 0)
+            return jsonify({'id': card_id}), 200
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Stop the sampler and remove its profiles"""
+        self.sampler.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _profiles(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+
+    def test_slow_request_profile_is_saved(self):
+        """Test that a request over budget leaves a collapsed stack profile and its metadata"""
+        self.assertEqual(self.client.get('/cards/slow').status_code, 200)
+
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 1)
+        with open(os.path.join(self.directory, profiles[0])) as profile_file:
+            lines = profile_file.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(stack.endswith('test_stack_sampler:get_card;test_stack_sampler:slow_lookup'))
+
+        with open(os.path.join(self.directory, profiles[0][:-len('.folded')] + '.json')) as metadata_file:
+            metadata = json.load(metadata_file)
+        self.assertEqual(metadata['endpoint'], '/cards/<card_id>')
+        self.assertEqual(metadata['status_code'], 200)
+        self.assertGreaterEqual(metadata['duration_ms'], 150)
+
+    def test_fast_requests_are_not_sampled(self):
+        """Test that requests under the arm point are never sampled or saved"""
+        for _ in range(20):
+            self.client.get('/cards/fast')
+        self.assertEqual(self._profiles(), [])
+        self.assertEqual(self.sampler.get_stats()['active_requests'], 0)
+
+    def test_profiles_are_pruned(self):
+        """Test that only the newest max_files profiles are kept"""
+        for _ in range(5):
+            self.client.get('/cards/slow')
+        self.assertEqual(len(self._profiles()), 3)
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith('.json')]), 3)
+
+    def test_sampling_overhead_is_bounded(self):
+        """Test that the sampling interval backs off when a sampling pass is expensive"""
+        sample = self.sampler._sample
+
+        def slow_sample(armed):
+            time.sleep(0.01)
+            sample(armed)
+
+        with mock.patch.object(self.sampler, '_sample', side_effect=slow_sample):
+            self.client.get('/cards/slow')
+
+        stats = self.sampler.get_stats()
+        self.assertGreater(stats['sample_passes'], 0)
+        # A 10ms pass within a 5% budget means waiting at least 200ms before the next one
+        self.assertGreaterEqual(stats['interval_ms'], 200)
+        self.assertLessEqual(stats['sample_passes'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import time
+import unittest
+from unittest import mock
+import jwt
+from services import auth
+from services.token_cache import VerifiedTokenCache, InMemoryRevocationList, token_digest
+
+class TestTokenCache(unittest.TestCase):
+    """Test verified JWT caching and revocation (no database required)"""
+
+    def setUp(self):
+        """Use a known secret and fresh cache and revocation list"""
+        os.environ.setdefault('JWT_SECRET_KEY', 'test-jwt-secret')
+        auth.set_revocation_list(InMemoryRevocationList())
+        self.token = auth.generate_token({'user_id': 'user-1', 'username': 'tester'})
+
+    def test_verified_claims_are_cached(self):
+        """Test that the second verification is served from the cache"""
+        stats_before = auth.verified_token_cache.get_stats()
+        first = auth.verify_token(self.token)
+        second = auth.verify_token(self.token)
+        stats_after = auth.verified_token_cache.get_stats()
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(stats_after['hits'] - stats_before['hits'], 1)
+
+    def test_cache_entry_expires_with_token(self):
+        """Test that claims are not reused past the token's exp"""
+        cache = VerifiedTokenCache(max_size=10, max_ttl=300)
+        cache.put('expired', {'user_id': 'user-1', 'exp': time.time() - 1})
+        cache.put('valid', {'user_id': 'user-1', 'exp': time.time() + 60})
+
+        self.assertIsNone(cache.get('expired'))
+        self.assertEqual(cache.get('valid')['user_id'], 'user-1')
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used token is evicted"""
+        cache = VerifiedTokenCache(max_size=2, max_ttl=300)
+        cache.put('a', {'n': 1})
+        cache.put('b', {'n': 2})
+        cache.get('a')
+        cache.put('c', {'n': 3})
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.get_stats()['size'], 2)
+
+    def test_tampered_token_is_rejected(self):
+        """Test that a token differing from a cached one is still verified"""
+        auth.verify_token(self.token)
+        with self.assertRaises(jwt.InvalidTokenError):
+            auth.verify_token(self.token[:-2] + ('AA' if not self.token.endswith('AA') else 'BB'))
+
+    def test_revoked_token_is_rejected_after_caching(self):
+        """Test that revocation applies to tokens already in the cache"""
+        auth.verify_token(self.token)
+        auth.revoke_token(self.token)
+
+        with self.assertRaises(auth.TokenRevokedError):
+            auth.verify_token(self.token)
+
+    def test_revoke_user_tokens(self):
+        """Test that per-user revocation rejects tokens issued before it"""
+        auth.verify_token(self.token)
+        auth.get_revocation_list().revoke_user('user-1', issued_before=time.time() + 1)
+
+        with self.assertRaises(auth.TokenRevokedError):
+            auth.verify_token(self.token)
+        other = auth.generate_token({'user_id': 'user-2', 'username': 'other'})
+        self.assertEqual(auth.verify_token(other)['user_id'], 'user-2')
+
+    def test_cached_token_skips_signature_check(self):
+        """Test that repeated verifications of one token decode it only once"""
+        digest = token_digest(self.token)
+        auth.verified_token_cache.discard(digest)
+        with mock.patch.object(auth, 'decode_token', wraps=auth.decode_token) as decode_token:
+            for _ in range(20):
+                auth.verify_token(self.token)
+        self.assertEqual(decode_token.call_count, 1)
+        self.assertIsNotNone(auth.verified_token_cache.get(digest))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from flask import Flask, jsonify
+from services import tracing
+from services.tracing import parse_traceparent, span, traced, outgoing_headers, trace_command_listener
+
+class Ledger:
+    """Stand-in service with traced methods"""
+
+    @staticmethod
+    @traced
+    def post(amount):
+        with span('Ledger.save', amount=amount):
+            return {'success': True}
+
+    @staticmethod
+    @traced
+    def reject():
+        return {'success': False, 'error': 'Card is blocked'}
+
+class TestTracing(unittest.TestCase):
+    """Test request tracing and traceparent propagation (no database required)"""
+
+    def setUp(self):
+        """Set up a minimal traced app"""
+        self.app = Flask(__name__)
+        tracing.init_app(self.app)
+
+        @self.app.route('/transactions', methods=['POST'])
+        def create_transaction():
+            Ledger.post(25)
+            trace_command_listener.started(SimpleNamespace(
+                request_id=1, command_name='find', command={'find': 'cards'}))
+            trace_command_listener.succeeded(SimpleNamespace(
+                request_id=1, command_name='find', duration_micros=1500))
+            Ledger.reject()
+            return jsonify({'outbound': outgoing_headers()['traceparent']}), 201
+
+        self.client = self.app.test_client()
+
+    def _post(self, headers=None):
+        with mock.patch.object(tracing, 'export_trace') as export, \
+                mock.patch.object(tracing, 'TRACE_SAMPLE_RATE', 0):
+            response = self.client.post('/transactions', headers=headers or {})
+        return response, export
+
+    def test_parse_traceparent(self):
+        """Test that only well formed traceparent headers are accepted"""
+        trace_id, parent_id = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+        self.assertEqual(parse_traceparent(f'00-{trace_id}-{parent_id}-01'), (trace_id, parent_id, True))
+        self.assertEqual(parse_traceparent(f'00-{trace_id}-{parent_id}-00'), (trace_id, parent_id, False))
+        for value in (None, 'garbage', f'00-{"0" * 32}-{parent_id}-01', f'ff-{trace_id}-{parent_id}-01',
+                      f'00-{trace_id}-{parent_id}-01-extra', f'00-{trace_id[:-1]}x-{parent_id}-01'):
+            self.assertIsNone(parse_traceparent(value))
+
+    def test_spans_nest_under_the_request(self):
+        """Test that service, model and MongoDB spans form a tree rooted at the request"""
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        response, export = self._post({'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01'})
+
+        self.assertEqual(response.status_code, 201)
+        trace = export.call_args.args[0].to_dict()
+        spans = {item['name']: item for item in trace['spans']}
+        self.assertEqual(trace['trace_id'], trace_id)
+        self.assertEqual(trace['name'], 'POST /transactions')
+        root = spans['POST /transactions']
+        self.assertEqual(root['parent_id'], '00f067aa0ba902b7')
+        self.assertEqual(root['attributes']['status_code'], 201)
+        self.assertEqual(spans['Ledger.post']['parent_id'], root['span_id'])
+        self.assertEqual(spans['Ledger.save']['parent_id'], spans['Ledger.post']['span_id'])
+        self.assertEqual(spans['Ledger.save']['attributes'], {'amount': 25})
+        self.assertEqual(spans['mongo.find']['attributes'], {'collection': 'cards'})
+        self.assertAlmostEqual(spans['mongo.find']['duration_ms'], 1.5, places=3)
+        self.assertEqual(spans['Ledger.reject']['error'], 'Card is blocked')
+
+    def test_traceparent_is_propagated(self):
+        """Test that responses and outbound calls carry the request's trace id"""
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        response, _ = self._post({'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01'})
+
+        self.assertEqual(parse_traceparent(response.headers['traceparent'])[0], trace_id)
+        self.assertEqual(parse_traceparent(response.get_json()['outbound'])[0], trace_id)
+
+    def test_unsampled_fast_requests_are_not_exported(self):
+        """Test that only sampled, slow or failed requests are exported"""
+        _, export = self._post()
+        self.assertFalse(export.called)
+
+        _, export = self._post({'traceparent': '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00'})
+        self.assertFalse(export.called)
+
+        with mock.patch.object(tracing, 'TRACE_SLOW_MS', 0):
+            _, export = self._post()
+        self.assertTrue(export.called)
+
+    def test_outside_requests_is_a_no_op(self):
+        """Test that traced code runs normally without a request"""
+        self.assertEqual(Ledger.post(10), {'success': True})
+        self.assertEqual(outgoing_headers({'Accept': 'application/json'}), {'Accept': 'application/json'})
+
+if __name__ == '__main__':
+    unittest.main()
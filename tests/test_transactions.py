@@ -297,7 +297,7 @@ class TestTransactions(unittest.TestCase):
         # Create transaction for other user
         other_card = Card.create_card(
             user_id=other_user.id,
-            card_number='4111111111111111',
+            card_number='5555555555554444',
             card_holder_name='Other User',
             expiry_month=12,
             expiry_year=2025,